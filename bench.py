@@ -0,0 +1,315 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import numpy as np
+import torch
+import config
+from game import create_game, get_moves_bits
+from mcts import create_mcts_player
+from network import resnet, convnet
+from network.export import benchmark_latency
+from opening_book import plane_2_bits
+from replay_buffer import ReplayBuffer
+from training import TrainModel
+
+# Leaf counts of the 8 x 8 game from the initial position, by depth (PASS counts as a move)
+PERFT_REFERENCE = [1, 4, 12, 56, 244, 1396, 8200, 55092, 390216, 3005288]
+NET_MODULES = {'cnn': convnet, 'resnet': resnet}
+
+
+def create_net_func(net_type, model_path):
+    """The NetFunction of the checkpoint in model_path, or of random weights if there is none (timings do not depend on them)"""
+    if model_path is not None and not os.path.exists(model_path):
+        model_path = None
+    return NET_MODULES[net_type].NetFunction(8, model_path=model_path), model_path
+
+
+def perft(game, depth):
+    """The number of move sequences of length depth from the position of game (a finished game counts as one)"""
+    if depth == 0 or game.get_game_status() != -1:
+        return 1
+    leaf_num = 0
+    for move in list(game.get_available_moves()):
+        game.move(move)
+        leaf_num += perft(game, depth - 1)
+        game.undo_move()
+    return leaf_num
+
+
+def bench_perft(max_depth, engines=('list', 'bitboard')):
+    results = []
+    for engine in engines:
+        game = create_game(8, engine)
+        game.initialize_board_info()
+        for depth in range(1, max_depth + 1):
+            start_time = time.perf_counter()
+            leaf_num = perft(game, depth)
+            seconds = time.perf_counter() - start_time
+            reference = PERFT_REFERENCE[depth] if depth < len(PERFT_REFERENCE) else None
+            results.append({'name': '{}/depth{}'.format(engine, depth), 'engine': engine, 'depth': depth, 'leaves': leaf_num,
+                            'reference': reference, 'correct': leaf_num == reference if reference is not None else None,
+                            'seconds': seconds, 'leaves_per_second': leaf_num / seconds})
+    return results
+
+
+def get_random_game_data(game_num, seed=0):
+    """The [(state, pi, z), ...] of random games, with a one-hot pi on the move played (PASS positions skipped)"""
+    rng = random.Random(seed)
+    data = []
+    for _ in range(game_num):
+        game = create_game(8)
+        game.initialize_board_info()
+        while game.get_game_status() == -1:
+            move = rng.choice(game.get_available_moves())
+            if move >= 0:
+                data.append((game.get_feature_planes(), np.eye(64)[move], rng.choice([-1.0, 1.0])))
+            game.move(move)
+    return data
+
+
+def expand_data_rot90(state, pi, k, mirror):
+    """
+    The augmentation TrainModel.expand_data did with np.rot90 before symmetry.py, rotating by k (1-4) after a mirror
+    if asked: the state, pi transformed like the state, and pi as that code transformed it
+    """
+    state_planes = np.array([np.fliplr(one_plane) for one_plane in state]) if mirror else state
+    rot_state_planes = np.array([np.rot90(one_plane, k=k) for one_plane in state_planes])
+    pi_board = np.reshape(pi, (8, 8))
+    rot_pi = np.rot90(np.fliplr(pi_board) if mirror else pi_board, k=k).flatten()
+    old_rot_pi = np.flipud(np.rot90(np.fliplr(np.flipud(pi_board)) if mirror else np.flipud(pi_board), k=k)).flatten()
+    return rot_state_planes, rot_pi, old_rot_pi
+
+
+def is_legal_pi(state, pi):
+    """Whether the move of a one-hot pi is legal in state (feature planes of Game.get_feature_planes)"""
+    black, white = plane_2_bits(state[0]), plane_2_bits(state[1])
+    own, opp = (black, white) if state[3, 0, 0] else (white, black)
+    return bool(get_moves_bits(own, opp) >> int(np.argmax(pi)) & 1)
+
+
+def check_expand_data(game_num=4):
+    """
+    Compare TrainModel.expand_data with the np.rot90 augmentation on the positions of random games with a one-hot pi:
+    symmetry k % 4 + 4 * mirror must give the same state, and pi transformed like the state, on a legal move. The pi
+    mapping of the old code is recorded too: it was right for the even rotations only.
+    """
+    data = get_random_game_data(game_num)
+    state_planes, pi_list, z_list = TrainModel.expand_data(data)
+    results = []
+    for k in range(1, 5):
+        for mirror in (False, True):
+            symmetry = k % 4 + 4 * mirror
+            same_state = same_pi = legal_pi = same_old_pi = True
+            for i, (state, pi, z) in enumerate(data):
+                rot_state_planes, rot_pi, old_rot_pi = expand_data_rot90(state, pi, k, mirror)
+                j = symmetry * len(data) + i
+                same_state &= np.array_equal(state_planes[j], rot_state_planes) and bool(z_list[j] == z)
+                same_pi &= np.array_equal(pi_list[j], rot_pi)
+                legal_pi &= is_legal_pi(state_planes[j], pi_list[j])
+                same_old_pi &= np.array_equal(pi_list[j], old_rot_pi)
+            results.append({'name': 'expand_data/symmetry{}'.format(symmetry), 'rotation': k, 'mirror': mirror,
+                            'positions': len(data), 'same_state': same_state, 'same_pi': same_pi, 'legal_pi': legal_pi,
+                            'same_as_old_pi': same_old_pi, 'correct': same_state and same_pi and legal_pi})
+    return results
+
+
+def get_engine_state(game):
+    return {'moves': sorted(game.get_available_moves()), 'planes': game.get_feature_planes().tolist(),
+            'count': game.get_black_white_count(), 'status': game.get_game_status(),
+            'player': game.get_current_player_id(), 'hash': game.get_zobrist_hash()}
+
+
+def check_engines(game_num=100, seed=0):
+    """
+    Play random games on Game and BitboardGame in lockstep, comparing the legal moves, feature planes, stone counts,
+    status, side to move and Zobrist hash of every position, then once more while every move is taken back
+    """
+    rng = random.Random(seed)
+    position_num, mismatches = 0, []
+    for game_id in range(game_num):
+        games = [create_game(8, engine) for engine in ('list', 'bitboard')]
+        for game in games:
+            game.initialize_board_info()
+        states = [[get_engine_state(game)] for game in games]
+        while games[0].get_game_status() == -1:
+            move = rng.choice(games[0].get_available_moves())
+            for game, game_states in zip(games, states):
+                game.move(move)
+                game_states.append(get_engine_state(game))
+        for game, game_states in zip(games, states):
+            while game.get_move_sequence():
+                game.undo_move()
+                game_states.append(get_engine_state(game))
+        position_num += len(states[0])
+        for ply, (state, bitboard_state) in enumerate(zip(*states)):
+            keys = [key for key in state if state[key] != bitboard_state.get(key)]
+            if keys:
+                mismatches.append('game {} ply {}: {}'.format(game_id, ply, ', '.join(keys)))
+        if len(states[0]) != len(states[1]):
+            mismatches.append('game {}: {} positions on Game, {} on BitboardGame'.format(game_id, len(states[0]), len(states[1])))
+    return [{'name': 'engines', 'games': game_num, 'positions': position_num, 'mismatches': mismatches[:10],
+             'correct': not mismatches}]
+
+
+def get_uniform_policy_value(avail_moves):
+    """Uniform priors and a value of 0, so that the search is timed without any network"""
+    return zip(avail_moves, [1.0 / len(avail_moves)] * len(avail_moves)), 0.0
+
+
+def stub_policy_value(game):
+    return get_uniform_policy_value(list(game.get_available_moves()))
+
+
+def stub_policy_value_batch(state_planes, avail_moves_batch):
+    return [get_uniform_policy_value(avail_moves) for avail_moves in avail_moves_batch]
+
+
+def get_bench_positions(position_num, move_num=20, seed=0):
+    """The initial position, then positions reached by move_num random moves"""
+    rng = random.Random(seed)
+    games = []
+    while len(games) < position_num:
+        game = create_game(8)
+        game.initialize_board_info()
+        for _ in range(move_num if games else 0):
+            game.move(rng.choice(game.get_available_moves()))
+        if game.get_game_status() == -1:
+            games.append(game)
+    return games
+
+
+def bench_mcts(playout_num, position_num, model_paths, trees=('node', 'array')):
+    """
+    Playouts per second of perform_mcts, searched from scratch on every position (no book, no early stop), with a
+    stub network and with the networks of model_paths, i.e., {net type: checkpoint}
+    """
+    evaluators = [('stub', None, stub_policy_value, stub_policy_value_batch)]
+    for net_type, model_path in model_paths.items():
+        net_func, model_path = create_net_func(net_type, model_path)
+        evaluators.append((net_type, model_path, net_func.get_policy_value_for_mcts, net_func.get_policy_value_batch_for_mcts))
+    results = []
+    for name, model_path, policy_value, policy_value_batch in evaluators:
+        for tree in trees:
+            playout_count, seconds = 0, 0.0
+            for game in get_bench_positions(position_num):
+                mcts_player = create_mcts_player(policy_value, playout_num=playout_num, is_selfplay_mode=True,
+                                                 batch_neural_network=policy_value_batch, tree=tree)
+                mcts_player.opening_book = None
+                mcts_player.perform_mcts(game)
+                playout_count += mcts_player.search_stats['playouts']
+                seconds += mcts_player.search_stats['seconds']
+            results.append({'name': '{}/{}'.format(name, tree), 'network': name, 'checkpoint': model_path, 'tree': tree,
+                            'batch_size': config.MCTS_BATCH_SIZE, 'playouts': playout_count, 'seconds': seconds, 'playouts_per_second': playout_count / seconds})
+    return results
+
+
+def bench_network(batch_sizes, repeat_num, model_paths):
+    """Forward latency (ms) and throughput of NetFunction.get_log_policy_value_batch"""
+    results = []
+    for net_type, model_path in model_paths.items():
+        net_func, model_path = create_net_func(net_type, model_path)
+        latency = benchmark_latency(net_func.get_log_policy_value_batch, batch_sizes, repeat_num)
+        for batch_size, ms in latency.items():
+            results.append({'name': '{}/batch{}'.format(net_type, batch_size), 'network': net_type, 'checkpoint': model_path,
+                            'batch_size': batch_size, 'ms': ms, 'samples_per_second': batch_size * 1000 / ms})
+    return results
+
+
+def bench_training(round_num, position_num=4096, net_types=('cnn', 'resnet')):
+    """Samples per second of NetFunction.training on a replay buffer of random positions, after one round of warm-up"""
+    rng = np.random.RandomState(0)
+    replay_buffer = ReplayBuffer(position_num, 8)
+    pi_list = rng.rand(position_num, 64)
+    replay_buffer.add(rng.randint(0, 2, size=(position_num, config.FEATURE_PLANE_NUM, 8, 8)),
+                      pi_list / pi_list.sum(axis=1, keepdims=True), rng.choice([-1.0, 1.0], size=position_num))
+    results = []
+    for net_type in net_types:
+        net_func = NET_MODULES[net_type].NetFunction(8)
+        net_func.training(replay_buffer)
+        samples_per_second = []
+        for _ in range(round_num):
+            net_func.training(replay_buffer)
+            samples_per_second.append(net_func.trainer.history[-1]['samples_per_second'])
+        results.append({'name': net_type, 'network': net_type, 'batch_size': config.BATCH_SIZE,
+                        'batches_per_round': config.TRAIN_BATCHES_PER_ROUND, 'rounds': round_num,
+                        'samples_per_second': float(np.median(samples_per_second))})
+    return results
+
+
+def get_environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'torch': torch.__version__,
+            'platform': platform.platform(), 'torch_threads': torch.get_num_threads(), 'game_engine': config.GAME_ENGINE,
+            'mcts_tree': config.MCTS_TREE, 'mcts_batch_size': config.MCTS_BATCH_SIZE, 'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def compare_results(baseline, results, tolerance):
+    """
+    The rates (keys ending with 'per_second') of results which fell by more than tolerance (e.g., 0.1 for 10%)
+    from baseline, matched by part and name, as [(part, name, key, baseline rate, rate), ...]
+    """
+    regressions = []
+    for part, records in results.items():
+        if part == 'environment':
+            continue
+        baseline_records = {record['name']: record for record in baseline.get(part, [])}
+        for record in records:
+            for key, value in record.items():
+                baseline_value = baseline_records.get(record['name'], {}).get(key)
+                if key.endswith('per_second') and baseline_value and value < (1 - tolerance) * baseline_value:
+                    regressions.append((part, record['name'], key, baseline_value, value))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the game engines (perft), the search, the networks and training, as JSON')
+    parser.add_argument('--parts', nargs='+', choices=['check', 'perft', 'mcts', 'network', 'training'],
+                        default=['check', 'perft', 'mcts', 'network', 'training'])
+    parser.add_argument('--perft-depth', type=int, default=6, help='perft to depths 1 to ?')
+    parser.add_argument('--playouts', type=int, default=400, help='playouts per search')
+    parser.add_argument('--positions', type=int, default=5, help='positions searched per network and tree')
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 16, 64, 256], help='batch sizes of the forward pass')
+    parser.add_argument('--repeat', type=int, default=100, help='forward passes timed per batch size')
+    parser.add_argument('--rounds', type=int, default=3, help='training rounds timed per network')
+    parser.add_argument('--cnn-model', default=config.AI_CNN_MODEL_PATH, help='ConvNet checkpoint (random weights if missing)')
+    parser.add_argument('--resnet-model', default=config.AI_RESNET_MODEL_PATH, help='ResNet checkpoint (random weights if missing)')
+    parser.add_argument('--threads', type=int, default=None, help='torch threads')
+    parser.add_argument('--out', default=None, help='write the results to this JSON file as well as to stdout')
+    parser.add_argument('--compare', default=None, metavar='BASELINE', help='JSON of an earlier run, whose rates are compared')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='a rate lower than the baseline by more than ? is a regression')
+    args = parser.parse_args()
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    model_paths = {'cnn': args.cnn_model, 'resnet': args.resnet_model}
+    results = {'environment': get_environment()}
+    if 'check' in args.parts:
+        results['check'] = check_engines() + check_expand_data()
+    if 'perft' in args.parts:
+        results['perft'] = bench_perft(args.perft_depth)
+    if 'mcts' in args.parts:
+        results['mcts'] = bench_mcts(args.playouts, args.positions, model_paths)
+    if 'network' in args.parts:
+        results['network'] = bench_network(args.batch_sizes, args.repeat, model_paths)
+    if 'training' in args.parts:
+        results['training'] = bench_training(args.rounds)
+    output = json.dumps(results, indent=1)
+    print(output)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output)
+    wrong_perft = [record['name'] for record in results.get('perft', []) if record['correct'] is False]
+    if wrong_perft:
+        print('Perft mismatch: {}'.format(', '.join(wrong_perft)), file=sys.stderr)
+    failed_checks = [record['name'] for record in results.get('check', []) if not record['correct']]
+    if failed_checks:
+        print('Self-check failed: {}'.format(', '.join(failed_checks)), file=sys.stderr)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(json.load(f), results, args.tolerance)
+        for part, name, key, baseline_value, value in regressions:
+            print('Regression: {} {} {} {:.1f} -> {:.1f} ({:+.1%})'.format(part, name, key, baseline_value, value, value / baseline_value - 1),
+                  file=sys.stderr)
+    sys.exit(1 if wrong_perft or failed_checks or (args.compare and regressions) else 0)
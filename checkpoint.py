@@ -0,0 +1,85 @@
+import glob
+import os
+import random
+import numpy as np
+import torch
+import config
+
+CHECKPOINT_FILE = 'checkpoint_{:08d}.pt'  # numbered by the count of self-play games
+
+
+def get_checkpoint_paths(checkpoint_dir=config.CHECKPOINT_DIR):
+    """The checkpoints in checkpoint_dir, from the oldest to the latest"""
+    return sorted(glob.glob(os.path.join(checkpoint_dir, CHECKPOINT_FILE.replace('{:08d}', '[0-9]' * 8))))
+
+
+def get_latest_checkpoint_path(checkpoint_dir=config.CHECKPOINT_DIR):
+    paths = get_checkpoint_paths(checkpoint_dir)
+    return paths[-1] if paths else None
+
+
+def save_checkpoint(train_model, checkpoint_dir=config.CHECKPOINT_DIR, keep_num=config.CHECKPOINT_KEEP_NUM):
+    """
+    Save the complete state of a TrainModel: weights, optimizer and scheduler states, loss history, game counter,
+    replay buffer (a copy of its data, even if memory-mapped), the number of shards of the self-play log, evaluation
+    history with the optimal model, and the random number generator states.
+    The file is written under a temporary name and renamed, so that a crash never leaves a partial checkpoint,
+    and only the latest keep_num checkpoints are kept. The self-play log is flushed first, so that it holds
+    exactly the games played up to the checkpoint in its first shards.
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    train_model.save_data()
+    net_func = train_model.net_func
+    checkpoint = {
+        'game_num': train_model.game_num,
+        'net_type': config.TRAIN_WHICH_NET,
+        'model': net_func.get_state_dict(),
+        'optimizer': net_func.optimizer.state_dict(),
+        'scheduler': net_func.trainer.scheduler.state_dict(),
+        'train_history': net_func.trainer.history,
+        'replay_buffer': train_model.data_cache.get_state(),
+        'selfplay_shard_num': len(train_model.shard_writer.index['shards']) if train_model.shard_writer is not None else None,
+        'evaluation_history': train_model.evaluation_history,
+        'optimal_model': torch.load(config.SAVE_GOOD_MODEL_PATH) if os.path.exists(config.SAVE_GOOD_MODEL_PATH) else None,
+        'rng': {'python': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()},
+    }
+    path = os.path.join(checkpoint_dir, CHECKPOINT_FILE.format(train_model.game_num))
+    torch.save(checkpoint, path + '.tmp')
+    os.replace(path + '.tmp', path)
+    for old_path in get_checkpoint_paths(checkpoint_dir)[:-keep_num]:
+        os.remove(old_path)
+    return path
+
+
+def load_checkpoint(train_model, path):
+    """
+    Restore a TrainModel from a checkpoint written by save_checkpoint, so that training continues where it stopped,
+    even from an older checkpoint than the latest: the replay buffer (memory-mapped or not) gets the data of the
+    checkpoint back, the shards of the self-play log written after it are dropped, and the optimal model of the
+    checkpoint replaces SAVE_GOOD_MODEL_PATH.
+    """
+    checkpoint = torch.load(path, weights_only=False)  # the checkpoint holds NumPy arrays and RNG states as well
+    if checkpoint['net_type'] != config.TRAIN_WHICH_NET:
+        raise ValueError('{} was saved for {}, but TRAIN_WHICH_NET is {}'.format(path, checkpoint['net_type'], config.TRAIN_WHICH_NET))
+    net_func = train_model.net_func
+    net_func.load_state_dict(checkpoint['model'])
+    net_func.optimizer.load_state_dict(checkpoint['optimizer'])
+    net_func.trainer.scheduler.load_state_dict(checkpoint['scheduler'])
+    net_func.trainer.history = checkpoint['train_history']
+    train_model.data_cache.load_state(checkpoint['replay_buffer'])
+    if train_model.shard_writer is not None and checkpoint['selfplay_shard_num'] is not None:
+        train_model.shard_writer.truncate(checkpoint['selfplay_shard_num'])
+    train_model.evaluation_history = checkpoint['evaluation_history']
+    train_model.game_num = checkpoint['game_num']
+    if checkpoint['optimal_model'] is not None:
+        os.makedirs(os.path.dirname(config.SAVE_GOOD_MODEL_PATH) or '.', exist_ok=True)
+        torch.save(checkpoint['optimal_model'], config.SAVE_GOOD_MODEL_PATH + '.tmp')
+        os.replace(config.SAVE_GOOD_MODEL_PATH + '.tmp', config.SAVE_GOOD_MODEL_PATH)
+    elif os.path.exists(config.SAVE_GOOD_MODEL_PATH):  # promoted after the checkpoint
+        os.remove(config.SAVE_GOOD_MODEL_PATH)
+    random.setstate(checkpoint['rng']['python'])
+    np.random.set_state(checkpoint['rng']['numpy'])
+    torch.set_rng_state(checkpoint['rng']['torch'])
+    if train_model.mcts_player.evaluation_cache is not None:
+        train_model.mcts_player.evaluation_cache.clear()
+    print(">>>Resumed from {} at game {}".format(path, train_model.game_num))
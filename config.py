@@ -20,6 +20,29 @@ CPUCT = 5 # coefficient C_puct used for UCT when selection step
 IS_ALTERNATIVE_TEMPERATURE = False # temperature decrease/increase over time
 FIRST_STEP_NUM = 8  # determine what step does it take to start letting temperature decay
 FEATURE_PLANE_NUM = 4 # the number of feature plane that represents a state of game
+MCTS_UNDO_PLAYOUT = True  # playouts move on the real game and take the moves back by undo, instead of deep-copying the game
+MCTS_BATCH_SIZE = 16  # the number of leaves evaluated by one forward pass (batched search); 1 for one leaf per playout
+VIRTUAL_LOSS = 3  # virtual loss (in visits) put on the path of a leaf waiting for evaluation in batched search
+MCTS_TREE = 'array'  # 'node' keeps the search tree as Node objects (MCTSPlayer), while 'array' keeps it in NumPy arrays (ArrayMCTSPlayer)
+ARRAY_TREE_CAPACITY = 65536  # the number of nodes initially allocated by ArrayMCTSPlayer (doubled when full)
+EVAL_CACHE_SIZE = 100000  # the number of network evaluations kept by the transposition table (LRU eviction); 0 to disable
+SYMMETRY_EVAL_MODE = 'none'  # network evaluation in MCTS: 'none', 'canonical' (evaluate and cache the canonical form of the 8 symmetries), 'random' (a random symmetry) or 'average' (average of the 8 symmetries in one batch)
+SYMMETRY_CACHE_SIZE = 100000  # the number of evaluations cached by canonical form in 'canonical' and 'average' modes; 0 to disable
+MCTS_REUSE_TREE = True  # outside self-play, keep the subtree of every move played (own, opponent's or PASS) for the next search, whose visits count towards the playouts
+MCTS_EARLY_STOP = True  # outside self-play, skip the search of a forced move (single move or PASS), and stop once the most visited move cannot be overtaken by the playouts left
+MCTS_EXTRA_TIME_RATIO = 0.5  # a time-budgeted search ending while the two most visited moves are close gets ? of its budget once more
+MCTS_CLOSE_VISIT_RATIO = 0.8  # the two most visited moves are close if the runner-up has at least ? of the visits of the best
+# Endgame solver
+ENDGAME_SOLVER_EMPTIES = 12  # a root with at most ? empty cells is solved exactly (win/draw/loss) in place of the search; 0 to disable the solver
+ENDGAME_LEAF_EMPTIES = 8  # a leaf with at most ? empty cells gets its proven value in place of the network evaluation (at most ENDGAME_SOLVER_EMPTIES)
+ENDGAME_TABLE_SIZE = 1000000  # the number of positions kept by the transposition table of the solver (cleared when full)
+ENDGAME_MOBILITY_ORDER_EMPTIES = 7  # moves are ordered by the mobility left to the opponent above ? empty cells, and by parity below
+# Opening book
+OPENING_BOOK_PATH = None  # opening book built by opening_book.py from the self-play log, played from instead of searching; None to disable
+OPENING_BOOK_MAX_PLY = 12  # the book covers the positions with at most ? stones played
+OPENING_BOOK_MIN_COUNT = 20  # a position enters the book once seen in ? self-play games
+OPENING_BOOK_MIN_PROB = 0.05  # the book keeps the moves whose mean pi is at least ?
+OPENING_BOOK_SAMPLE = True  # self-play samples the book moves by their probabilities (with its temperature), otherwise it plays the most probable one
 
 # (3) Training
 USE_GPU = False  # use gpu or not
@@ -28,9 +51,17 @@ L2_NORM = 1e-4  # L2 penalty
 LEARNING_RATE = 1e-3  # learning rate
 TRAIN_MCTS_PLYAOUT_NUM = 400  # the number of playout time; that is, how many times MCTS is called for a decision making
 DATASET_SIZE = 30000  # size of dataset buffer
+REPLAY_BUFFER_PATH = None  # directory where the replay buffer is memory-mapped, so that a restarted training keeps its data; None to keep it in memory only
+AUGMENT_AT_SAMPLE = False  # store only the original positions and apply a random symmetry to each position sampled, instead of storing all 8 symmetries
+SELFPLAY_DATA_PATH = None  # directory where every self-play game is logged as shards (see dataset.py) for offline training; None to disable
+SHARD_GAME_NUM = 100  # the number of games per shard of the self-play log
 BATCH_SIZE = 512
 DATASET_SIZE_UPPER_LIMIT = 1000  # start training when a certain figure for data is reached
-EPOCHS = 5
+TRAIN_BATCHES_PER_ROUND = 5  # the number of optimizer steps per training round, each on freshly sampled mini-batches
+GRADIENT_ACCUMULATION_STEPS = 1  # mini-batches of BATCH_SIZE whose gradients are accumulated per optimizer step
+TRAIN_PREFETCH_NUM = 2  # mini-batches sampled ahead from the replay buffer by a background thread
+TRAIN_LOADER_WORKER_NUM = 0  # DataLoader processes when training on a SelfPlayDataset
+OFFLINE_TRAIN_ROUND_NUM = 1000  # training rounds of 'python training.py --offline', on the self-play log only
 SAVE_MODEL_FRENQUENCY = 20  # Save model when a certain figure for the game data collected is reached
 SELFPLAY_NUM = 100000  # Perform ? times self-play to collect data
 TRAIN_WHICH_NET = 'cnn'  # 'cnn' is short for classic convolutional neural network, while resnet is short for Residual network
@@ -38,6 +69,17 @@ SAVE_LATEST_MODEL_PATH = 'model/cnn/othello_8x8/latest.pt'  # the path the lates
 SAVE_GOOD_MODEL_PATH = 'model/cnn/othello_8x8/optimal.pt'  # the path the optimal model is saved
 EXISTING_MODEL_PATH = SAVE_LATEST_MODEL_PATH  # Training based on previous model
 VISUAL_DATA_PATH = 'visual_data/cnn/'  # use tensorboard for recording loss and observe training process (Deprecated)
+CHECKPOINT_DIR = 'model/cnn/othello_8x8/checkpoints'  # directory of the full training checkpoints, from which 'python training.py --resume' continues
+CHECKPOINT_FREQUENCY = SAVE_MODEL_FRENQUENCY  # save a checkpoint every ? self-play games; 0 to disable
+CHECKPOINT_KEEP_NUM = 3  # the number of latest checkpoints kept
+GENERATION_DIR = 'model/cnn/othello_8x8/generations'  # directory of the numbered model generations kept for tournaments (see tournament.py)
+GENERATION_FREQUENCY = 200  # keep a copy of the latest model as a new generation every ? self-play games; 0 to disable
+SELFPLAY_WORKER_NUM = 0  # the number of self-play processes feeding the learner; 0 for alternating self-play and training in one process
+WEIGHTS_PUSH_FREQUENCY = 10  # push the latest weights to the self-play processes every ? training steps
+TRAIN_STEPS_PER_GAME = 1  # the learner does not train more than ? steps per self-play game received
+SELFPLAY_USE_INFERENCE_SERVER = False  # self-play processes share the model of one inference process, which batches their leaf evaluations
+INFERENCE_MAX_BATCH_SIZE = 64  # the inference process evaluates at most ? states per forward pass
+INFERENCE_MAX_WAIT_MS = 2  # the inference process waits at most ? ms after the first request for more requests to batch
 
 # (4) Evaluation
 RUN_EVAL = True  # evaluate the latest model if True when training
@@ -45,6 +87,17 @@ EVAL_MODEL_FRENQUENCY = 200  # start evaluating when a specific figure for self-
 EVAL_MCTS_PLAYOUT_NUM = 400  # specify the number of the playout of MCTS of models to be evaluated 
 EVAL_NUM = 10  # the number of times two models will play against each other
 EVAL_WIN_RATE_THRESHOLD = 0.6  # if reach a specific winning threshold, replace the optimal model with the latest one
+GATING_IN_BACKGROUND = True  # play the evaluation in a pool of processes while self-play goes on, stopped early by a sequential probability ratio test (SPRT)
+GATING_PROCESS_NUM = 2  # the number of processes playing the evaluation games
+GATING_MAX_GAME_NUM = 100  # the evaluation ends after ? games if the SPRT has not decided, and the model is then promoted if its score reaches EVAL_WIN_RATE_THRESHOLD
+SPRT_ELO0 = 0  # SPRT null hypothesis: the latest model is not stronger than the optimal one by more than ? Elo
+SPRT_ELO1 = 35  # SPRT alternative hypothesis: the latest model is stronger by at least ? Elo
+SPRT_ALPHA = 0.05  # SPRT probability of promoting a model which is not stronger
+SPRT_BETA = 0.05  # SPRT probability of rejecting a model which is stronger
+SPRT_MIN_GAME_NUM = 10  # the SPRT decides nothing before ? evaluation games are played
+TOURNAMENT_GAME_NUM = 20  # the number of games per pairing of a tournament between model generations
+TOURNAMENT_PROCESS_NUM = 2  # the number of processes playing the tournament games
+TOURNAMENT_RATING_PATH = 'model/cnn/othello_8x8/generations/ratings.json'  # the games of the tournaments and the rating table computed from them
 
 # (5) Network
 # ResNet
@@ -57,6 +110,14 @@ GUI_BOARD_SIZE = GUI_BOARD_GRID - 1
 
 # (7) AI vs Human mode
 AI_MCTS_PLAYOUT_NUM = 200  # playout times
+AI_MCTS_TIME_BUDGET = None  # seconds of search per move in place of AI_MCTS_PLAYOUT_NUM, e.g., 1.0; None for the fixed playout times
+AI_PONDERING = True  # the AI searches in the background while the human thinks, and re-roots its tree on the human's move
+AI_PONDER_MAX_VISIT_NUM = 20000  # pondering stops once the root has ? visits, to bound the memory of the tree
+GUI_POLL_INTERVAL_MS = 20  # the GUI checks for the move of the AI searching in the background every ? ms
 AI_NET_TYPE = 'resnet'  # cnn or resnet
 AI_RESNET_MODEL_PATH = 'model/resnet/optimal.pt'  # model path
 AI_CNN_MODEL_PATH = 'model/cnn/optimal.pt'  # model path
+AI_EXPORTED_MODEL_PATH = None  # TorchScript or ONNX (.onnx) model exported by network/export.py, used in place of the model above if given
+
+# (8) Game engine
+GAME_ENGINE = 'bitboard'  # 'list' keeps the board as lists of strings (Game), while 'bitboard' uses two 64-bit integers (BitboardGame)
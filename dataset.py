@@ -0,0 +1,180 @@
+import json
+import os
+import numpy as np
+from torch.utils.data import IterableDataset, get_worker_info
+import config
+from game import BatchGame
+from replay_buffer import Z_SCALE
+from symmetry import SYMMETRY_NUM, transform_planes, transform_pi
+
+INDEX_FILE = 'index.json'
+
+
+def read_index(path):
+    """The index of the shards in path, i.e., {'shards': [{'file', 'first_game', 'game_num', 'position_num'}, ...], ...}"""
+    index_path = os.path.join(path, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return {'shards': [], 'game_num': 0, 'position_num': 0}
+    with open(index_path) as f:
+        return json.load(f)
+
+
+def replace_file(path, write):
+    """Write a file through write(f) under a temporary name and rename it, so that readers never see half of it"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        write(f)
+    os.replace(temp_path, path)
+
+
+def replay_games(move_sequences, board_size=config.TRAIN_BOARD_SIZE):
+    """
+    Replay complete games from their move sequences (PASS included) in lockstep.
+    Return the uint8 states (P,4,s,s) and legal move masks (P,s*s) of the P positions, game after game.
+    The mask of a PASS position only holds the last cell, where MCTSPlayer.choose_move puts the pi of PASS.
+    """
+    lengths = np.array([len(moves) for moves in move_sequences])
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    padded_moves = np.full((len(move_sequences), lengths.max()), -1)
+    for game_id, moves in enumerate(move_sequences):
+        padded_moves[game_id, :len(moves)] = moves
+    batch_game = BatchGame(len(move_sequences), board_size)
+    state_planes = np.empty((lengths.sum(), config.FEATURE_PLANE_NUM, board_size, board_size), dtype=np.uint8)
+    legal_masks = np.empty((lengths.sum(), board_size ** 2), dtype=bool)
+    for step in range(lengths.max()):
+        playing = np.flatnonzero(step < lengths)
+        state_planes[starts[playing] + step] = batch_game.get_feature_planes(dtype=np.uint8)[playing]
+        legal_masks[starts[playing] + step] = batch_game.get_legal_moves_mask()[playing]
+        batch_game.move(padded_moves[:, step])  # the games already over ignore their padding
+    legal_masks[~legal_masks.any(axis=1), -1] = True
+    return state_planes, legal_masks
+
+
+def load_shard(path, shard, first_game=0):
+    """
+    Decode a shard into uint8 states (P,4,s,s), float32 pi (P,s*s) and float32 z (P),
+    skipping the games numbered below first_game.
+    """
+    with np.load(os.path.join(path, shard['file'])) as arrays:
+        moves, lengths, pi_values, z_list = arrays['moves'], arrays['lengths'], arrays['pi'], arrays['z']
+    move_sequences = np.split(moves, np.cumsum(lengths)[:-1])
+    state_planes, legal_masks = replay_games(move_sequences)
+    pi_list = np.zeros(legal_masks.shape, dtype=np.float32)
+    pi_list[legal_masks] = pi_values
+    first_position = lengths[:max(first_game - shard['first_game'], 0)].sum()
+    return state_planes[first_position:], pi_list[first_position:], z_list[first_position:].astype(np.float32) / Z_SCALE
+
+
+class ShardWriter:
+    """
+    Append-only log of self-play games in path. Games are kept in memory until shard_game_num of them are
+    collected, then written as one .npz shard, and listed in index.json. A shard stores per game the move sequence
+    (int8, PASS included), and per position z (int8, scaled like ReplayBuffer) and pi at the legal moves only
+    (float16), which come to about 20 bytes per position; the states are rebuilt by replaying the moves.
+    """
+    def __init__(self, path, shard_game_num=config.SHARD_GAME_NUM):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.shard_game_num = shard_game_num
+        self.index = read_index(path)
+        self.games = []  # format: [(moves, pi_list, z_list), ...] of the games not written yet
+
+    def add_game(self, moves, data):
+        """Add a game given by its move sequence and its [(state, pi, z), ...] from TrainModel.self_play"""
+        if len(moves) != len(data):
+            raise ValueError('{} moves were given for a game of {} positions'.format(len(moves), len(data)))
+        self.games.append((np.array(moves, dtype=np.int8), np.array([pi for _, pi, _ in data]), np.array([z for _, _, z in data])))
+        if len(self.games) >= self.shard_game_num:
+            self.flush()
+
+    def flush(self):
+        """Write the games collected so far as a new shard"""
+        if not self.games:
+            return
+        move_sequences, pi_lists, z_lists = zip(*self.games)
+        _, legal_masks = replay_games(move_sequences)
+        lengths = np.array([len(moves) for moves in move_sequences], dtype=np.int16)
+        shard = {'file': 'shard_{:06d}.npz'.format(len(self.index['shards'])), 'first_game': self.index['game_num'],
+                 'game_num': len(self.games), 'position_num': int(lengths.sum())}
+        replace_file(os.path.join(self.path, shard['file']), lambda f: np.savez(
+            f, moves=np.concatenate(move_sequences), lengths=lengths,
+            pi=np.concatenate(pi_lists)[legal_masks].astype(np.float16),
+            z=np.round(np.concatenate(z_lists) * Z_SCALE).astype(np.int8)))
+        self.index['shards'].append(shard)
+        self.index['game_num'] += shard['game_num']
+        self.index['position_num'] += shard['position_num']
+        self.write_index()
+        self.games = []
+
+    def write_index(self):
+        replace_file(os.path.join(self.path, INDEX_FILE), lambda f: f.write(json.dumps(self.index, indent=1).encode()))
+
+    def truncate(self, shard_num):
+        """
+        Drop the shards after the first shard_num, and the games not written yet, e.g., to go back to a checkpoint.
+        The index is rewritten before the shard files are removed, so that a crash leaves no shard listed but missing.
+        """
+        if shard_num > len(self.index['shards']):
+            raise ValueError('{} shards are required, but the log in {} has only {}'.format(shard_num, self.path, len(self.index['shards'])))
+        dropped_shards = self.index['shards'][shard_num:]
+        self.index['shards'] = self.index['shards'][:shard_num]
+        self.index['game_num'] -= sum(shard['game_num'] for shard in dropped_shards)
+        self.index['position_num'] -= sum(shard['position_num'] for shard in dropped_shards)
+        self.write_index()
+        for shard in dropped_shards:
+            os.remove(os.path.join(self.path, shard['file']))
+        self.games = []
+
+
+class SelfPlayDataset(IterableDataset):
+    """
+    Stream the positions of the shards in path as float32 (state, pi, z), one shard in memory at a time per
+    DataLoader worker, which takes every num_workers-th shard. If recent_game_num is given, only the most recent
+    games are read. Each position gets a random symmetry of the 8 if augment is True, and the positions pass
+    through a shuffle buffer of shuffle_buffer_size, so that memory stays bounded by a shard plus that buffer.
+    """
+    def __init__(self, path, recent_game_num=None, augment=True, shuffle_buffer_size=config.BATCH_SIZE * 16, seed=None):
+        super(SelfPlayDataset, self).__init__()
+        self.path = path
+        self.recent_game_num = recent_game_num
+        self.augment = augment
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.seed = seed
+
+    def get_shards(self):
+        """The shards covering the window, and the number of the first game in the window"""
+        index = read_index(self.path)
+        first_game = max(index['game_num'] - self.recent_game_num, 0) if self.recent_game_num else 0
+        return [shard for shard in index['shards'] if shard['first_game'] + shard['game_num'] > first_game], first_game
+
+    def get_position_num(self):
+        """The number of positions in the window"""
+        shards, first_game = self.get_shards()
+        position_num = sum(shard['position_num'] for shard in shards)
+        if shards and first_game > shards[0]['first_game']:
+            with np.load(os.path.join(self.path, shards[0]['file'])) as arrays:
+                position_num -= int(arrays['lengths'][:first_game - shards[0]['first_game']].sum())
+        return position_num
+
+    def __iter__(self):
+        shards, first_game = self.get_shards()
+        worker_info = get_worker_info()
+        worker_id, worker_num = (worker_info.id, worker_info.num_workers) if worker_info is not None else (0, 1)
+        rng = np.random.RandomState(None if self.seed is None else self.seed + worker_id)
+        shards = shards[worker_id::worker_num]
+        shuffle_buffer = []
+        for shard_id in rng.permutation(len(shards)):
+            state_planes, pi_list, z_list = load_shard(self.path, shards[shard_id], first_game)
+            if self.augment:
+                symmetries = rng.randint(0, SYMMETRY_NUM, size=len(state_planes))
+                state_planes, pi_list = transform_planes(state_planes, symmetries), transform_pi(pi_list, symmetries)
+            for position in rng.permutation(len(state_planes)):
+                sample = (state_planes[position].astype(np.float32), pi_list[position], z_list[position])
+                if len(shuffle_buffer) < self.shuffle_buffer_size:
+                    shuffle_buffer.append(sample)
+                    continue
+                replaced = rng.randint(len(shuffle_buffer))
+                yield shuffle_buffer[replaced]
+                shuffle_buffer[replaced] = sample
+        for position in rng.permutation(len(shuffle_buffer)):
+            yield shuffle_buffer[position]
@@ -0,0 +1,195 @@
+import argparse
+import random
+import time
+import config
+from game import Game, BitboardGame, FULL_MASK, create_game, get_moves_bits, get_flips_bits, bits_2_moves, count_bits
+
+# The four 4 x 4 quadrants, the regions whose parity (odd or even count of empty cells) orders the moves
+QUADRANT_MASKS = [0x000000000F0F0F0F, 0x00000000F0F0F0F0, 0x0F0F0F0F00000000, 0xF0F0F0F000000000]
+TABLE_MIN_EMPTIES = 5  # positions with fewer empty cells are searched again rather than stored in the transposition table
+
+
+def get_empty_num(game: Game):
+    return game.board_size ** 2 - len(game.get_occupied_stones())
+
+
+def get_own_opp_bits(game: Game):
+    """The bitboards of the stones of the side to move and of its opponent, for either game engine"""
+    if isinstance(game, BitboardGame):
+        black_bits, white_bits = game.black_bits, game.white_bits
+    else:
+        black_bits, white_bits = sum(1 << move for move in game.black_id_list), sum(1 << move for move in game.white_id_list)
+    return (black_bits, white_bits) if game.is_current_player_black() else (white_bits, black_bits)
+
+
+def get_proven_status(game: Game, score):
+    """The result proven by the solver (score from the side to move), as returned by Game.get_game_status"""
+    if score == 0:
+        return 3
+    current_player_id = game.get_current_player_id()
+    return current_player_id if score > 0 else 3 - current_player_id
+
+
+class EndgameSolver:
+    """
+    Exact solver of the last moves of Othello (8 x 8 only): negamax with alpha-beta pruning on bitboards.
+    By default it solves win/draw/loss (scores 1/0/-1 for the side to move), which is all that MCTS needs and
+    prunes much more than the exact final disc difference (exact=True, the empty cells going to the winner).
+    The moves are ordered by the best move stored in the transposition table, then, with more than
+    mobility_order_empties empty cells, by the mobility left to the opponent (fewest first), and otherwise by
+    parity, i.e., moves in a quadrant with an odd count of empty cells first. The transposition table keeps the
+    bounds found for every position, so that solving the positions of one search (or of successive moves) again
+    is mostly free; it is cleared once it holds table_size positions.
+    The node count and solve time are recorded by the empty count of the position solved, see get_stats().
+    """
+    def __init__(self, table_size=config.ENDGAME_TABLE_SIZE, mobility_order_empties=config.ENDGAME_MOBILITY_ORDER_EMPTIES):
+        self.table_size = table_size
+        self.mobility_order_empties = mobility_order_empties
+        self.tables = {False: {}, True: {}}  # exact -> {(own, opp): (lower bound, upper bound, best move)}
+        self.exact = False
+        self.node_num = 0  # the number of positions searched since the solver was created
+        self.stats = {}  # empty count -> [solve count, node count, seconds]
+
+    def solve(self, game: Game, exact=False):
+        """Return (score, best move) of the side to move of game, which must not be over; the best move is -1 for PASS"""
+        start_time, start_node_num = time.perf_counter(), self.node_num
+        own, opp = get_own_opp_bits(game)
+        self.exact = exact
+        table = self.tables[exact]
+        if len(table) >= self.table_size:
+            table.clear()
+        entry = table.get((own, opp))
+        if entry is not None and entry[0] == entry[1] and entry[2] is not None:  # solved before, e.g., a leaf visited again
+            return entry[0], entry[2]
+        max_score = 64 if exact else 1
+        moves = get_moves_bits(own, opp)
+        if moves:
+            best_score, best_move = -max_score - 1, None
+            for move, flips in self.order_moves(own, opp, moves, entry):
+                score = -self.negamax(opp ^ flips, own | flips | (1 << move), -max_score, -max(best_score, -max_score), False)
+                if score > best_score:
+                    best_score, best_move = score, move
+                if best_score >= max_score:
+                    break
+            table[own, opp] = (best_score, best_score, best_move)
+        else:
+            best_score, best_move = -self.negamax(opp, own, -max_score, max_score, True), -1
+        empty_num = get_empty_num(game)
+        stats = self.stats.setdefault(empty_num, [0, 0, 0.0])
+        stats[0] += 1
+        stats[1] += self.node_num - start_node_num
+        stats[2] += time.perf_counter() - start_time
+        return best_score, best_move
+
+    def get_final_score(self, own, opp):
+        disc_diff = count_bits(own) - count_bits(opp)
+        if not self.exact:
+            return (disc_diff > 0) - (disc_diff < 0)
+        empty_num = 64 - count_bits(own | opp)
+        return disc_diff + empty_num if disc_diff > 0 else disc_diff - empty_num if disc_diff < 0 else 0
+
+    def order_moves(self, own, opp, moves, entry):
+        """Return [(move, flips), ...] in the order they are searched"""
+        move_list = bits_2_moves(moves)
+        children = [(move, get_flips_bits(move, own, opp)) for move in move_list]
+        if len(children) > 1:
+            empty = ~(own | opp) & FULL_MASK
+            if count_bits(empty) > self.mobility_order_empties:
+                children.sort(key=lambda child: count_bits(get_moves_bits(opp ^ child[1], own | child[1] | (1 << child[0]))))
+            else:
+                odd_quadrants = 0
+                for mask in QUADRANT_MASKS:
+                    if count_bits(empty & mask) & 1:
+                        odd_quadrants |= mask
+                children.sort(key=lambda child: not odd_quadrants >> child[0] & 1)
+            if entry is not None and entry[2] in move_list:
+                children.sort(key=lambda child: child[0] != entry[2])  # stable, so the rest keeps its order
+        return children
+
+    def negamax(self, own, opp, alpha, beta, passed):
+        """The score of the side to move (own) if it is within (alpha, beta), otherwise a bound beyond them (fail-soft)"""
+        self.node_num += 1
+        empty = ~(own | opp) & FULL_MASK
+        if empty & (empty - 1) == 0:  # at most one empty cell, played by whichever side can
+            if empty:
+                move = empty.bit_length() - 1
+                flips = get_flips_bits(move, own, opp)
+                if flips:
+                    return self.get_final_score(own | flips | empty, opp ^ flips)
+                flips = get_flips_bits(move, opp, own)
+                if flips:
+                    return self.get_final_score(own ^ flips, opp | flips | empty)
+            return self.get_final_score(own, opp)
+        moves = get_moves_bits(own, opp)
+        if not moves:
+            if passed:  # neither side can move
+                return self.get_final_score(own, opp)
+            return -self.negamax(opp, own, -beta, -alpha, True)
+        use_table = count_bits(empty) >= TABLE_MIN_EMPTIES
+        entry = None
+        if use_table:
+            entry = self.tables[self.exact].get((own, opp))
+            if entry is not None:
+                lower, upper, _ = entry
+                if lower >= beta or lower == upper:
+                    return lower
+                if upper <= alpha:
+                    return upper
+                alpha, beta = max(alpha, lower), min(beta, upper)
+        best_score, best_move = -65, None
+        for move, flips in self.order_moves(own, opp, moves, entry):
+            score = -self.negamax(opp ^ flips, own | flips | (1 << move), -beta, -max(alpha, best_score), False)
+            if score > best_score:
+                best_score, best_move = score, move
+                if best_score >= beta:
+                    break
+        if use_table:
+            lower, upper = (-65, 65) if entry is None else entry[:2]
+            if best_score <= alpha:
+                upper = min(upper, best_score)
+            elif best_score >= beta:
+                lower = max(lower, best_score)
+            else:
+                lower = upper = best_score
+            self.tables[self.exact][own, opp] = (lower, upper, best_move)
+        return best_score
+
+    def get_stats(self):
+        """One row per empty count solved: the solves, the mean nodes and milliseconds per solve, and nodes per second"""
+        return [{'empties': empty_num, 'solves': solve_num, 'nodes': node_num / solve_num, 'ms': 1000.0 * seconds / solve_num,
+                 'nodes_per_second': node_num / seconds if seconds else 0.0}
+                for empty_num, (solve_num, node_num, seconds) in sorted(self.stats.items())]
+
+    def print_stats(self):
+        print("{:>8}{:>8}{:>14}{:>12}{:>12}".format('Empties', 'Solves', 'Nodes/solve', 'ms/solve', 'Nodes/s'))
+        for row in self.get_stats():
+            print("{:>8}{:>8}{:>14.0f}{:>12.1f}{:>12.0f}".format(row['empties'], row['solves'], row['nodes'], row['ms'], row['nodes_per_second']))
+
+
+def play_random_game(empty_num, rng, engine=config.GAME_ENGINE):
+    """A position with empty_num empty cells reached by random moves (a finished game if it ends sooner)"""
+    game = create_game(8, engine)
+    game.initialize_board_info()
+    while get_empty_num(game) > empty_num and game.get_game_status() == -1:
+        game.move(rng.choice(game.get_available_moves()))
+    return game
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the endgame solver on positions reached by random play')
+    parser.add_argument('--empties', nargs='+', type=int, default=[6, 8, 10, 12], help='empty counts of the positions solved')
+    parser.add_argument('--positions', type=int, default=20, help='positions per empty count')
+    parser.add_argument('--exact', action='store_true', help='solve the final disc difference instead of win/draw/loss')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    solver = EndgameSolver()
+    for empty_num in args.empties:
+        solved_num = 0
+        while solved_num < args.positions:
+            game = play_random_game(empty_num, rng)
+            if game.get_game_status() == -1 and get_empty_num(game) == empty_num:
+                solver.tables[args.exact].clear()  # every position is solved from scratch
+                solver.solve(game, args.exact)
+                solved_num += 1
+    solver.print_stats()
@@ -0,0 +1,68 @@
+import sys
+from collections import OrderedDict
+import numpy as np
+import config
+
+
+class EvaluationCache:
+    """
+    Bounded transposition table of network evaluations, keyed by the Zobrist hash of a state.
+    An entry holds the available moves, their prior probabilities and the state value.
+    The least recently used entry is evicted once 'capacity' entries are stored.
+    """
+    def __init__(self, capacity=config.EVAL_CACHE_SIZE):
+        self.capacity = capacity
+        self.table = OrderedDict()  # format: {zobrist_hash: (moves, probs, value)}
+        self.hit_num = 0
+        self.miss_num = 0
+        self.entry_bytes = 0  # approximate size of the entries stored
+
+    def __len__(self):
+        return len(self.table)
+
+    def get(self, key, avail_moves):
+        """
+        Return the cached (moves_probs, value) of a state, or None if it is not stored.
+        The available moves are compared as well, so that a hash collision is treated as a miss.
+        """
+        entry = self.table.get(key)
+        if entry is None or entry[0] != tuple(avail_moves):
+            self.miss_num += 1
+            return None
+        self.table.move_to_end(key)
+        self.hit_num += 1
+        return zip(entry[0], entry[1]), entry[2]
+
+    def put(self, key, moves_probs, value):
+        """Store an evaluation, where moves_probs is an iterable of (move, prior probability)"""
+        moves_probs = list(moves_probs)
+        moves = tuple(move for move, _ in moves_probs)
+        probs = np.array([prob for _, prob in moves_probs], dtype=np.float32)
+        if key in self.table:
+            self.entry_bytes -= self.get_entry_bytes(self.table.pop(key))
+        self.table[key] = (moves, probs, float(value))
+        self.entry_bytes += self.get_entry_bytes(self.table[key])
+        while len(self.table) > self.capacity:
+            self.entry_bytes -= self.get_entry_bytes(self.table.popitem(last=False)[1])
+
+    def clear(self):
+        """Drop every entry, e.g., once the network is updated. The hit statistics are kept"""
+        self.table.clear()
+        self.entry_bytes = 0
+
+    @staticmethod
+    def get_entry_bytes(entry):
+        moves, probs, value = entry
+        return sys.getsizeof(moves) + sys.getsizeof(probs) + sys.getsizeof(value) + sys.getsizeof(entry)
+
+    def get_hit_rate(self):
+        lookup_num = self.hit_num + self.miss_num
+        return 1.0 * self.hit_num / lookup_num if lookup_num else 0.0
+
+    def get_memory_usage(self):
+        """Approximate bytes taken by the cache, i.e., the entries plus the hash table itself"""
+        return self.entry_bytes + sys.getsizeof(self.table) + len(self.table) * sys.getsizeof(2 ** 63)
+
+    def report(self):
+        return {'entries': len(self.table), 'hits': self.hit_num, 'misses': self.miss_num,
+                'hit_rate': self.get_hit_rate(), 'memory_mb': self.get_memory_usage() / 2 ** 20}
@@ -1,6 +1,22 @@
 import numpy as np
+import random
+import struct
 import config
 
+# Zobrist hashing: a random 64-bit key per (colour, cell), for the side to move and for the pass state
+ZOBRIST_RANDOM = random.Random(20211212)
+ZOBRIST_BLACK = [ZOBRIST_RANDOM.getrandbits(64) for _ in range(64)]
+ZOBRIST_WHITE = [ZOBRIST_RANDOM.getrandbits(64) for _ in range(64)]
+ZOBRIST_BLACK_TO_MOVE = ZOBRIST_RANDOM.getrandbits(64)
+ZOBRIST_PASS = [0, ZOBRIST_RANDOM.getrandbits(64), ZOBRIST_RANDOM.getrandbits(64)]  # indexed by the count of True in Game.passed
+# Per byte of a bitboard, the XOR of the black and white keys of the cells set in it (to flip many stones at once)
+ZOBRIST_FLIP_TABLES = [[0] * 256 for _ in range(8)]
+for byte_index in range(8):
+    for byte in range(1, 256):
+        lowest = byte & -byte
+        cell = byte_index * 8 + lowest.bit_length() - 1
+        ZOBRIST_FLIP_TABLES[byte_index][byte] = ZOBRIST_FLIP_TABLES[byte_index][byte ^ lowest] ^ ZOBRIST_BLACK[cell] ^ ZOBRIST_WHITE[cell]
+
 
 class Game:
     def __init__(self, board_size):
@@ -15,6 +31,8 @@ class Game:
         self.black_id_list = [28, 35]
         self.white_id_list = [27, 36]
         self.passed = [False, False]
+        self.undo_stack = []  # Undo entries of the moves performed, see undo_move()
+        self.zobrist_hash = self.compute_zobrist_hash()  # Incrementally updated by move() and undo_move()
 
     def initialize_board_info(self, who_first='player1'):
         self.current_player_id = 1 if who_first == 'player1' else 2  # For Human vs AI mode
@@ -28,7 +46,9 @@ class Game:
         self.black_id_list = [28, 35]
         self.white_id_list = [27, 36]
         self.passed = [False, False]
+        self.undo_stack = []  # Undo entries of the moves performed, see undo_move()
         self.current_player_is_black = True
+        self.zobrist_hash = self.compute_zobrist_hash()  # Incrementally updated by move() and undo_move()
         # self.print_game_information()
 
     def get_new_board(self):
@@ -143,32 +163,24 @@ class Game:
         self.black_id_list = black_id_list
         self.white_id_list = white_id_list
 
-    def get_feature_planes(self):
-        """Get the custom feature planes (or state representation) for neural network"""
-        feature_planes = np.full((config.FEATURE_PLANE_NUM, self.board_size, self.board_size), 0.0)  # Define ? feature plane in 3-dims
-        # For plane 1
-        black_loc_list = self.moves_2_locations(self.black_id_list)
-        black_y_list = [black_loc[0] for black_loc in black_loc_list]
-        black_x_list = [black_loc[1] for black_loc in black_loc_list]
-        # For plane 2
-        white_loc_list = self.moves_2_locations(self.white_id_list)
-        white_y_list = [white_loc[0] for white_loc in white_loc_list]
-        white_x_list = [white_loc[1] for white_loc in white_loc_list]
-        # For plane 3
-        non_occupied_moves = np.array(self.get_non_occupied_moves())
-        non_occupied_locs = self.moves_2_locations(non_occupied_moves)
-        non_occupied_loc_y_list = [non_occupied_loc[0] for non_occupied_loc in non_occupied_locs]
-        non_occupied_loc_x_list = [non_occupied_loc[1] for non_occupied_loc in non_occupied_locs]
+    def get_feature_planes(self, out=None, dtype=np.float32):
+        """
+        Get the custom feature planes (or state representation) for neural network, as a (4, s, s) array.
+        They are written into 'out' if given, e.g., one row of a preallocated (N, 4, s, s) input buffer.
+        """
+        if out is None:
+            out = np.empty((config.FEATURE_PLANE_NUM, self.board_size, self.board_size), dtype=dtype)
+        out[:3] = 0
         """ Plane design """
         # Plane 1: Black stones are 1.0, others 0.0.
-        feature_planes[0][black_y_list, black_x_list] = 1.0
+        out[0].flat[self.black_id_list] = 1
         # Plane 2: White stones are 1.0, others 0.0.
-        feature_planes[1][white_y_list, white_x_list] = 1.0
+        out[1].flat[self.white_id_list] = 1
         # Plane 3: White and black are 0.0, other non-occupied stones (or cells) are 1.0
-        feature_planes[2][non_occupied_loc_y_list, non_occupied_loc_x_list] = 1.0
-        # Plane 3: Full ones if current player is black
-        feature_planes[3] = 1.0 if self.is_current_player_black() else 0.0
-        return feature_planes
+        out[2].flat[self.get_non_occupied_moves()] = 1
+        # Plane 4: Full ones if current player is black
+        out[3] = 1 if self.is_current_player_black() else 0
+        return out
 
     def flip(self, tile, flips, loc_y, loc_x):
         """Flip the stones"""
@@ -183,24 +195,31 @@ class Game:
         """
         tile = 'black' if self.is_current_player_black() else 'white'  # for flipping
         other_tile = 'white' if self.is_current_player_black() else 'black'  # for getting the available moves of the next state
+        # Undo entry: the previous lists are kept by reference since they are replaced (not mutated) below
+        undo_entry = [move, None, None, self.passed, self.next_state_avail_moves_loc, self.next_state_avail_moves_id,
+                      self.black_id_list, self.white_id_list, self.zobrist_hash]
         self.all_player_id_list.append(self.current_player_id)
         self.current_player_id = 1 if self.current_player_id == 2 else 2
         self.current_player_is_black = False if self.current_player_is_black else True
+        self.zobrist_hash ^= ZOBRIST_BLACK_TO_MOVE ^ ZOBRIST_PASS[self.passed.count(True)]
         if move == -1:
             if self.passed == [False, False]:
                 self.passed = [True, False]
             elif self.passed == [True, False]:
                 self.passed = [True, True]
+            self.zobrist_hash ^= ZOBRIST_PASS[self.passed.count(True)]
             self.next_state_avail_moves_loc = self.get_valid_moves(other_tile)
             self.next_state_avail_moves_id = self.locations_2_moves(self.next_state_avail_moves_loc)
             will_double_pass = self.will_pass()
             if self.passed == [True, True]:
                 self.next_state_avail_moves_loc = []
                 self.next_state_avail_moves_id = []
+            self.undo_stack.append(undo_entry)
             # self.print_game_information(move)
             return will_double_pass
         self.passed = [False, False]
-        self.non_occupied_stones.remove(move)
+        undo_entry[2] = self.non_occupied_stones.index(move)
+        del self.non_occupied_stones[undo_entry[2]]
         self.occupied_stones.append(move)
         loc_y, loc_x = self.move_2_location(move)  # loc_y represents row, while loc_x represents col.
         if flips is not None:
@@ -212,6 +231,12 @@ class Game:
             else:
                 print('Error occured in false move!')
                 return
+        undo_entry[1] = flips
+        self.undo_stack.append(undo_entry)
+        own_keys, other_keys = (ZOBRIST_BLACK, ZOBRIST_WHITE) if tile == 'black' else (ZOBRIST_WHITE, ZOBRIST_BLACK)
+        self.zobrist_hash ^= own_keys[move]
+        for x, y in flips:
+            self.zobrist_hash ^= own_keys[x * 8 + y] ^ other_keys[x * 8 + y]
         self.update_black_white_tiles()
         self.next_state_avail_moves_loc = self.get_valid_moves(other_tile)
         self.next_state_avail_moves_id = self.locations_2_moves(self.next_state_avail_moves_loc)
@@ -219,6 +244,41 @@ class Game:
         # self.print_game_information(move)
         return will_pass_flag
 
+    def undo_move(self):
+        """Take back the last move performed (including PASS), restoring the state exactly as it was before"""
+        move, flips, empty_index, passed, avail_loc, avail_id, black_ids, white_ids, self.zobrist_hash = self.undo_stack.pop()
+        self.all_player_id_list.pop()
+        self.current_player_id = 1 if self.current_player_id == 2 else 2
+        self.current_player_is_black = not self.current_player_is_black
+        self.passed = passed
+        self.next_state_avail_moves_loc = avail_loc
+        self.next_state_avail_moves_id = avail_id
+        if move == -1:
+            return
+        other_tile = 'white' if self.current_player_is_black else 'black'
+        for x, y in flips:
+            self.board[x][y] = other_tile
+        loc_y, loc_x = self.move_2_location(move)
+        self.board[loc_y][loc_x] = 'none'
+        self.occupied_stones.pop()
+        self.non_occupied_stones.insert(empty_index, move)
+        self.black_id_list = black_ids
+        self.white_id_list = white_ids
+
+    def compute_zobrist_hash(self):
+        """Compute the Zobrist hash of the current state from scratch"""
+        zobrist_hash = ZOBRIST_BLACK_TO_MOVE if self.current_player_is_black else 0
+        zobrist_hash ^= ZOBRIST_PASS[self.passed.count(True)]
+        for move in self.black_id_list:
+            zobrist_hash ^= ZOBRIST_BLACK[move]
+        for move in self.white_id_list:
+            zobrist_hash ^= ZOBRIST_WHITE[move]
+        return zobrist_hash
+
+    def get_zobrist_hash(self):
+        """Get the Zobrist hash of the current state, covering the stones, the side to move and the pass state"""
+        return self.zobrist_hash
+
     def get_game_status(self):
         """
         Get the status of the game, in which -1 shows the game is ongoing, while 3 represents the game is draw.
@@ -260,6 +320,10 @@ class Game:
         """
         return self.get_occupied_stones()[4:]
 
+    def get_move_sequence(self):
+        """Get every move performed since the initial state, including PASS (-1), in the order played"""
+        return [undo_entry[0] for undo_entry in self.undo_stack]
+
     def get_all_player_id_list(self):
         """Get the sequence of the two game players in a game completed"""
         return self.all_player_id_list
@@ -315,3 +379,479 @@ class Game:
     def is_on_board(x, y):
         """Check if a move is on the board"""
         return 0 <= x <= 7 and 0 <= y <= 7
+
+
+# Bitboard helpers. Bit i of a 64-bit integer stands for move id i (row * 8 + col).
+FULL_MASK = 0xFFFFFFFFFFFFFFFF
+NOT_A_FILE = 0xFEFEFEFEFEFEFEFE  # every cell but column 0
+NOT_H_FILE = 0x7F7F7F7F7F7F7F7F  # every cell but column 7
+INITIAL_BLACK_BITS = (1 << 28) | (1 << 35)
+INITIAL_WHITE_BITS = (1 << 27) | (1 << 36)
+# (shift, mask) per direction, where a positive shift is a left shift. The mask drops the bits wrapping around a row.
+DIRECTIONS = [(1, NOT_A_FILE), (-1, NOT_H_FILE), (8, FULL_MASK), (-8, FULL_MASK),
+              (9, NOT_A_FILE), (7, NOT_H_FILE), (-7, NOT_A_FILE), (-9, NOT_H_FILE)]
+
+
+def get_moves_bits(own, opp):
+    """Given the stones of the side to move (own) and the opponent (opp), return the legal moves as a bitboard"""
+    empty = ~(own | opp) & FULL_MASK
+    moves = 0
+    for shift, mask in DIRECTIONS:
+        opp_masked = opp & mask
+        if shift > 0:
+            x = (own << shift) & opp_masked
+            x |= (x << shift) & opp_masked
+            x |= (x << shift) & opp_masked
+            x |= (x << shift) & opp_masked
+            x |= (x << shift) & opp_masked
+            x |= (x << shift) & opp_masked
+            moves |= (x << shift) & mask & empty
+        else:
+            shift = -shift
+            x = (own >> shift) & opp_masked
+            x |= (x >> shift) & opp_masked
+            x |= (x >> shift) & opp_masked
+            x |= (x >> shift) & opp_masked
+            x |= (x >> shift) & opp_masked
+            x |= (x >> shift) & opp_masked
+            moves |= (x >> shift) & mask & empty
+    return moves
+
+
+def get_flips_bits(move, own, opp):
+    """Return the bitboard of the opponent stones flipped when the side to move puts a stone on move id"""
+    flips = 0
+    for shift, mask in DIRECTIONS:
+        line = 0
+        cursor = ((1 << move) << shift) & mask if shift > 0 else ((1 << move) >> -shift) & mask
+        while cursor & opp:
+            line |= cursor
+            cursor = (cursor << shift) & mask if shift > 0 else (cursor >> -shift) & mask
+        if cursor & own:
+            flips |= line
+    return flips
+
+
+def get_zobrist_flip_key(bits):
+    """XOR of the black and white Zobrist keys of the cells of a bitboard, i.e., the hash change of flipping them"""
+    key = 0
+    byte_index = 0
+    while bits:
+        key ^= ZOBRIST_FLIP_TABLES[byte_index][bits & 255]
+        bits >>= 8
+        byte_index += 1
+    return key
+
+
+def bits_2_moves(bits):
+    """Convert a bitboard to the ascending list of move Ids it contains"""
+    move_list = []
+    while bits:
+        lowest = bits & -bits
+        move_list.append(lowest.bit_length() - 1)
+        bits ^= lowest
+    return move_list
+
+
+def count_bits(bits):
+    """Count the stones of a bitboard"""
+    return bin(bits).count('1')
+
+
+def bits_2_plane(bits):
+    """Convert a bitboard to an 8 x 8 array of 0/1"""
+    return np.unpackbits(np.frombuffer(bits.to_bytes(8, 'little'), dtype=np.uint8), bitorder='little').reshape(8, 8)
+
+
+class BitboardGame(Game):
+    """
+    The same rules and public methods as Game, but the position is stored as two 64-bit integers
+    (one per colour), so that available moves and flips are computed by shift-and-mask operations.
+    Only the 8 x 8 board is supported.
+    """
+    def __init__(self, board_size):
+        self.board_size = board_size  # Board size
+        self.black_bits = INITIAL_BLACK_BITS  # Black stones on the board
+        self.white_bits = INITIAL_WHITE_BITS  # White stones on the board
+        self.occupied_stones = [27, 28, 35, 36]  # Record the stones on the board
+        self.all_player_id_list = []  # Record the sequence of the two game players
+        self.current_player_is_black = None  # Record if the current player represents black side
+        self.next_state_avail_moves_id = bits_2_moves(get_moves_bits(self.black_bits, self.white_bits))
+        self.passed = [False, False]
+        self.undo_stack = []  # Undo entries of the moves performed, see undo_move()
+        self.zobrist_hash = self.compute_zobrist_hash()  # Incrementally updated by move() and undo_move()
+
+    def initialize_board_info(self, who_first='player1'):
+        self.current_player_id = 1 if who_first == 'player1' else 2  # For Human vs AI mode
+        self.black_bits = INITIAL_BLACK_BITS
+        self.white_bits = INITIAL_WHITE_BITS
+        self.occupied_stones = [27, 28, 35, 36]  # Record the stones on the board
+        self.all_player_id_list = []  # Record the sequence of the two game players
+        self.next_state_avail_moves_id = bits_2_moves(get_moves_bits(self.black_bits, self.white_bits))
+        self.passed = [False, False]
+        self.undo_stack = []  # Undo entries of the moves performed, see undo_move()
+        self.current_player_is_black = True
+        self.zobrist_hash = self.compute_zobrist_hash()  # Incrementally updated by move() and undo_move()
+
+    @property
+    def board(self):
+        """8 x 8 list of 'black', 'white' and 'none', as stored by Game"""
+        board = self.get_new_board()
+        for move in self.black_id_list:
+            board[move // 8][move % 8] = 'black'
+        for move in self.white_id_list:
+            board[move // 8][move % 8] = 'white'
+        return board
+
+    @property
+    def black_id_list(self):
+        return bits_2_moves(self.black_bits)
+
+    @property
+    def white_id_list(self):
+        return bits_2_moves(self.white_bits)
+
+    @property
+    def non_occupied_stones(self):
+        return bits_2_moves(~(self.black_bits | self.white_bits) & FULL_MASK)
+
+    @property
+    def next_state_avail_moves_loc(self):
+        if self.next_state_avail_moves_id == [-1]:
+            return [-1]
+        return [list(self.move_2_location(move)) for move in self.next_state_avail_moves_id]
+
+    def get_own_opp_bits(self, tile: str):
+        return (self.black_bits, self.white_bits) if tile == 'black' else (self.white_bits, self.black_bits)
+
+    def is_valid_move(self, tile: str, loc_y, loc_x):
+        # check if the action is valid, and return the locations of the stones to be flipped if so
+        if not self.is_on_board(loc_y, loc_x):
+            return False
+        move = int(loc_y * 8 + loc_x)
+        own, opp = self.get_own_opp_bits(tile)
+        if (own | opp) >> move & 1:
+            return False
+        flips = get_flips_bits(move, own, opp)
+        if flips == 0:
+            return False
+        return [list(self.move_2_location(flip)) for flip in bits_2_moves(flips)]
+
+    def get_valid_moves(self, tile: str):
+        """Given tile (black or white), return its available moves"""
+        own, opp = self.get_own_opp_bits(tile)
+        return [list(self.move_2_location(move)) for move in bits_2_moves(get_moves_bits(own, opp))]
+
+    def get_black_white_count(self):
+        """Get the count of black stone and white stone"""
+        return {'black': count_bits(self.black_bits), 'white': count_bits(self.white_bits)}
+
+    def will_pass(self):
+        """After an action is performed, check if the next available action have to be PASS"""
+        if not self.is_game_over() and self.next_state_avail_moves_id == []:
+            self.next_state_avail_moves_id = [-1]
+            return True
+        return False
+
+    def is_game_over(self):
+        """Check if is game over"""
+        return self.passed == [True, True] or self.black_bits == 0 or self.white_bits == 0 \
+            or (self.black_bits | self.white_bits) == FULL_MASK
+
+    def update_black_white_tiles(self):
+        """Stone lists are derived from the bitboards, so nothing needs to be updated"""
+        pass
+
+    def get_feature_planes(self, out=None, dtype=np.float32):
+        """See Game.get_feature_planes; the first 3 planes are unpacked from the bitboards in one call"""
+        if out is None:
+            out = np.empty((config.FEATURE_PLANE_NUM, self.board_size, self.board_size), dtype=dtype)
+        # Plane 1: Black stones, Plane 2: White stones, Plane 3: Empty cells
+        bits_bytes = struct.pack('<3Q', self.black_bits, self.white_bits, ~(self.black_bits | self.white_bits) & FULL_MASK)
+        out[:3] = np.unpackbits(np.frombuffer(bits_bytes, dtype=np.uint8), bitorder='little').reshape(3, 8, 8)
+        out[3] = 1 if self.current_player_is_black else 0  # Plane 4: Full ones if current player is black
+        return out
+
+    def flip(self, tile, flips, loc_y, loc_x):
+        """Flip the stones, where flips is a bitboard"""
+        flips |= 1 << (loc_y * 8 + loc_x)
+        if tile == 'black':
+            self.black_bits |= flips
+            self.white_bits &= ~flips
+        else:
+            self.white_bits |= flips
+            self.black_bits &= ~flips
+
+    def move(self, move, flips=None):
+        """
+        Perform an action (or move) and accordingly update the information about the next state
+        Futher, a check that the next action is PASS will be returned.
+        The flips are always recomputed from the bitboards, so the flips argument is only kept for compatibility.
+        """
+        move = int(move)  # moves sampled by numpy are numpy integers, which cannot be shifted by 64 bits
+        is_black = self.is_current_player_black()
+        self.all_player_id_list.append(self.current_player_id)
+        self.current_player_id = 1 if self.current_player_id == 2 else 2
+        self.current_player_is_black = not is_black
+        own, opp = (self.black_bits, self.white_bits) if is_black else (self.white_bits, self.black_bits)
+        passed, avail_id, zobrist_hash = self.passed, self.next_state_avail_moves_id, self.zobrist_hash
+        self.zobrist_hash ^= ZOBRIST_BLACK_TO_MOVE ^ ZOBRIST_PASS[self.passed.count(True)]
+        if move == -1:
+            if self.passed == [False, False]:
+                self.passed = [True, False]
+            elif self.passed == [True, False]:
+                self.passed = [True, True]
+            self.zobrist_hash ^= ZOBRIST_PASS[self.passed.count(True)]
+            self.next_state_avail_moves_id = bits_2_moves(get_moves_bits(opp, own))
+            will_double_pass = self.will_pass()
+            if self.passed == [True, True]:
+                self.next_state_avail_moves_id = []
+            self.undo_stack.append((move, 0, passed, avail_id, zobrist_hash))
+            return will_double_pass
+        flip_bits = get_flips_bits(move, own, opp)
+        if (own | opp) >> move & 1 or flip_bits == 0:
+            print('Error occured in false move!')
+            return
+        self.undo_stack.append((move, flip_bits, passed, avail_id, zobrist_hash))
+        self.zobrist_hash ^= (ZOBRIST_BLACK if is_black else ZOBRIST_WHITE)[move] ^ get_zobrist_flip_key(flip_bits)
+        self.passed = [False, False]
+        self.occupied_stones.append(move)
+        loc_y, loc_x = self.move_2_location(move)
+        self.flip('black' if is_black else 'white', flip_bits, loc_y, loc_x)
+        own, opp = (self.black_bits, self.white_bits) if is_black else (self.white_bits, self.black_bits)
+        self.next_state_avail_moves_id = bits_2_moves(get_moves_bits(opp, own))
+        will_pass_flag = self.will_pass()  # not game over and no next available moves.
+        return will_pass_flag
+
+    def undo_move(self):
+        """Take back the last move performed (including PASS), restoring the state exactly as it was before"""
+        move, flip_bits, passed, avail_id, self.zobrist_hash = self.undo_stack.pop()
+        self.all_player_id_list.pop()
+        self.current_player_id = 1 if self.current_player_id == 2 else 2
+        self.current_player_is_black = not self.current_player_is_black
+        self.passed = passed
+        self.next_state_avail_moves_id = avail_id
+        if move == -1:
+            return
+        self.occupied_stones.pop()
+        if self.current_player_is_black:
+            self.black_bits ^= flip_bits | (1 << move)
+            self.white_bits |= flip_bits
+        else:
+            self.white_bits ^= flip_bits | (1 << move)
+            self.black_bits |= flip_bits
+
+
+
+# Bitboard helpers of BatchGame, applied element-wise to arrays of uint64
+UINT64_DIRECTIONS = [(np.uint64(abs(shift)), shift > 0, np.uint64(mask)) for shift, mask in DIRECTIONS]
+UINT64_FULL_MASK = np.uint64(FULL_MASK)
+
+
+def shift_bits_batch(bits, shift, is_left, mask):
+    return ((bits << shift) if is_left else (bits >> shift)) & mask
+
+
+def get_moves_bits_batch(own, opp):
+    """The same as get_moves_bits, where own and opp are arrays of bitboards"""
+    empty = ~(own | opp)
+    moves = np.zeros_like(own)
+    for shift, is_left, mask in UINT64_DIRECTIONS:
+        opp_masked = opp & mask
+        x = shift_bits_batch(own, shift, is_left, mask) & opp_masked
+        for _ in range(5):
+            x |= shift_bits_batch(x, shift, is_left, mask) & opp_masked
+        moves |= shift_bits_batch(x, shift, is_left, mask) & empty
+    return moves
+
+
+def get_flips_bits_batch(move_bits, own, opp):
+    """The same as get_flips_bits, where the moves are given as an array of one-stone bitboards"""
+    flips = np.zeros_like(own)
+    for shift, is_left, mask in UINT64_DIRECTIONS:
+        x = shift_bits_batch(move_bits, shift, is_left, mask) & opp
+        for _ in range(5):
+            x |= shift_bits_batch(x, shift, is_left, mask) & opp
+        bounded = shift_bits_batch(x, shift, is_left, mask) & own
+        flips |= np.where(bounded != 0, x, np.uint64(0))
+    return flips
+
+
+BYTE_BIT_COUNTS = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+
+def count_bits_batch(bits):
+    """The number of stones of every bitboard of an array, by np.bitwise_count (NumPy 2.0+) or else by a byte lookup"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bits).astype(np.int64)
+    bytes_batch = np.ascontiguousarray(bits, dtype='<u8').view(np.uint8).reshape(bits.shape + (8,))
+    return BYTE_BIT_COUNTS[bytes_batch].sum(axis=-1, dtype=np.int64)
+
+
+def bits_2_planes_batch(bits):
+    """Convert an array of N bitboards to an (N, 8, 8) array of 0/1"""
+    bytes_batch = np.ascontiguousarray(bits, dtype='<u8').view(np.uint8).reshape(bits.shape + (8,))
+    return np.unpackbits(bytes_batch, axis=-1, bitorder='little').reshape(bits.shape + (8, 8))
+
+
+class BatchGame:
+    """
+    B games of Othello advanced in lockstep, where every array operation covers all the games at once.
+    A game is stored as in BitboardGame, i.e., as one 64-bit integer per colour, so that the state of the batch is
+    a few arrays of shape (B). Moves are given per game as an array of move Ids, with -1 for PASS; a game which is
+    over ignores its move until it is reset.
+    """
+    def __init__(self, game_num, board_size=8):
+        assert board_size == 8, 'BatchGame only supports the 8 x 8 board'
+        self.game_num = game_num
+        self.board_size = board_size
+        self.black_bits = np.full(game_num, INITIAL_BLACK_BITS, dtype=np.uint64)  # black stones of every game
+        self.white_bits = np.full(game_num, INITIAL_WHITE_BITS, dtype=np.uint64)  # white stones of every game
+        self.black_to_move = np.ones(game_num, dtype=bool)  # whether black is about to put a stone
+        self.pass_num = np.zeros(game_num, dtype=np.int8)  # the number of consecutive passes
+        self.move_num = np.zeros(game_num, dtype=np.int16)  # the number of moves (including PASS) performed
+        self.moves_bits = get_moves_bits_batch(self.black_bits, self.white_bits)  # legal moves of the side to move
+        self.done = np.zeros(game_num, dtype=bool)  # whether a game is over
+
+    def reset(self, game_ids=None):
+        """Put the games specified (all by default) back to the initial state"""
+        if game_ids is None:
+            game_ids = np.arange(self.game_num)
+        self.black_bits[game_ids] = INITIAL_BLACK_BITS
+        self.white_bits[game_ids] = INITIAL_WHITE_BITS
+        self.black_to_move[game_ids] = True
+        self.pass_num[game_ids] = 0
+        self.move_num[game_ids] = 0
+        self.moves_bits[game_ids] = get_moves_bits_batch(self.black_bits[game_ids], self.white_bits[game_ids])
+        self.done[game_ids] = False
+
+    def get_own_opp_bits(self):
+        own = np.where(self.black_to_move, self.black_bits, self.white_bits)
+        opp = np.where(self.black_to_move, self.white_bits, self.black_bits)
+        return own, opp
+
+    def get_legal_moves_mask(self):
+        """(B, 64) boolean array of the legal moves of the side to move, which is all False if it has to pass"""
+        return bits_2_planes_batch(self.moves_bits).reshape(self.game_num, self.board_size ** 2).astype(bool)
+
+    def get_pass_mask(self):
+        """(B) boolean array of the games ongoing, in which the side to move has to pass"""
+        return (self.moves_bits == 0) & ~self.done
+
+    def get_available_moves(self, game_id):
+        """The available moves of one game as returned by Game.get_available_moves, i.e., [-1] for PASS and [] if over"""
+        if self.done[game_id]:
+            return []
+        moves = bits_2_moves(int(self.moves_bits[game_id]))
+        return moves if moves else [-1]
+
+    def move(self, moves):
+        """
+        Perform one move in every game, where moves is an array (B) of move Ids and -1 is PASS.
+        An illegal move raises ValueError, and the games which are over are left unchanged.
+        Return the (B) boolean array of the games which are over.
+        """
+        moves = np.asarray(moves, dtype=np.int64)
+        active = ~self.done
+        is_pass = moves < 0
+        move_bits = np.left_shift(np.uint64(1), np.where(is_pass, 0, moves).astype(np.uint64))
+        move_bits[is_pass] = 0
+        must_pass = self.moves_bits == 0
+        illegal = active & np.where(is_pass, ~must_pass, (move_bits & self.moves_bits) == 0)
+        if illegal.any():
+            raise ValueError('Illegal moves in games {}: {}'.format(np.flatnonzero(illegal).tolist(), moves[illegal].tolist()))
+        move_bits[~active] = 0
+        own, opp = self.get_own_opp_bits()
+        flips = get_flips_bits_batch(move_bits, own, opp)
+        own |= flips | move_bits
+        opp &= ~flips
+        self.black_bits = np.where(active, np.where(self.black_to_move, own, opp), self.black_bits)
+        self.white_bits = np.where(active, np.where(self.black_to_move, opp, own), self.white_bits)
+        self.pass_num = np.where(active, np.where(is_pass, self.pass_num + 1, 0), self.pass_num).astype(np.int8)
+        self.move_num += active
+        self.black_to_move ^= active
+        own, opp = self.get_own_opp_bits()
+        self.moves_bits = np.where(active, get_moves_bits_batch(own, opp), self.moves_bits)
+        self.done = self.done | (self.pass_num >= 2) | (self.black_bits == 0) | (self.white_bits == 0) \
+            | ((self.black_bits | self.white_bits) == UINT64_FULL_MASK)
+        self.moves_bits[self.done] = 0
+        return self.done
+
+    def sample_moves(self, policy=None, rng=np.random):
+        """
+        Sample one legal move per game from policy, a (B, 64) array of non-negative weights (uniform if None).
+        The games which have to pass or are over get -1.
+        """
+        legal = self.get_legal_moves_mask()
+        weights = legal.astype(np.float64) if policy is None else np.where(legal, policy, 0.0)
+        zero_rows = weights.sum(axis=1) <= 0
+        weights[zero_rows] = legal[zero_rows]  # uniform over the legal moves when the policy puts no weight on them
+        cumulative = np.cumsum(weights, axis=1)
+        thresholds = rng.random_sample(self.game_num) * cumulative[:, -1]
+        moves = (cumulative <= thresholds[:, np.newaxis]).sum(axis=1)
+        return np.where(legal.any(axis=1), np.minimum(moves, self.board_size ** 2 - 1), -1)
+
+    def get_feature_planes(self, out=None, dtype=np.float32):
+        """
+        Feature planes of every game as one (B, 4, 8, 8) array, with the same planes as Game.get_feature_planes.
+        They are written into 'out' if given, e.g., a preallocated input buffer of the network.
+        """
+        if out is None:
+            out = np.empty((self.game_num, config.FEATURE_PLANE_NUM, self.board_size, self.board_size), dtype=dtype)
+        empty_bits = ~(self.black_bits | self.white_bits)
+        out[:, :3] = bits_2_planes_batch(np.stack([self.black_bits, self.white_bits, empty_bits], axis=1))
+        out[:, 3] = self.black_to_move[:, np.newaxis, np.newaxis]
+        return out
+
+    def get_black_white_count(self):
+        """The counts of black stones and white stones, as two (B) arrays"""
+        return count_bits_batch(self.black_bits), count_bits_batch(self.white_bits)
+
+    def get_game_status(self):
+        """(B) array of the status of every game, with the same values as Game.get_game_status"""
+        black_num, white_num = self.get_black_white_count()
+        status = np.where(black_num > white_num, 1, np.where(white_num > black_num, 2, 3))
+        return np.where(self.done, status, -1)
+
+    def get_game(self, game_id):
+        """
+        Copy one game of the batch to a BitboardGame, e.g., to be searched by MCTS. The stones played are listed in
+        occupied_stones after the four initial ones, so that the stone counts (and get_history_moves) are right, but
+        in the order of their move Ids, since the move order is not kept; the moves cannot be taken back.
+        """
+        game = BitboardGame(self.board_size)
+        game.initialize_board_info()
+        game.black_bits = int(self.black_bits[game_id])
+        game.white_bits = int(self.white_bits[game_id])
+        game.occupied_stones += [move for move in bits_2_moves(game.black_bits | game.white_bits) if move not in (27, 28, 35, 36)]
+        game.current_player_is_black = bool(self.black_to_move[game_id])
+        game.current_player_id = 1 if game.current_player_is_black else 2
+        game.passed = [True, True] if self.pass_num[game_id] >= 2 else [True, False] if self.pass_num[game_id] else [False, False]
+        game.next_state_avail_moves_id = self.get_available_moves(game_id)
+        game.zobrist_hash = game.compute_zobrist_hash()
+        return game
+
+
+def get_feature_planes_batch(games, out=None, dtype=np.float32):
+    """
+    Feature planes of a list of games as one (N, 4, s, s) array, written into 'out' if given (e.g., the input
+    buffer of a batched forward pass). Bitboard games are converted all at once by bits_2_planes_batch.
+    """
+    if out is None:
+        out = np.empty((len(games), config.FEATURE_PLANE_NUM, games[0].board_size, games[0].board_size), dtype=dtype)
+    if games and all(isinstance(game, BitboardGame) for game in games):
+        black_bits = np.array([game.black_bits for game in games], dtype=np.uint64)
+        white_bits = np.array([game.white_bits for game in games], dtype=np.uint64)
+        out[:, :3] = bits_2_planes_batch(np.stack([black_bits, white_bits, ~(black_bits | white_bits)], axis=1))
+        out[:, 3] = np.array([game.current_player_is_black for game in games])[:, np.newaxis, np.newaxis]
+        return out
+    for i, game in enumerate(games):
+        game.get_feature_planes(out=out[i])
+    return out
+
+
+def create_game(board_size, engine=config.GAME_ENGINE):
+    """Create the game with the engine specified, i.e., 'list' for Game or 'bitboard' for BitboardGame"""
+    if engine == 'bitboard':
+        return BitboardGame(board_size)
+    return Game(board_size)
@@ -0,0 +1,161 @@
+import math
+import os
+import shutil
+import threading
+import torch
+import torch.multiprocessing as mp
+import config
+from game import Game, create_game
+from mcts import create_mcts_player
+from network import resnet, convnet
+
+
+def create_model_player(model_path, net_type=config.TRAIN_WHICH_NET, playout_num=config.EVAL_MCTS_PLAYOUT_NUM):
+    """An MCTSPlayer in evaluation mode, guided by the model saved in model_path"""
+    net_func = (resnet if net_type == 'resnet' else convnet).NetFunction(config.TRAIN_BOARD_SIZE, model_path=model_path)
+    return create_mcts_player(net_func.get_policy_value_for_mcts, playout_num=playout_num, batch_neural_network=net_func.get_policy_value_batch_for_mcts)
+
+
+def play_game(game: Game, player1, player2, round_num):
+    """
+    Play one game between two MCTSPlayers, where player1 is black in even rounds and white in odd rounds.
+    Return 1 if player1 wins, 2 if player2 wins and 3 for a draw.
+    """
+    player1_is_black = round_num % 2 == 0
+    game.initialize_board_info('player1' if player1_is_black else 'player2')
+    while True:
+        mcts_player = player1 if game.is_current_player_black() == player1_is_black else player2
+        game.move(mcts_player.choose_move(game))
+        result_id = game.get_game_status()  # 1 if black wins, 2 if white wins and 3 for a draw
+        if result_id == 3:
+            return 3
+        if result_id in (1, 2):
+            return 1 if (result_id == 1) == player1_is_black else 2
+
+
+def score_2_elo(score):
+    """The Elo difference corresponding to an expected score in (0, 1)"""
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400.0 * math.log10(1.0 / score - 1.0)
+
+
+def elo_2_score(elo):
+    return 1.0 / (1.0 + 10 ** (-elo / 400.0))
+
+
+def get_score_stats(win_num, draw_num, lose_num):
+    """The mean score per game and its variance (per game), counting a draw as half a win"""
+    game_num = win_num + draw_num + lose_num
+    score = (win_num + 0.5 * draw_num) / game_num
+    variance = (win_num * (1 - score) ** 2 + draw_num * (0.5 - score) ** 2 + lose_num * score ** 2) / game_num
+    return score, variance
+
+
+def get_elo_interval(win_num, draw_num, lose_num, z=1.96):
+    """Elo difference and its confidence interval (z=1.96 for 95%), from the normal approximation of the score"""
+    game_num = win_num + draw_num + lose_num
+    if game_num == 0:
+        return 0.0, -math.inf, math.inf
+    score, variance = get_score_stats(win_num, draw_num, lose_num)
+    margin = z * math.sqrt(variance / game_num)
+    return score_2_elo(score), score_2_elo(score - margin), score_2_elo(score + margin)
+
+
+def get_sprt_llr(win_num, draw_num, lose_num, elo0=config.SPRT_ELO0, elo1=config.SPRT_ELO1):
+    """
+    Log-likelihood ratio of H1 (Elo difference elo1) against H0 (elo0), by the normal approximation of the score.
+    The variance per game is estimated with one virtual win and one virtual loss added, so that it stays away from 0
+    when all the games so far ended alike.
+    """
+    game_num = win_num + draw_num + lose_num
+    if game_num == 0:
+        return 0.0
+    score, _ = get_score_stats(win_num, draw_num, lose_num)
+    _, variance = get_score_stats(win_num + 1, draw_num, lose_num + 1)
+    score0, score1 = elo_2_score(elo0), elo_2_score(elo1)
+    return game_num * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+
+def get_sprt_bounds(alpha=config.SPRT_ALPHA, beta=config.SPRT_BETA):
+    """H0 is accepted once the LLR falls below the lower bound, and H1 once it rises above the upper bound"""
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+# The players of a gating process, created once by init_gating_process
+gating_players = {}
+
+
+def init_gating_process(candidate_path, best_path, net_type, playout_num):
+    torch.set_num_threads(1)
+    gating_players['candidate'] = create_model_player(candidate_path, net_type, playout_num)
+    gating_players['best'] = create_model_player(best_path, net_type, playout_num)
+
+
+def play_gating_game(round_num):
+    return play_game(create_game(config.TRAIN_BOARD_SIZE), gating_players['candidate'], gating_players['best'], round_num)
+
+
+class GatingMatch:
+    """
+    A match between a candidate model and the best one, played by a pool of processes in the background while
+    self-play goes on. After every game, a sequential probability ratio test between H0 (Elo difference SPRT_ELO0)
+    and H1 (SPRT_ELO1) decides whether to stop, once min_game_num games are played: 'accept' once H1 holds, 'reject'
+    once H0 holds. If neither holds
+    after max_game_num games, the candidate is accepted if its score reaches EVAL_WIN_RATE_THRESHOLD.
+    The candidate is copied when the match starts, so that its file may be overwritten meanwhile.
+    """
+    def __init__(self, candidate_path, best_path, process_num=config.GATING_PROCESS_NUM, max_game_num=config.GATING_MAX_GAME_NUM,
+                 net_type=config.TRAIN_WHICH_NET, playout_num=config.EVAL_MCTS_PLAYOUT_NUM, min_game_num=config.SPRT_MIN_GAME_NUM):
+        self.candidate_path = candidate_path + '.gating'
+        shutil.copy(candidate_path, self.candidate_path)
+        self.best_path = best_path
+        self.max_game_num = max_game_num
+        self.min_game_num = min_game_num
+        self.win_num, self.draw_num, self.lose_num = 0, 0, 0
+        self.decision = None  # 'accept' or 'reject' once the match is over
+        self.pool = mp.get_context('spawn').Pool(process_num, initializer=init_gating_process,
+                                                 initargs=(self.candidate_path, best_path, net_type, playout_num))
+        self.thread = threading.Thread(target=self.collect_results, daemon=True)
+        self.thread.start()
+
+    def collect_results(self):
+        lower_bound, upper_bound = get_sprt_bounds()
+        for result_id in self.pool.imap_unordered(play_gating_game, range(self.max_game_num)):
+            self.win_num += result_id == 1
+            self.lose_num += result_id == 2
+            self.draw_num += result_id == 3
+            if self.win_num + self.draw_num + self.lose_num < self.min_game_num:
+                continue
+            llr = get_sprt_llr(self.win_num, self.draw_num, self.lose_num)
+            if llr >= upper_bound:
+                self.decision = 'accept'
+                break
+            if llr <= lower_bound:
+                self.decision = 'reject'
+                break
+        else:
+            score, _ = get_score_stats(self.win_num, self.draw_num, self.lose_num)
+            self.decision = 'accept' if score >= config.EVAL_WIN_RATE_THRESHOLD else 'reject'
+        self.pool.terminate()
+
+    def is_over(self):
+        return self.decision is not None
+
+    def report(self):
+        game_num = self.win_num + self.draw_num + self.lose_num
+        elo, elo_lower, elo_upper = get_elo_interval(self.win_num, self.draw_num, self.lose_num)
+        return {'games': game_num, 'win': self.win_num, 'draw': self.draw_num, 'lose': self.lose_num,
+                'score': get_score_stats(self.win_num, self.draw_num, self.lose_num)[0] if game_num else None,
+                'elo': elo, 'elo_95': (elo_lower, elo_upper), 'llr': get_sprt_llr(self.win_num, self.draw_num, self.lose_num),
+                'llr_bounds': get_sprt_bounds(), 'decision': self.decision}
+
+    def promote(self, target_path):
+        """Copy the candidate to target_path, e.g., SAVE_GOOD_MODEL_PATH"""
+        shutil.copy(self.candidate_path, target_path)
+
+    def close(self):
+        """Stop the match if it is still running, and remove the copy of the candidate"""
+        self.pool.terminate()
+        self.thread.join(timeout=5)
+        if os.path.exists(self.candidate_path):
+            os.remove(self.candidate_path)
@@ -1,5 +1,8 @@
 import numpy as np
 import os
+import copy
+import queue
+import threading
 import config
 from tkinter import *
 from tkinter.messagebox import *
@@ -8,6 +11,64 @@ from game import Game
 from mcts import MCTSPlayer
 
 
+class SearchWorker:
+    """
+    Runs the searches of the AI in a background thread, so that the Tk event loop never waits for them.
+    think(game) searches for the move of the AI on a copy of the game, and the GUI collects it by polling get_move()
+    with root.after. ponder(game) keeps searching the position while the human thinks, and the next think re-roots
+    the tree on the human's reply, so that the playouts spent meanwhile count towards the AI's move.
+    """
+    def __init__(self, mcts_player, pondering=config.AI_PONDERING):
+        self.mcts_player = mcts_player
+        if pondering:  # the search while the human thinks is kept and counts towards the AI's move
+            self.mcts_player.reuse_tree = self.mcts_player.count_reused_visits = True
+        self.pondering = pondering
+        self.game_id = 0  # incremented by reset(), so that the move of a search started in a previous game is dropped
+        self.stop_pondering = threading.Event()  # the stop event of the last ponder task, each task having its own
+        self.tasks = queue.Queue()
+        self.moves = queue.Queue()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def reset(self):
+        """Stop pondering and forget the moves of the searches running, e.g., when a new game starts"""
+        self.stop_pondering.set()
+        self.game_id += 1
+        self.tasks.put(('reset', self.game_id, None, None))
+
+    def think(self, game: Game):
+        self.stop_pondering.set()
+        self.tasks.put(('think', self.game_id, copy.deepcopy(game), None))
+
+    def ponder(self, game: Game):
+        if self.pondering:
+            self.stop_pondering = threading.Event()  # a new event, so that a ponder still queued or running stays stopped
+            self.tasks.put(('ponder', self.game_id, copy.deepcopy(game), self.stop_pondering))
+
+    def get_move(self):
+        """The move found by the last think, or None if the search is still running"""
+        while True:
+            try:
+                game_id, move_id = self.moves.get_nowait()
+            except queue.Empty:
+                return None
+            if game_id == self.game_id:
+                return move_id
+
+    def run(self):
+        while True:
+            task, game_id, game, stop_event = self.tasks.get()
+            if task == 'reset':
+                self.mcts_player.rebuild_search_tree()
+            elif task == 'ponder':
+                self.mcts_player.sync_tree(game)  # continue from the subtree of the AI's last move
+                playout_num = self.mcts_player.ponder(game, stop_event.is_set)
+                print('AI pondered {} playouts'.format(playout_num))
+            elif task == 'think':
+                move_id = self.mcts_player.choose_move(game)  # re-roots the tree on the human's reply (see MCTSPlayer.sync_tree)
+                print('AI move {}: {playouts} playouts in {seconds:.2f}s ({stop})'.format(move_id, **self.mcts_player.search_stats))
+                self.moves.put((game_id, move_id))
+
+
 class GUI:
     def __init__(self, board_info):
         self.game: Game = board_info  # get the rule of the game for checking the validation of the human's actions.
@@ -61,6 +122,7 @@ class GUI:
     Once clicked, black stone is the first stone to be put.
     """
     def gui_opt_human_start_btn(self):
+        self.search_worker.reset()
         self.human_vs_human_mode = True
         self.who_first = 'player1'  # Player 1 go first, which represents black correspond to current_player_id = 1.
         self.allow_human_click = True
@@ -75,32 +137,63 @@ class GUI:
     """
     # Pick black side
     def gui_opt_black_btn(self):
+        self.search_worker.reset()
         self.human_vs_human_mode = False
         self.who_first = 'player1'  # Let the player 1 goes first
-        self.allow_human_click = True
         self.gui_draw_board()  # Initialize board and visually
-        self.turn_tips.config(text="Black Round")
         self.game.initialize_board_info(who_first=self.who_first)
+        self.gui_next_turn()
 
     # Pick white side
     def gui_opt_white_btn(self):
+        self.search_worker.reset()
         self.human_vs_human_mode = False
         self.who_first = 'player2'  # Let the player 2 goes first
-        self.allow_human_click = False
         self.gui_draw_board()  # Initialize board visually
-        self.turn_tips.config(text="Black Round")
-        self.gui_board.update()
         self.game.initialize_board_info(who_first=self.who_first)  # Initialize game (not GUI)
-        current_player_id = self.game.get_current_player_id()  # Get the player id who goes the next round
-        if current_player_id == 2:  # We always set the AI's id to 2
-            AI = self.mcts_player
-            move_id = AI.choose_move(self.game)
-            gui_loc_y, gui_loc_x = self.game.move_2_location(move_id)
-            flips = self.gui_draw_flips('black', 'White Round', gui_loc_y, gui_loc_x)
-            self.game.move(move_id, flips)
-            self.gui_board.update()
-            self.turn_tips.config(text="White Round")
+        self.gui_next_turn()  # We always set the AI's id to 2, so the AI searches first
+
+    """
+    Human vs AI mode
+    The AI searches in a background thread (SearchWorker), while the GUI polls for its move with root.after,
+    so that the window keeps responding. The AI may ponder while the human thinks.
+    """
+    def gui_next_turn(self):
+        """After a move in human vs AI mode: pass for a side without moves, then let the AI search or the human click"""
+        while True:
+            status = self.game.get_game_status()
+            if status in (1, 2, 3):
+                self.gui_draw_game_result(status, mode='ha')
+                return
+            current_color = 'black' if self.game.is_current_player_black() else 'white'
+            self.turn_tips.config(text='Black Round' if current_color == 'black' else 'White Round')
+            if self.game.get_available_moves() != [-1]:
+                break
+            showinfo(title='Pass', message=f'{current_color} pass')
+            self.game.move(-1)
+        self.gui_board.update()
+        if self.game.get_current_player_id() == 2:  # AI turn
+            self.allow_human_click = False
+            self.search_worker.think(self.game)
+            self.gui_root.after(config.GUI_POLL_INTERVAL_MS, self.gui_poll_ai_move)
+        else:  # Human turn
             self.allow_human_click = True
+            self.search_worker.ponder(self.game)
+
+    def gui_poll_ai_move(self):
+        """Play the move of the AI once its search is over, otherwise check again later"""
+        if self.human_vs_human_mode or self.game.get_current_player_id() != 2:  # the game was restarted meanwhile
+            return
+        move_id = self.search_worker.get_move()
+        if move_id is None:
+            self.gui_root.after(config.GUI_POLL_INTERVAL_MS, self.gui_poll_ai_move)
+            return
+        current_color = 'black' if self.game.is_current_player_black() else 'white'
+        next_move_tip = 'White Round' if current_color == 'black' else 'Black Round'
+        gui_loc_y, gui_loc_x = self.game.move_2_location(move_id)
+        flips = self.gui_draw_flips(current_color, next_move_tip, gui_loc_y, gui_loc_x)
+        self.game.move(move_id, flips)
+        self.gui_next_turn()
 
     # Draw the game result (Win, lose, draw ...)
     def gui_draw_center_result_text(self, text):
@@ -176,51 +269,16 @@ class GUI:
                 self.gui_draw_game_result(status, mode='hh')
                 return
 
-        # Human vs AI (MCTS): Human turn
-        pass_flag = True
-        while pass_flag and self.human_vs_human_mode is False:
-            if current_player_id == 1 and not self.human_vs_human_mode:
-                current_color = 'black' if self.who_first == 'player1' else 'white'
-                next_move_tip = 'White Round' if self.who_first == 'player1' else 'Black Round'
-                if self.game.get_available_moves() == [-1]:
-                    showinfo(title='Pass', message=f'{current_color} pass')
-                    self.turn_tips.config(text=next_move_tip)
-                    self.game.move(-1)
-                else:
-                    flips = self.gui_draw_flips(current_color, next_move_tip, gui_loc_y, gui_loc_x)
-                    if not flips:
-                        return
-                    self.game.move(human_move, flips)
-                self.allow_human_click = False if self.human_vs_human_mode is False else True
-                self.gui_board.update()
-                # check the result of the game
-                status = self.game.get_game_status()  # 1 2 3 -1
-                if status in (1, 2, 3):
-                    self.gui_draw_game_result(status, mode='ha')
-                    return
-
-            # Human vs AI (MCTS): AI turn
-            current_player_id = self.game.get_current_player_id()
-            if current_player_id == 2 and not self.human_vs_human_mode:
-                current_color = 'white' if self.who_first == 'player1' else 'black'
-                next_move_tip = 'Black Round' if self.who_first == 'player1' else 'White Round'
-                if self.game.get_available_moves() == [-1]:
-                    showinfo(title='Pass', message=f'{current_color} pass')
-                    self.turn_tips.config(text=next_move_tip)
-                    will_pass_flag = self.game.move(-1)
-                else:
-                    AI = self.mcts_player
-                    move_id = AI.choose_move(self.game)
-                    gui_loc_y, gui_loc_x = self.game.move_2_location(move_id)
-                    flips = self.gui_draw_flips(current_color, next_move_tip, gui_loc_y, gui_loc_x)
-                    will_pass_flag = self.game.move(move_id, flips)
-                pass_flag = True if will_pass_flag else False
-                self.allow_human_click = True
-                self.gui_board.update()
-                status = self.game.get_game_status()
-                if status in (1, 2, 3):
-                    self.gui_draw_game_result(status, mode='ha')
-                    return
+        # Human vs AI (MCTS): Human turn, after which the AI searches in the background (see gui_next_turn)
+        if current_player_id == 1 and not self.human_vs_human_mode:
+            current_color = 'black' if self.game.is_current_player_black() else 'white'
+            next_move_tip = 'White Round' if current_color == 'black' else 'Black Round'
+            flips = self.gui_draw_flips(current_color, next_move_tip, gui_loc_y, gui_loc_x)
+            if not flips:
+                return
+            self.game.move(human_move, flips)
+            self.allow_human_click = False
+            self.gui_next_turn()
 
     # Exit the GUI
     @staticmethod
@@ -265,6 +323,7 @@ class GUI:
     def gui(self, mcts_player):
         self.board_size = config.GUI_BOARD_GRID
         self.mcts_player: MCTSPlayer = mcts_player # AI (MCTS) player
+        self.search_worker = SearchWorker(mcts_player)  # the AI searches in a background thread
         self.human_vs_human_mode = False  # True for human vs human, while false for human vs AI
         # GUI style
         sidebar_color = "Moccasin"  # Color of the side bar
@@ -277,6 +336,7 @@ class GUI:
 
         # Create Tkinter
         root = Tk()
+        self.gui_root = root  # used to schedule the polling for the move of the AI
         root.title("Othello")
         root.resizable(width=False, height=False)  # Not allowed to drag the window to change its size.
         # Layout design
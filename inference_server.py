@@ -0,0 +1,170 @@
+import queue
+import time
+from collections import Counter, deque
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+import config
+from game import Game
+from network import resnet, convnet
+from symmetry import SYMMETRY_NUM, SymmetricEvaluator
+
+
+def inference_server_process(net_type, input_buffers, policy_buffers, value_buffers, request_queue, response_queues,
+                             weights_queue, stats_queue, stop_event, max_batch_size, max_wait):
+    """
+    Inference process that owns the model. A request (client_id, row_num, send_time) says that a client has written
+    row_num states into its shared input buffer. Requests are grouped until max_batch_size states are collected or
+    max_wait seconds have passed since the first one, then evaluated by one forward pass; the log-policies and
+    values are written into the shared output buffers of the clients, which are notified on their response queues.
+    A request with client_id -1 asks for the statistics, which are put on stats_queue.
+    """
+    torch.set_num_threads(1)
+    if net_type == 'resnet':
+        net_func = resnet.NetFunction(config.TRAIN_BOARD_SIZE)
+    else:
+        net_func = convnet.NetFunction(config.TRAIN_BOARD_SIZE)
+    net_func.load_state_dict(weights_queue.get())  # wait for the first weights
+    batch_size_histogram = Counter()  # format: {batch size: the number of forward passes}
+    queue_latencies = deque(maxlen=10000)  # seconds between a request being sent and its batch being evaluated
+    request_num = 0
+    while not stop_event.is_set():
+        try:
+            net_func.load_state_dict(weights_queue.get_nowait())
+        except queue.Empty:
+            pass
+        try:
+            request = request_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if request[0] == -1:
+            stats_queue.put(get_server_stats(batch_size_histogram, queue_latencies, request_num))
+            continue
+        # Group the requests into a dynamic batch
+        requests = [request]
+        row_num = request[1]
+        deadline = time.time() + max_wait
+        while row_num < max_batch_size:
+            try:
+                request = request_queue.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                break
+            if request[0] == -1:
+                stats_queue.put(get_server_stats(batch_size_histogram, queue_latencies, request_num))
+                continue
+            requests.append(request)
+            row_num += request[1]
+        batch_start_time = time.time()
+        state_planes = np.concatenate([input_buffers[client_id][:rows].numpy() for client_id, rows, _ in requests])
+        logp_list, value_list = net_func.get_log_policy_value_batch(state_planes)
+        row = 0
+        for client_id, rows, send_time in requests:
+            policy_buffers[client_id][:rows] = torch.from_numpy(logp_list[row:row + rows])
+            value_buffers[client_id][:rows] = torch.from_numpy(value_list[row:row + rows])
+            response_queues[client_id].put(rows)
+            queue_latencies.append(batch_start_time - send_time)
+            row += rows
+        batch_size_histogram[row_num] += 1
+        request_num += len(requests)
+
+
+def get_server_stats(batch_size_histogram, queue_latencies, request_num):
+    latencies = np.array(queue_latencies) * 1000 if queue_latencies else np.zeros(1)
+    forward_num = sum(batch_size_histogram.values())
+    return {'requests': request_num,
+            'forward_passes': forward_num,
+            'mean_batch_size': sum(size * num for size, num in batch_size_histogram.items()) / forward_num if forward_num else 0.0,
+            'batch_size_histogram': dict(sorted(batch_size_histogram.items())),
+            'queue_latency_ms': {'mean': float(latencies.mean()), 'p50': float(np.percentile(latencies, 50)),
+                                 'p95': float(np.percentile(latencies, 95)), 'max': float(latencies.max())}}
+
+
+class InferenceClient:
+    """
+    Drop-in replacement for the neural network callables given to MCTSPlayer, where the evaluation is done by an
+    InferenceServer. It exposes the same inference methods as NetFunction, and can be called like
+    NetFunction.get_policy_value_for_mcts, including the symmetric evaluation of SYMMETRY_EVAL_MODE (applied on the
+    client side, so that its cache belongs to the process using the client). A client is used by one process at a time.
+    """
+    def __init__(self, client_id, input_buffer, policy_buffer, value_buffer, request_queue, response_queue):
+        self.client_id = client_id
+        self.input_buffer = input_buffer  # shared tensor (rows,4,8,8) written by the client
+        self.policy_buffer = policy_buffer  # shared tensor (rows,64) of log-policies written by the server
+        self.value_buffer = value_buffer  # shared tensor (rows) of values written by the server
+        self.request_queue = request_queue
+        self.response_queue = response_queue
+        # 利用棋盘8种对称性的评估方式 (config.SYMMETRY_EVAL_MODE为'none'时不使用)
+        self.symmetric_evaluator = SymmetricEvaluator(self.get_log_policy_value_batch, config.SYMMETRY_EVAL_MODE) if config.SYMMETRY_EVAL_MODE != 'none' else None
+
+    def __call__(self, game: Game):
+        return self.get_policy_value_for_mcts(game)
+
+    def get_log_policy_value_batch(self, state_planes):
+        """Send the states (N,4,8,8) to the server and wait for their log-policies (N,64) and values (N)"""
+        row_num = len(state_planes)
+        self.input_buffer[:row_num] = torch.as_tensor(np.asarray(state_planes, dtype=np.float32))
+        self.request_queue.put((self.client_id, row_num, time.time()))
+        self.response_queue.get()
+        return self.policy_buffer[:row_num].numpy().copy(), self.value_buffer[:row_num].numpy().copy()
+
+    def get_policy_value_for_mcts(self, game: Game):
+        if self.symmetric_evaluator is not None:
+            return self.symmetric_evaluator.get_policy_value_for_mcts(game)
+        avail_move_lists = game.get_available_moves()
+        logp_list, value_list = self.get_log_policy_value_batch(game.get_feature_planes()[np.newaxis])
+        p_list = np.exp(logp_list[0])
+        return zip(avail_move_lists, p_list[avail_move_lists]), float(value_list[0])
+
+    def get_policy_value_batch_for_mcts(self, state_planes, avail_moves_batch):
+        if self.symmetric_evaluator is not None:
+            return self.symmetric_evaluator.get_policy_value_batch_for_mcts(state_planes, avail_moves_batch)
+        logp_list, value_list = self.get_log_policy_value_batch(state_planes)
+        p_list = np.exp(logp_list)
+        return [(zip(avail_moves, p_list[i][avail_moves]), float(value_list[i])) for i, avail_moves in enumerate(avail_moves_batch)]
+
+
+class InferenceServer:
+    """
+    A process owning the model, which serves the leaf evaluations of many MCTS processes with dynamic batching.
+    Every client gets its own shared-memory buffers, so that only small messages go through the queues; they hold
+    SYMMETRY_NUM times the leaves of a batch in 'average' symmetric evaluation, which sends the 8 symmetries of a leaf.
+    """
+    def __init__(self, client_num, net_type=config.TRAIN_WHICH_NET, max_batch_size=config.INFERENCE_MAX_BATCH_SIZE,
+                 max_wait_ms=config.INFERENCE_MAX_WAIT_MS,
+                 client_rows=max(config.MCTS_BATCH_SIZE, 1) * (SYMMETRY_NUM if config.SYMMETRY_EVAL_MODE == 'average' else 1)):
+        context = mp.get_context('spawn')
+        size = config.TRAIN_BOARD_SIZE
+        self.input_buffers = [torch.zeros((client_rows, config.FEATURE_PLANE_NUM, size, size)).share_memory_() for _ in range(client_num)]
+        self.policy_buffers = [torch.zeros((client_rows, size ** 2)).share_memory_() for _ in range(client_num)]
+        self.value_buffers = [torch.zeros(client_rows).share_memory_() for _ in range(client_num)]
+        self.request_queue = context.Queue()
+        self.response_queues = [context.Queue() for _ in range(client_num)]
+        self.weights_queue = context.Queue()
+        self.stats_queue = context.Queue()
+        self.stop_event = context.Event()
+        self.process = context.Process(target=inference_server_process, daemon=True, args=(
+            net_type, self.input_buffers, self.policy_buffers, self.value_buffers, self.request_queue, self.response_queues,
+            self.weights_queue, self.stats_queue, self.stop_event, max_batch_size, max_wait_ms / 1000.0))
+
+    def start(self, state_dict):
+        self.update_weights(state_dict)
+        self.process.start()
+
+    def get_client(self, client_id):
+        return InferenceClient(client_id, self.input_buffers[client_id], self.policy_buffers[client_id],
+                               self.value_buffers[client_id], self.request_queue, self.response_queues[client_id])
+
+    def update_weights(self, state_dict):
+        """The server loads the weights before its next batch"""
+        self.weights_queue.put(state_dict)
+
+    def get_stats(self, timeout=10):
+        """Batch-size histogram, mean batch size and queue latencies (ms) measured by the server"""
+        self.request_queue.put((-1, 0, time.time()))
+        return self.stats_queue.get(timeout=timeout)
+
+    def stop(self, timeout=5):
+        self.stop_event.set()
+        self.process.join(timeout=timeout)
+        if self.process.is_alive():
+            self.process.terminate()
@@ -1,7 +1,13 @@
 import numpy as np
 import copy
+import math
+import os
+import time
 import config
 from game import Game
+from endgame import EndgameSolver, get_empty_num, get_proven_status
+from opening_book import get_opening_book
+from evaluation_cache import EvaluationCache
 
 
 def softmax_func(x):
@@ -95,6 +101,27 @@ class Node:
             node = node.parent
             i += 1
 
+    # Virtual loss for batched search
+    def add_virtual_loss(self, virtual_loss):
+        """
+        Count 'virtual_loss' lost visits on the path from this node up to the root, so that the next
+        selections of a batch are steered towards other leaves while this one waits for the network.
+        """
+        node = self
+        while node:
+            node.visit_num += virtual_loss
+            node.w_value -= virtual_loss
+            node.q_value = 1.0 * node.w_value / node.visit_num
+            node = node.parent
+
+    def revert_virtual_loss(self, virtual_loss):
+        node = self
+        while node:
+            node.visit_num -= virtual_loss
+            node.w_value += virtual_loss
+            node.q_value = 1.0 * node.w_value / node.visit_num if node.visit_num else 0
+            node = node.parent
+
     def get_ucb(self, c_puct):
         u_value = (c_puct * self.prob * np.sqrt(self.parent.visit_num) / (1 + self.visit_num))
         return self.q_value + u_value
@@ -107,15 +134,32 @@ class Node:
 
 
 class MCTSPlayer():
-    def __init__(self, neural_network, playout_num=400, is_selfplay_mode=False):
+    def __init__(self, neural_network, playout_num=400, is_selfplay_mode=False, batch_neural_network=None,
+                 evaluation_cache=None, time_budget=None, opening_book=None):
         self.root = Node(None, 1.0)  # (moveId, prior probability)
         self.is_selfplay_mode = is_selfplay_mode
         self.model = neural_network  # neural network that takes as input the current state and outputs vector p and scalar v
+        # neural network that takes as input a batch of feature planes and available moves, used for batched search
+        self.batch_model = batch_neural_network
+        # transposition table of the evaluations of the network (EvaluationCache), shared by successive searches
+        self.evaluation_cache = evaluation_cache
         self.playout_num = playout_num  # how many the number of playout is performed before a real action is taken
+        self.planes_buffer = None  # float32 (batch, 4, s, s) input of the batch network, which playout_batch fills in place
+        self.time_budget = time_budget  # seconds of search per move in place of playout_num, None for a fixed playout_num
+        self.search_stats = None  # {'playouts', 'seconds', 'stop'} of the last search, 'stop' telling why it ended
+        # Outside self-play (which always re-roots on its own moves), keep the subtree of the moves played between searches
+        self.reuse_tree = config.MCTS_REUSE_TREE and not is_selfplay_mode
+        self.root_moves = None  # the move sequence of the position at the root when the tree is reused, None if unknown
+        self.count_reused_visits = self.reuse_tree  # count the visits already in the tree (reused or pondered) towards playout_num
+        # exact solver of the last ENDGAME_SOLVER_EMPTIES empty cells, in place of the search (root) or of the network (leaves)
+        self.endgame_solver = EndgameSolver() if config.ENDGAME_SOLVER_EMPTIES > 0 else None
+        self.opening_book = opening_book  # OpeningBook played from instead of searching, None to always search
 
     # Perform an playout including selection, expansion, simulation and backup
     def playout(self, copy_game: Game):
+        """Return the number of moves performed on copy_game, so that they can be taken back by undo_move()"""
         current_node = self.root # initialize node
+        depth = 0
         """
         >>>> Selection
         MCTS takes as input the current state and playout starts, traversing from the roor node (or root state)
@@ -128,7 +172,12 @@ class MCTSPlayer():
                 break
             move, current_node = current_node.select()  # repeatedly select nodes according to UCB (i.e., Q + U) until a leaf node is reached
             copy_game.move(move)  # expand the search tree
+            depth += 1
         game_status = copy_game.get_game_status()  # Check if the game is over
+        proven_value = self.get_proven_value(copy_game) if game_status == -1 else None
+        if proven_value is not None:  # solved leaf, no need of the network (nor of expansion)
+            current_node.backup(-proven_value)
+            return depth
         """
         If game is not over, expansion and simulation would be applied.
         If game is over, we directly assign a state value to the leaf node which is also the terminal node. Expansion and simulation would not be applied.
@@ -143,7 +192,7 @@ class MCTSPlayer():
         Finally, expand leaf node's children and assign the prior probabilities to the them (i.e., children).
         """
         # Simulation
-        expanded_nodes_probs, leaf_node_value = current_node.simulate(copy_game, self.model)  # Return the prior probability of each expanded (list), and a value ranging from -1 to 1 (float)
+        expanded_nodes_probs, leaf_node_value = current_node.simulate(copy_game, self.evaluate)  # Return the prior probability of each expanded (list), and a value ranging from -1 to 1 (float)
         # print(len(list(expanded_nodes_probs)))
         # If game is not over
         if game_status == -1:
@@ -152,20 +201,7 @@ class MCTSPlayer():
             current_node.expand(expanded_nodes_probs, add_dirichlet=config.ADD_DIRICHLET_FOR_EXPANSION)
         # If game is over
         else:
-            if game_status == 3:  # If draw
-                leaf_node_value = 0.0
-            else:
-                # If we design custom reward mechanism
-                if config.REWARD_CUSTOM_OPTIONS:
-                    # If black wins
-                    if not copy_game.is_current_player_black():
-                        leaf_node_value = config.BLACK_WIN_SCORE if game_status == copy_game.get_current_player_id() else config.WHITE_LOSE_SCORE
-                    # If white wins
-                    elif copy_game.is_current_player_black():
-                        leaf_node_value = config.WHITE_WIN_SCORE if game_status == copy_game.get_current_player_id() else config.BlACK_LOSE_SCORE
-                # Default reward mechanism
-                else:
-                    leaf_node_value = 1.0 if game_status == copy_game.get_current_player_id() else -1.0
+            leaf_node_value = self.get_terminal_value(copy_game, game_status)
         """
         >>>> Back-propagation
         There are two scenarios requiring backup:
@@ -173,6 +209,123 @@ class MCTSPlayer():
         (2) The terminal node is selected in the selection step
         """
         current_node.backup(-leaf_node_value)
+        return depth
+
+    @staticmethod
+    def get_terminal_value(game: Game, game_status):
+        """The value of a finished game from the perspective of the current player"""
+        if game_status == 3:  # If draw
+            return 0.0
+        # If we design custom reward mechanism
+        if config.REWARD_CUSTOM_OPTIONS:
+            # If black wins
+            if not game.is_current_player_black():
+                return config.BLACK_WIN_SCORE if game_status == game.get_current_player_id() else config.WHITE_LOSE_SCORE
+            # If white wins
+            return config.WHITE_WIN_SCORE if game_status == game.get_current_player_id() else config.BlACK_LOSE_SCORE
+        # Default reward mechanism
+        return 1.0 if game_status == game.get_current_player_id() else -1.0
+
+    def can_solve(self, game: Game, empty_limit):
+        return self.endgame_solver is not None and game.board_size == 8 and get_empty_num(game) <= empty_limit
+
+    def get_proven_value(self, game: Game):
+        """The exact value of a leaf (not over) within ENDGAME_LEAF_EMPTIES empty cells, from the endgame solver, or None"""
+        if not self.can_solve(game, config.ENDGAME_LEAF_EMPTIES):
+            return None
+        score, _ = self.endgame_solver.solve(game)
+        return self.get_terminal_value(game, get_proven_status(game, score))
+
+    def lookup_cache(self, game: Game):
+        """Return the cached (moves_probs, value) of the current state, or None"""
+        if self.evaluation_cache is None:
+            return None
+        return self.evaluation_cache.get(game.get_zobrist_hash(), game.get_available_moves())
+
+    def evaluate(self, game: Game):
+        """Evaluate the current state by the neural network, unless its evaluation is cached"""
+        cached = self.lookup_cache(game)
+        if cached is not None:
+            return cached
+        moves_probs, value = self.model(game)
+        if self.evaluation_cache is not None:
+            moves_probs = list(moves_probs)
+            self.evaluation_cache.put(game.get_zobrist_hash(), moves_probs, value)
+        return moves_probs, value
+
+    def get_planes_buffer(self, game: Game, batch_size):
+        """The buffer the feature planes of the leaves of a batch are written to, reallocated only if too small"""
+        if self.planes_buffer is None or len(self.planes_buffer) < batch_size:
+            self.planes_buffer = np.empty((batch_size, config.FEATURE_PLANE_NUM, game.board_size, game.board_size), dtype=np.float32)
+        return self.planes_buffer
+
+    def evaluate_batch(self, state_planes, avail_moves_batch, keys):
+        """Evaluate a batch of states by the batch network, and cache the results under their Zobrist hashes"""
+        results = self.batch_model(state_planes, avail_moves_batch)
+        if self.evaluation_cache is None:
+            return results
+        results = [(list(moves_probs), value) for moves_probs, value in results]
+        for key, (moves_probs, value) in zip(keys, results):
+            self.evaluation_cache.put(key, moves_probs, value)
+        return results
+
+    def playout_batch(self, game: Game, batch_size):
+        """
+        Perform up to 'batch_size' playouts whose leaves are evaluated by one forward pass of the batch network.
+        Each leaf collected gets a virtual loss, so that the following descents of the batch spread across
+        different leaves. Collection stops early if a descent reaches a leaf already waiting for evaluation.
+        Terminal leaves and leaves found in the evaluation cache are backed up right away.
+        Return the number of playouts performed.
+        """
+        pending_nodes, pending_moves, pending_keys = [], [], []
+        planes_buffer = self.get_planes_buffer(game, batch_size)
+        playout_count = 0
+        for _ in range(batch_size):
+            copy_game = game if config.MCTS_UNDO_PLAYOUT else copy.deepcopy(game)
+            current_node = self.root
+            depth = 0
+            # Selection
+            while not current_node.is_leaf_node():
+                move, current_node = current_node.select()
+                copy_game.move(move)
+                depth += 1
+            game_status = copy_game.get_game_status()
+            proven_value = self.get_proven_value(copy_game) if game_status == -1 else None
+            if game_status != -1:  # terminal leaf
+                current_node.backup(-self.get_terminal_value(copy_game, game_status))
+                playout_count += 1
+            elif proven_value is not None:  # solved leaf
+                current_node.backup(-proven_value)
+                playout_count += 1
+            elif current_node in pending_nodes:  # collision, evaluate what has been collected so far
+                if config.MCTS_UNDO_PLAYOUT:
+                    for _ in range(depth):
+                        copy_game.undo_move()
+                break
+            else:
+                cached = self.lookup_cache(copy_game)
+                if cached is not None:  # transposition already evaluated
+                    current_node.expand(cached[0], add_dirichlet=config.ADD_DIRICHLET_FOR_EXPANSION)
+                    current_node.backup(-cached[1])
+                    playout_count += 1
+                else:
+                    copy_game.get_feature_planes(out=planes_buffer[len(pending_nodes)])
+                    pending_nodes.append(current_node)
+                    pending_moves.append(list(copy_game.get_available_moves()))
+                    pending_keys.append(copy_game.get_zobrist_hash())
+                    current_node.add_virtual_loss(config.VIRTUAL_LOSS)
+            if config.MCTS_UNDO_PLAYOUT:
+                for _ in range(depth):
+                    copy_game.undo_move()
+        if pending_nodes:
+            # Simulation for all the leaves at once, then expansion and back-propagation
+            results = self.evaluate_batch(planes_buffer[:len(pending_nodes)], pending_moves, pending_keys)
+            for node, (expanded_nodes_probs, leaf_node_value) in zip(pending_nodes, results):
+                node.revert_virtual_loss(config.VIRTUAL_LOSS)
+                node.expand(expanded_nodes_probs, add_dirichlet=config.ADD_DIRICHLET_FOR_EXPANSION)
+                node.backup(-leaf_node_value)
+                playout_count += 1
+        return playout_count
 
     # Get the number of visiting the children of root
     def get_move_visit(self):
@@ -187,22 +340,68 @@ class MCTSPlayer():
         If human vs AI, search tree is totally removed,
         while if AI vs AI for self-play, search tree is partially removed.
         """
-        # AI vs AI: Self-play for generating data
-        if last_move:
+        # AI vs AI: Self-play for generating data (or a reply pondered on), if the move was expanded
+        if last_move is not None and last_move in self.root.children:
             self.root = self.root.children[last_move]
             self.root.parent = None
         # Human vs AI
         else:
             self.root = Node(None, 1.0)
+            self.root_moves = None
     
     def perform_mcts(self, game):
         """
         To choose a real move, MCTS combined with neural network would be applied.
-        Given a 'playout_num' (Type: Integer), we perform MCTS with NN 'playout_num' times.
+        Given a 'playout_num' (Type: Integer), we perform MCTS with NN 'playout_num' times, or, given a 'time_budget',
+        as many playouts as the budget allows. Outside self-play (whose labels need the full visit counts), with
+        MCTS_EARLY_STOP the search is skipped for a forced move (a single move or PASS) and stops as soon as the most
+        visited move cannot be overtaken by the playouts left, estimated from the playout rate in time-budgeted mode.
+        A time-budgeted search which runs out of time while the two most visited moves are close gets
+        MCTS_EXTRA_TIME_RATIO of the budget once more.
+        A root within ENDGAME_SOLVER_EMPTIES empty cells is solved instead, and its best move is returned alone.
+        A position of the opening book returns the book moves, with their probabilities in place of the visits.
         """
-        for _ in range(self.playout_num):
-            copy_game = copy.deepcopy(game)  # A new copy game environment for mcts is needed
-            self.playout(copy_game)  # perform mcts one time
+        start_time = time.perf_counter()
+        book_moves = self.opening_book.lookup(game) if self.opening_book is not None else None
+        if book_moves is not None:
+            self.search_stats = {'playouts': 0, 'seconds': time.perf_counter() - start_time, 'stop': 'book'}
+            move_list, prob_list = book_moves
+            if self.is_selfplay_mode and config.OPENING_BOOK_SAMPLE:
+                return move_list, prob_list
+            return [move_list[int(np.argmax(prob_list))]], [1]
+        if self.can_solve(game, config.ENDGAME_SOLVER_EMPTIES) and game.get_game_status() == -1:
+            score, best_move = self.endgame_solver.solve(game)
+            self.search_stats = {'playouts': 0, 'seconds': time.perf_counter() - start_time, 'stop': 'solved', 'score': score}
+            return [best_move], [1]
+        early_stop = config.MCTS_EARLY_STOP and not self.is_selfplay_mode
+        avail_moves = list(game.get_available_moves())
+        if early_stop and len(avail_moves) == 1:
+            self.search_stats = {'playouts': 0, 'seconds': time.perf_counter() - start_time, 'stop': 'forced'}
+            return avail_moves, [1]
+        deadline = start_time + self.time_budget if self.time_budget else None
+        extended = False
+        playout_count, stop = 0, 'playouts'
+        reused_num = self.get_root_visit_num() if self.count_reused_visits else 0
+        while True:
+            if deadline is None:
+                remaining_num = self.playout_num - reused_num - playout_count
+                if remaining_num <= 0:
+                    break
+            else:
+                now = time.perf_counter()
+                if now >= deadline:
+                    if not extended and self.is_close(config.MCTS_CLOSE_VISIT_RATIO):
+                        deadline += self.time_budget * config.MCTS_EXTRA_TIME_RATIO
+                        extended = True
+                        continue
+                    stop = 'time'
+                    break
+                remaining_num = playout_count / (now - start_time) * (deadline - now) if playout_count else math.inf
+            if early_stop and self.is_decided(remaining_num):
+                stop = 'decided'
+                break
+            playout_count += self.playout_steps(game, int(min(max(config.MCTS_BATCH_SIZE, 1), remaining_num)) if deadline is None else max(config.MCTS_BATCH_SIZE, 1))
+        self.search_stats = {'playouts': playout_count, 'seconds': time.perf_counter() - start_time, 'stop': stop}
         """
         Then the IDs of the all available moves, which are the root's children, are returned.
         For each moves, its count of visiting time is returned as well.
@@ -210,8 +409,55 @@ class MCTSPlayer():
         move_list, visit_list = self.get_move_visit()
         return move_list, visit_list  # Return ID of moves and visiting counts of moves.
 
+    def playout_steps(self, game: Game, playout_num):
+        """Perform playout_num playouts, as one batch if the batch network is used, and return the number performed"""
+        if self.batch_model is not None and config.MCTS_BATCH_SIZE > 1:
+            return self.playout_batch(game, playout_num)
+        for _ in range(playout_num):
+            if config.MCTS_UNDO_PLAYOUT:  # play on the real game and take the moves back afterwards
+                for _ in range(self.playout(game)):
+                    game.undo_move()
+            else:
+                copy_game = copy.deepcopy(game)  # A new copy game environment for mcts is needed
+                self.playout(copy_game)  # perform mcts one time
+        return playout_num
+
+    def ponder(self, game: Game, should_stop, max_visit_num=config.AI_PONDER_MAX_VISIT_NUM):
+        """
+        Keep searching the position of game, e.g., while the opponent thinks, until should_stop() returns True or the
+        root has max_visit_num visits. The tree is kept, so that once the opponent replies, rebuild_search_tree(reply)
+        re-roots it and the following choose_move continues from the subtree. Return the number of playouts performed.
+        """
+        playout_count = 0
+        if game.get_game_status() != -1 or self.can_solve(game, config.ENDGAME_SOLVER_EMPTIES):  # nothing to search
+            return playout_count
+        while not should_stop() and self.get_root_visit_num() < max_visit_num:
+            playout_count += self.playout_steps(game, max(config.MCTS_BATCH_SIZE, 1))
+        return playout_count
+
+    def get_root_visit_num(self):
+        """The number of playouts through the children of the root, i.e., the search already in the tree"""
+        return sum(self.get_move_visit()[1])
+
+    def get_top_two_visits(self):
+        """The visit counts of the two most visited children of the root (0 if missing)"""
+        visit_list = sorted(self.get_move_visit()[1], reverse=True) + [0, 0]
+        return visit_list[0], visit_list[1]
+
+    def is_decided(self, remaining_num):
+        """True if the runner-up cannot overtake the most visited move of the root within remaining_num playouts"""
+        best_visit, second_visit = self.get_top_two_visits()
+        return second_visit + remaining_num < best_visit
+
+    def is_close(self, ratio):
+        """True if the runner-up has at least ratio times the visits of the most visited move of the root"""
+        best_visit, second_visit = self.get_top_two_visits()
+        return best_visit > 0 and second_visit >= ratio * best_visit
+
     def choose_move(self, game: Game):
         label_pi = np.zeros(config.GUI_BOARD_SIZE ** 2)  # PI used as label for training
+        if self.reuse_tree:
+            self.sync_tree(game)  # follow the moves played since the last search, e.g., the reply of the opponent
         move_list, visit_list = self.perform_mcts(game)
         # (1) Mode: AI vs AI (self-play)
         if self.is_selfplay_mode:
@@ -242,5 +488,259 @@ class MCTSPlayer():
             move_probs = softmax_func(1.0 / temperature * np.log(np.array(visit_list) + 1e-10))
             real_move = np.random.choice(move_list, p=move_probs)
             label_pi[list(move_list)] = move_probs
-            self.rebuild_search_tree()  # Build new tree after the previous one is abandoned completely
+            if self.reuse_tree:
+                self.advance(real_move)  # keep the subtree of the move chosen
+            else:
+                self.rebuild_search_tree()  # Build new tree after the previous one is abandoned completely
             return real_move
+
+    def advance(self, move):
+        """
+        Re-root the tree on a move observed in the game, played by this player or by its opponent (PASS, i.e., -1,
+        included). The subtree of the move is kept and the rest of the tree is freed; a move which was never
+        expanded starts a new tree.
+        """
+        self.rebuild_search_tree(move)
+        if self.root_moves is not None:
+            self.root_moves.append(move)
+
+    def sync_tree(self, game: Game):
+        """
+        Advance the tree through the moves played in game since the position at its root, or start a new tree if
+        that position is not on the way to the position of game (e.g., a new game)
+        """
+        move_sequence = game.get_move_sequence()
+        if self.root_moves is not None and move_sequence[:len(self.root_moves)] == self.root_moves:
+            for move in move_sequence[len(self.root_moves):]:
+                self.rebuild_search_tree(move)
+        else:
+            self.rebuild_search_tree()
+        self.root_moves = move_sequence
+
+
+# Alternating signs used to back up a value along a path, from the leaf (+) towards the root
+BACKUP_SIGNS = np.array([1.0, -1.0] * 128)
+
+
+class ArrayMCTSPlayer(MCTSPlayer):
+    """
+    The same search as MCTSPlayer, but the tree is kept in preallocated NumPy arrays instead of Node objects.
+    Index 0 is always the root, and the children of a node take up the contiguous block
+    [first_child, first_child + child_count), so that selection is one vectorized PUCT over a slice.
+    The arrays are doubled when full and compacted around the new root when the tree is re-used.
+    """
+    def __init__(self, neural_network, playout_num=400, is_selfplay_mode=False, batch_neural_network=None,
+                 evaluation_cache=None, capacity=config.ARRAY_TREE_CAPACITY, time_budget=None, opening_book=None):
+        super().__init__(neural_network, playout_num, is_selfplay_mode, batch_neural_network, evaluation_cache, time_budget, opening_book)
+        self.root = 0
+        self.visit_num = np.zeros(capacity, dtype=np.int32)  # the number of visiting a node
+        self.w_value = np.zeros(capacity)  # W value of node, where W is the cumulative leaf values.
+        self.q_value = np.zeros(capacity)  # Q value of a node, where it is calculated by w_value / visit_num
+        self.prob = np.zeros(capacity)  # Prior probability of node to be selected
+        self.first_child = np.zeros(capacity, dtype=np.int32)  # index of the first child
+        self.child_count = np.zeros(capacity, dtype=np.int16)  # the number of children, 0 for a leaf node
+        self.parent = np.full(capacity, -1, dtype=np.int32)  # index of the parent, -1 for the root
+        self.move = np.zeros(capacity, dtype=np.int8)  # move Id leading to the node, -1 for PASS
+        self.node_num = 0  # the number of nodes in use
+        self.reset_tree()
+
+    def reset_tree(self):
+        self.node_num = 1
+        self.visit_num[0], self.w_value[0], self.q_value[0], self.prob[0] = 0, 0.0, 0.0, 1.0
+        self.child_count[0], self.parent[0] = 0, -1
+
+    def grow(self):
+        """Double the capacity of the arrays"""
+        for name in ('visit_num', 'w_value', 'q_value', 'prob', 'first_child', 'child_count', 'parent', 'move'):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros_like(array)]))
+
+    def get_memory_usage(self):
+        """Bytes taken by the arrays, and bytes per node in use"""
+        total = sum(getattr(self, name).nbytes for name in
+                    ('visit_num', 'w_value', 'q_value', 'prob', 'first_child', 'child_count', 'parent', 'move'))
+        return total, total / len(self.visit_num)
+
+    # Selection
+    def select(self, node):
+        """Select a child of node according to UCB which computed by Q + U, and return (move, child index)"""
+        start = int(self.first_child[node])
+        end = start + int(self.child_count[node])
+        ucb = self.prob[start:end] * (config.CPUCT * math.sqrt(self.visit_num[node]))
+        ucb /= self.visit_num[start:end] + 1
+        ucb += self.q_value[start:end]
+        child = start + int(ucb.argmax())
+        return int(self.move[child]), child
+
+    # Expansion
+    def expand(self, node, moves_probs, add_dirichlet):
+        """Append the children of node as one block, with the same dirichlet noise option as Node.expand"""
+        moves_probs = list(moves_probs)
+        expanded_nodes_num = len(moves_probs)
+        while self.node_num + expanded_nodes_num > len(self.visit_num):
+            self.grow()
+        start = self.node_num
+        block = slice(start, start + expanded_nodes_num)
+        probs = np.array([prob for _, prob in moves_probs], dtype=np.float64)
+        if add_dirichlet:
+            epsilon = config.DIRICHLET_WEIGHT
+            probs = (1 - epsilon) * probs + epsilon * np.random.dirichlet(config.DIRICHLET_ALPHA * np.ones(expanded_nodes_num))
+        self.move[block] = [move for move, _ in moves_probs]
+        self.prob[block] = probs
+        self.visit_num[block] = 0
+        self.w_value[block] = 0.0
+        self.q_value[block] = 0.0
+        self.child_count[block] = 0
+        self.parent[block] = node
+        self.first_child[node] = start
+        self.child_count[node] = expanded_nodes_num
+        self.node_num += expanded_nodes_num
+
+    # Back-propagation
+    def backup(self, path, leaf_node_value):
+        """Update the nodes of path (from the root to the leaf), where the sign of the value alternates per level"""
+        path = np.array(path)
+        self.visit_num[path] += 1
+        self.w_value[path] += leaf_node_value * BACKUP_SIGNS[len(path) - 1::-1]
+        self.q_value[path] = self.w_value[path] / self.visit_num[path]
+
+    def add_virtual_loss(self, path, virtual_loss):
+        path = np.array(path)
+        self.visit_num[path] += virtual_loss
+        self.w_value[path] -= virtual_loss
+        self.q_value[path] = self.w_value[path] / self.visit_num[path]
+
+    def revert_virtual_loss(self, path, virtual_loss):
+        path = np.array(path)
+        self.visit_num[path] -= virtual_loss
+        self.w_value[path] += virtual_loss
+        visits = self.visit_num[path]
+        self.q_value[path] = np.divide(self.w_value[path], visits, out=np.zeros(len(path)), where=visits > 0)
+
+    def descend(self, game: Game):
+        """Select nodes from the root until a leaf node, performing the moves on game. Return the path of node indices"""
+        node = 0
+        path = [0]
+        while self.child_count[node]:
+            move, node = self.select(node)
+            game.move(move)
+            path.append(node)
+        return path
+
+    def playout(self, copy_game: Game):
+        """Return the number of moves performed on copy_game, so that they can be taken back by undo_move()"""
+        path = self.descend(copy_game)
+        leaf = path[-1]
+        game_status = copy_game.get_game_status()
+        proven_value = self.get_proven_value(copy_game) if game_status == -1 else None
+        if proven_value is not None:
+            leaf_node_value = proven_value
+        elif game_status == -1:
+            expanded_nodes_probs, leaf_node_value = self.evaluate(copy_game)
+            self.expand(leaf, expanded_nodes_probs, add_dirichlet=config.ADD_DIRICHLET_FOR_EXPANSION)
+        else:
+            leaf_node_value = self.get_terminal_value(copy_game, game_status)
+        self.backup(path, -leaf_node_value)
+        return len(path) - 1
+
+    def playout_batch(self, game: Game, batch_size):
+        """See MCTSPlayer.playout_batch"""
+        pending_paths, pending_moves, pending_keys = [], [], []
+        planes_buffer = self.get_planes_buffer(game, batch_size)
+        pending_leaves = set()
+        playout_count = 0
+        for _ in range(batch_size):
+            copy_game = game if config.MCTS_UNDO_PLAYOUT else copy.deepcopy(game)
+            path = self.descend(copy_game)
+            game_status = copy_game.get_game_status()
+            collision = False
+            proven_value = self.get_proven_value(copy_game) if game_status == -1 else None
+            if game_status != -1:  # terminal leaf
+                self.backup(path, -self.get_terminal_value(copy_game, game_status))
+                playout_count += 1
+            elif proven_value is not None:  # solved leaf
+                self.backup(path, -proven_value)
+                playout_count += 1
+            elif path[-1] in pending_leaves:  # collision, evaluate what has been collected so far
+                collision = True
+            else:
+                cached = self.lookup_cache(copy_game)
+                if cached is not None:  # transposition already evaluated
+                    self.expand(path[-1], cached[0], add_dirichlet=config.ADD_DIRICHLET_FOR_EXPANSION)
+                    self.backup(path, -cached[1])
+                    playout_count += 1
+                else:
+                    pending_leaves.add(path[-1])
+                    copy_game.get_feature_planes(out=planes_buffer[len(pending_paths)])
+                    pending_paths.append(path)
+                    pending_moves.append(list(copy_game.get_available_moves()))
+                    pending_keys.append(copy_game.get_zobrist_hash())
+                    self.add_virtual_loss(path, config.VIRTUAL_LOSS)
+            if config.MCTS_UNDO_PLAYOUT:
+                for _ in range(len(path) - 1):
+                    copy_game.undo_move()
+            if collision:
+                break
+        if pending_paths:
+            results = self.evaluate_batch(planes_buffer[:len(pending_paths)], pending_moves, pending_keys)
+            for path, (expanded_nodes_probs, leaf_node_value) in zip(pending_paths, results):
+                self.revert_virtual_loss(path, config.VIRTUAL_LOSS)
+                self.expand(path[-1], expanded_nodes_probs, add_dirichlet=config.ADD_DIRICHLET_FOR_EXPANSION)
+                self.backup(path, -leaf_node_value)
+                playout_count += 1
+        return playout_count
+
+    def get_move_visit(self):
+        start = self.first_child[0]
+        end = start + self.child_count[0]
+        return self.move[start:end].tolist(), self.visit_num[start:end].tolist()
+
+    def rebuild_search_tree(self, last_move=None):
+        """Keep the subtree under last_move (compacted to the front of the arrays), or start a new tree"""
+        if last_move is not None and self.child_count[0]:
+            start = self.first_child[0]
+            matches = np.flatnonzero(self.move[start:start + self.child_count[0]] == last_move)
+            if len(matches):
+                self.compact(start + int(matches[0]))
+                return
+        self.reset_tree()
+        self.root_moves = None
+
+    def compact(self, new_root):
+        """Move the subtree of new_root to the front of the arrays in breadth-first order, new_root becoming index 0"""
+        order = [new_root]  # old indices, in the new order
+        i = 0
+        while i < len(order):
+            count = self.child_count[order[i]]
+            if count:
+                start = self.first_child[order[i]]
+                order.extend(range(start, start + count))  # children blocks stay contiguous
+            i += 1
+        order = np.array(order)
+        new_index = np.zeros(self.node_num, dtype=np.int32)
+        new_index[order] = np.arange(len(order), dtype=np.int32)
+        node_num = len(order)
+        for name in ('visit_num', 'w_value', 'q_value', 'prob', 'child_count', 'move'):
+            array = getattr(self, name)
+            array[:node_num] = array[order]
+        first_child = np.where(self.child_count[:node_num] > 0, self.first_child[order], 0)  # leaves may hold stale indices
+        self.first_child[:node_num] = new_index[first_child]
+        self.parent[:node_num] = new_index[self.parent[order]]
+        self.parent[0] = -1
+        self.node_num = node_num
+
+
+def create_mcts_player(neural_network, playout_num=400, is_selfplay_mode=False, batch_neural_network=None,
+                       tree=config.MCTS_TREE, time_budget=None):
+    """
+    Create the MCTS player with the tree specified, i.e., 'node' for MCTSPlayer or 'array' for ArrayMCTSPlayer.
+    The player gets its own evaluation cache unless EVAL_CACHE_SIZE is 0. With a time_budget (seconds per move),
+    the player searches for that long instead of playout_num playouts. The opening book of OPENING_BOOK_PATH, if any,
+    is loaded once per process and shared by the players.
+    """
+    evaluation_cache = EvaluationCache(config.EVAL_CACHE_SIZE) if config.EVAL_CACHE_SIZE > 0 else None
+    opening_book = get_opening_book(config.OPENING_BOOK_PATH) if config.OPENING_BOOK_PATH and os.path.exists(config.OPENING_BOOK_PATH) else None
+    if tree == 'array':
+        return ArrayMCTSPlayer(neural_network, playout_num, is_selfplay_mode, batch_neural_network, evaluation_cache,
+                               time_budget=time_budget, opening_book=opening_book)
+    return MCTSPlayer(neural_network, playout_num, is_selfplay_mode, batch_neural_network, evaluation_cache, time_budget, opening_book)
@@ -5,8 +5,9 @@ import torch.optim as optim
 import torch.nn.functional as F
 import numpy as np
 import config
-import random
 from game import Game
+from network.trainer import Trainer
+from symmetry import SymmetricEvaluator
 
 DEVICE = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
@@ -71,11 +72,11 @@ class ConvNet(nn.Module):
         x = F.relu(self.conv3(x))
         # 动作概率层
         probability = F.relu(self.p_conv1(x))
-        probability = probability.view(-1, 4 * self.board_size**2)  # 4d->2d:输出size-(1,size*size)
+        probability = probability.reshape(-1, 4 * self.board_size**2)  # 4d->2d:输出size-(1,size*size), reshape兼容量化卷积输出的channels_last布局
         probability = F.log_softmax(self.p_fc1(probability), dim=1)  # 先softmax得出概率再log
         # 状态价值层
         value = F.relu(self.value_conv1(x))
-        value = value.view(-1, 2 * self.board_size**2)
+        value = value.reshape(-1, 2 * self.board_size**2)
         value = F.relu(self.value_fc1(value))
         value = torch.tanh(self.value_fc2(value))
         return probability, value
@@ -93,9 +94,15 @@ class NetFunction:
         # 读取训练好的模型
         if model_path:
             self.cnn.load_state_dict(torch.load(model_path))
+        # 训练循环 (优化器与学习率衰减器跨轮次保持)
+        self.trainer = Trainer(self.cnn, self.optimizer, use_gpu=self.use_gpu)
+        # 利用棋盘8种对称性的评估方式 (config.SYMMETRY_EVAL_MODE为'none'时不使用)
+        self.symmetric_evaluator = SymmetricEvaluator(self.get_log_policy_value_batch, config.SYMMETRY_EVAL_MODE) if config.SYMMETRY_EVAL_MODE != 'none' else None
 
     # 输出向量p/标量v 用于指导mcts模拟
     def get_policy_value_for_mcts(self, game: Game):
+        if self.symmetric_evaluator is not None:
+            return self.symmetric_evaluator.get_policy_value_for_mcts(game)
         avail_move_lists = game.get_available_moves()
         # input:size-(4,8,8)
         # Error:some of the strides of a given numpy array are negative... -> np.ascontiguousarray
@@ -107,42 +114,38 @@ class NetFunction:
         # 输出(move序号, 先验概率) 以及 局面价值
         return p_list, value.item()
 
+    # 批量输出向量p/标量v 用于batch mcts: state_planes size-(N,4,8,8), avail_moves_batch为N个可行move列表
+    def get_policy_value_batch_for_mcts(self, state_planes, avail_moves_batch):
+        if self.symmetric_evaluator is not None:
+            return self.symmetric_evaluator.get_policy_value_batch_for_mcts(state_planes, avail_moves_batch)
+        logp_list, value_list = self.get_log_policy_value_batch(state_planes)
+        p_list = np.exp(logp_list)
+        # 每个局面输出(move序号, 先验概率) 以及 局面价值
+        return [(zip(avail_moves, p_list[i][avail_moves]), float(value_list[i])) for i, avail_moves in enumerate(avail_moves_batch)]
+
+    # 批量前向传播: 输入size-(N,4,8,8), 输出log概率size-(N,size*size)与价值size-(N)的numpy数组
+    def get_log_policy_value_batch(self, state_planes):
+        state_planes = torch.as_tensor(np.ascontiguousarray(state_planes)).float()
+        with torch.no_grad():
+            logp_list, value_list = self.cnn(state_planes.cuda()) if self.use_gpu else self.cnn(state_planes)
+        return logp_list.cpu().numpy(), value_list.cpu().numpy().flatten()
+
     # 训练模型
     def training(self, dataset):
-        # 从数据集抽取若干数据
-        batch_data = random.sample(dataset, config.BATCH_SIZE)
-        state_list = [data[0] for data in batch_data]
-        mcts_pi_list = [data[1] for data in batch_data]
-        mcts_z_list = [data[2] for data in batch_data]
-        # 数据转tensor
-        state_list = torch.tensor(state_list).cuda().float() if self.use_gpu else torch.tensor(state_list).float()
-        mcts_pi_list = torch.tensor(mcts_pi_list).cuda().float() if self.use_gpu else torch.tensor(mcts_pi_list).float()
-        mcts_z_list = torch.tensor(mcts_z_list).cuda().float() if self.use_gpu else torch.tensor(mcts_z_list).float()
-        aggregate_loss, value_loss, policy_loss = 0.0, 0.0, 0.0
-        # 一组batch训练epochs次 也相当于数据集训练了epochs次
-        for _ in range(config.EPOCHS):
-            # --优化器-- #
-            # 清空梯度
-            self.optimizer.zero_grad()
-            # 设定学习率
-            # for param_group in self.optimizer[0].param_groups:  # 优化器的param_groups（字典）
-            #     param_group['lr'] = lr
-            # 设定学习率衰减器
-            # mode为min->loss停止下降 乘以factor使得lr下降; max->监控量停止上升则乘以factor
-            scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(self.optimizer, mode='min', factor=0.9, patience=20)
-            # 前向传播
-            output_log_p_list, output_value_list = self.cnn(state_list)
-            # Loss = (z - v)^2 - pi^T * log(p) + c||theta||^2
-            # 计算Loss
-            value_loss = F.mse_loss(output_value_list.view(-1), mcts_z_list)  # 均方差损失
-            policy_loss = -torch.mean(torch.sum(mcts_pi_list * output_log_p_list, 1))  # 交叉熵损失
-            aggregate_loss = value_loss + policy_loss  # 总损失
-            # 反向传播
-            aggregate_loss.backward()
-            # 更新参数
-            self.optimizer.step()
-            scheduler.step(aggregate_loss)
-        return aggregate_loss.item(), value_loss.item(), policy_loss.item()
+        # 一轮训练: TRAIN_BATCHES_PER_ROUND次参数更新, 每次使用新抽取的mini-batch (见network/trainer.py)
+        aggregate_loss, value_loss, policy_loss = self.trainer.train_round(dataset)
+        if self.symmetric_evaluator is not None:
+            self.symmetric_evaluator.clear()  # 网络已更新, 缓存的评估已过期
+        return aggregate_loss, value_loss, policy_loss
+
+    # 获取/载入网络参数 (用于多进程间同步权重)
+    def get_state_dict(self):
+        return {key: value.cpu() for key, value in self.cnn.state_dict().items()}
+
+    def load_state_dict(self, state_dict):
+        self.cnn.load_state_dict(state_dict)
+        if self.symmetric_evaluator is not None:
+            self.symmetric_evaluator.clear()
 
     # 保存模型
     def save_model(self, model_path):
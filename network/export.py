@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import argparse
+import copy
+import os
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+import config
+from game import Game
+from symmetry import SymmetricEvaluator
+
+try:
+    import onnxruntime
+except ImportError:  # ONNX是可选的, 未安装时只能导出/使用TorchScript
+    onnxruntime = None
+
+
+# 由NetFunction保存的参数文件(state_dict)创建网络
+def load_net(model_path, net_type=config.TRAIN_WHICH_NET, board_size=config.TRAIN_BOARD_SIZE):
+    from network import resnet, convnet
+    net = resnet.ResNet(board_size) if net_type == 'resnet' else convnet.ConvNet(board_size)
+    net.load_state_dict(torch.load(model_path, map_location='cpu'))
+    return net.eval()
+
+
+# 将BatchNorm融合进其前面的卷积: y = gamma * (conv(x) - mean) / sqrt(var + eps) + beta 合并为一个卷积的权重与偏置
+def fuse_conv_bn(net):
+    """A copy of net in eval mode, where every Conv2d directly followed by a BatchNorm2d in an nn.Sequential is fused with it"""
+    net = copy.deepcopy(net).eval()
+    for module in net.modules():
+        if not isinstance(module, nn.Sequential):
+            continue
+        names = list(module._modules)
+        for name, next_name in zip(names, names[1:]):
+            conv, bn = module._modules[name], module._modules[next_name]
+            if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+                module._modules[name] = fuse_conv_bn_eval(conv, bn)
+                module._modules[next_name] = nn.Identity()
+    return net
+
+
+def export_torchscript(net, export_path, board_size=config.TRAIN_BOARD_SIZE):
+    """Trace the Conv+BN-fused net, freeze it (weights folded in as constants) and save it to export_path"""
+    example = torch.zeros(1, config.FEATURE_PLANE_NUM, board_size, board_size)
+    with torch.no_grad():
+        script = torch.jit.freeze(torch.jit.trace(fuse_conv_bn(net), example))
+    script.save(export_path)
+    return export_path
+
+
+def export_onnx(net, export_path, board_size=config.TRAIN_BOARD_SIZE):
+    """Export the Conv+BN-fused net to ONNX, with a dynamic batch size"""
+    example = torch.zeros(1, config.FEATURE_PLANE_NUM, board_size, board_size)
+    torch.onnx.export(fuse_conv_bn(net), example, export_path, input_names=['state'], output_names=['log_p', 'value'],
+                      dynamic_axes={'state': {0: 'batch'}, 'log_p': {0: 'batch'}, 'value': {0: 'batch'}}, dynamo=False)
+    return export_path
+
+
+# 使用导出的模型进行推理, 接口与NetFunction的推理部分一致
+class InferenceBackend:
+    """
+    CPU inference on a model exported by export_torchscript (any path) or export_onnx (a path ending with .onnx,
+    run by onnxruntime if installed). It stands in for NetFunction when creating an MCTSPlayer, i.e.,
+    create_mcts_player(backend.get_policy_value_for_mcts, batch_neural_network=backend.get_policy_value_batch_for_mcts).
+    """
+    def __init__(self, export_path, thread_num=None):
+        if thread_num is not None:
+            torch.set_num_threads(thread_num)
+        self.is_onnx = export_path.endswith('.onnx')
+        if self.is_onnx:
+            if onnxruntime is None:
+                raise ImportError('onnxruntime is required to run {}'.format(export_path))
+            options = onnxruntime.SessionOptions()
+            if thread_num is not None:
+                options.intra_op_num_threads = thread_num
+            self.session = onnxruntime.InferenceSession(export_path, options, providers=['CPUExecutionProvider'])
+        else:
+            self.script = torch.jit.load(export_path, map_location='cpu').eval()
+        # 利用棋盘8种对称性的评估方式 (config.SYMMETRY_EVAL_MODE为'none'时不使用)
+        self.symmetric_evaluator = SymmetricEvaluator(self.get_log_policy_value_batch, config.SYMMETRY_EVAL_MODE) if config.SYMMETRY_EVAL_MODE != 'none' else None
+
+    # 批量前向传播: 输入size-(N,4,8,8), 输出log概率size-(N,size*size)与价值size-(N)的numpy数组
+    def get_log_policy_value_batch(self, state_planes):
+        state_planes = np.ascontiguousarray(state_planes, dtype=np.float32)
+        if self.is_onnx:
+            logp_list, value_list = self.session.run(None, {'state': state_planes})
+            return logp_list, value_list.flatten()
+        with torch.inference_mode():
+            logp_list, value_list = self.script(torch.from_numpy(state_planes))
+        return logp_list.numpy(), value_list.numpy().flatten()
+
+    # 输出向量p/标量v 用于指导mcts模拟
+    def get_policy_value_for_mcts(self, game: Game):
+        if self.symmetric_evaluator is not None:
+            return self.symmetric_evaluator.get_policy_value_for_mcts(game)
+        avail_move_lists = game.get_available_moves()
+        logp_list, value_list = self.get_log_policy_value_batch(game.get_feature_planes()[np.newaxis])
+        p_list = np.exp(logp_list[0])
+        return zip(avail_move_lists, p_list[avail_move_lists]), float(value_list[0])
+
+    # 批量输出向量p/标量v 用于batch mcts
+    def get_policy_value_batch_for_mcts(self, state_planes, avail_moves_batch):
+        if self.symmetric_evaluator is not None:
+            return self.symmetric_evaluator.get_policy_value_batch_for_mcts(state_planes, avail_moves_batch)
+        logp_list, value_list = self.get_log_policy_value_batch(state_planes)
+        p_list = np.exp(logp_list)
+        return [(zip(avail_moves, p_list[i][avail_moves]), float(value_list[i])) for i, avail_moves in enumerate(avail_moves_batch)]
+
+
+# 测量前向传播的延迟: 返回{batch大小: 每次前向传播的毫秒数}
+def benchmark_latency(log_policy_value_batch, batch_sizes=(1, 16, 64), repeat_num=200, board_size=config.TRAIN_BOARD_SIZE):
+    latency = {}
+    for batch_size in batch_sizes:
+        state_planes = np.random.randint(0, 2, size=(batch_size, config.FEATURE_PLANE_NUM, board_size, board_size)).astype(np.float32)
+        for _ in range(10):  # 预热
+            log_policy_value_batch(state_planes)
+        start_time = time.perf_counter()
+        for _ in range(repeat_num):
+            log_policy_value_batch(state_planes)
+        latency[batch_size] = (time.perf_counter() - start_time) / repeat_num * 1000
+    return latency
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export a model saved by NetFunction for fast CPU inference')
+    parser.add_argument('model_path', help='the state_dict saved by NetFunction.save_model')
+    parser.add_argument('export_path', help='the exported model, in ONNX if it ends with .onnx and in TorchScript otherwise')
+    parser.add_argument('--net-type', choices=['cnn', 'resnet'], default=config.TRAIN_WHICH_NET)
+    parser.add_argument('--benchmark', action='store_true', help='compare the latency of the exported model with the eager one')
+    args = parser.parse_args()
+    eager_net = load_net(args.model_path, args.net_type)
+    (export_onnx if args.export_path.endswith('.onnx') else export_torchscript)(eager_net, args.export_path)
+    print('Exported to {} ({:.1f} KB)'.format(args.export_path, os.path.getsize(args.export_path) / 1024))
+    backend = InferenceBackend(args.export_path)
+    # 导出前后输出一致性检查
+    check_planes = np.random.randint(0, 2, size=(64, config.FEATURE_PLANE_NUM, config.TRAIN_BOARD_SIZE, config.TRAIN_BOARD_SIZE)).astype(np.float32)
+    with torch.no_grad():
+        eager_logp, eager_value = eager_net(torch.from_numpy(check_planes))
+    export_logp, export_value = backend.get_log_policy_value_batch(check_planes)
+    print('Max difference to the eager model: log_p {:.2e}, value {:.2e}'.format(
+        np.abs(eager_logp.numpy() - export_logp).max(), np.abs(eager_value.numpy().flatten() - export_value).max()))
+    if args.benchmark:
+        def eager_log_policy_value_batch(state_planes):
+            with torch.no_grad():
+                return eager_net(torch.from_numpy(state_planes))
+        eager_latency, export_latency = benchmark_latency(eager_log_policy_value_batch), benchmark_latency(backend.get_log_policy_value_batch)
+        for batch_size in eager_latency:
+            print('Batch {:>3}: eager {:.3f} ms, exported {:.3f} ms ({:.2f}x)'.format(
+                batch_size, eager_latency[batch_size], export_latency[batch_size], eager_latency[batch_size] / export_latency[batch_size]))
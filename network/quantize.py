@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import os
+import numpy as np
+import torch
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+import config
+from dataset import read_index, load_shard
+from game import create_game
+from gating import create_model_player, play_game
+from mcts import create_mcts_player
+from network.export import load_net, InferenceBackend, benchmark_latency
+from replay_buffer import ReplayBuffer
+
+QUANTIZED_ENGINE = 'x86'  # 'x86' (fbgemm与onednn) 用于x86 CPU, ARM CPU则使用'qnnpack'
+
+
+# 读取已保存的自对弈局面作为校准数据: ReplayBuffer的目录(meta.json)或自对弈日志的目录(index.json)
+def load_calibration_positions(data_path, position_num, seed=0):
+    """Return float32 states (N,4,s,s) of at most position_num positions drawn at random from data_path"""
+    rng = np.random.RandomState(seed)
+    if os.path.exists(os.path.join(data_path, 'meta.json')):
+        with open(os.path.join(data_path, 'meta.json')) as f:
+            meta = json.load(f)
+        replay_buffer = ReplayBuffer(meta['capacity'], meta['board_size'], path=data_path)
+        indices = rng.choice(len(replay_buffer), size=min(position_num, len(replay_buffer)), replace=False)
+        return replay_buffer.get_positions(np.sort(indices))[0]
+    state_planes, loaded_num = [], 0
+    shards = read_index(data_path)['shards']
+    for shard_id in rng.permutation(len(shards)):  # 只解码足够数量的分片
+        state_planes.append(load_shard(data_path, shards[shard_id])[0])
+        loaded_num += len(state_planes[-1])
+        if loaded_num >= position_num:
+            break
+    if not state_planes:
+        raise ValueError('No positions found in {}'.format(data_path))
+    state_planes = np.concatenate(state_planes)
+    return state_planes[rng.permutation(len(state_planes))[:position_num]].astype(np.float32)
+
+
+# 训练后静态量化: 在校准局面上统计各层激活的范围, 权重与激活均量化为INT8
+def quantize_net(net, calibration_planes, batch_size=256, engine=QUANTIZED_ENGINE):
+    """
+    Post-training static quantization of a ConvNet/ResNet by FX graph mode: Conv+BN(+ReLU) are fused, observers
+    record the activation ranges over calibration_planes (N,4,s,s), and the net is converted to INT8 kernels.
+    """
+    torch.backends.quantized.engine = engine
+    net = net.eval()
+    calibration_planes = torch.as_tensor(calibration_planes, dtype=torch.float32)
+    prepared_net = prepare_fx(net, get_default_qconfig_mapping(engine), example_inputs=(calibration_planes[:1],))
+    with torch.no_grad():
+        for start in range(0, len(calibration_planes), batch_size):
+            prepared_net(calibration_planes[start:start + batch_size])
+    return convert_fx(prepared_net)
+
+
+def export_quantized(net, export_path, calibration_planes, engine=QUANTIZED_ENGINE):
+    """Quantize net and save it as a frozen TorchScript model, which InferenceBackend loads like any exported model"""
+    quantized_net = quantize_net(net, calibration_planes, engine=engine)
+    with torch.no_grad():
+        script = torch.jit.freeze(torch.jit.trace(quantized_net, torch.as_tensor(calibration_planes[:1], dtype=torch.float32)))
+    script.save(export_path)
+    return export_path
+
+
+# 量化前后的精度偏差: 策略的KL散度KL(p_fp32 || p_int8)与价值的均方差
+def measure_drift(fp32_log_policy_value_batch, int8_log_policy_value_batch, state_planes, batch_size=256):
+    kl_list, squared_error_list = [], []
+    for start in range(0, len(state_planes), batch_size):
+        batch = state_planes[start:start + batch_size]
+        (fp32_logp, fp32_value), (int8_logp, int8_value) = fp32_log_policy_value_batch(batch), int8_log_policy_value_batch(batch)
+        kl_list.append(np.sum(np.exp(fp32_logp) * (fp32_logp - int8_logp), axis=1))
+        squared_error_list.append((fp32_value - int8_value) ** 2)
+    return {'policy_kl': float(np.mean(np.concatenate(kl_list))), 'value_mse': float(np.mean(np.concatenate(squared_error_list)))}
+
+
+# INT8模型与FP32模型在相同模拟次数下对弈, 返回INT8模型的得分率 (平局计0.5)
+def measure_score(fp32_player, int8_player, game_num, board_size=config.TRAIN_BOARD_SIZE):
+    win_num, draw_num = 0, 0
+    for round_num in range(game_num):
+        result_id = play_game(create_game(board_size), int8_player, fp32_player, round_num)
+        win_num += result_id == 1
+        draw_num += result_id == 3
+    return (win_num + 0.5 * draw_num) / game_num if game_num else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Quantize a model saved by NetFunction to INT8, calibrated on stored self-play positions')
+    parser.add_argument('model_path', help='the state_dict saved by NetFunction.save_model')
+    parser.add_argument('export_path', help='the INT8 TorchScript model, loaded by network.export.InferenceBackend (e.g., AI_EXPORTED_MODEL_PATH)')
+    parser.add_argument('--net-type', choices=['cnn', 'resnet'], default=config.TRAIN_WHICH_NET)
+    parser.add_argument('--data', default=config.REPLAY_BUFFER_PATH or config.SELFPLAY_DATA_PATH,
+                        help='replay buffer (REPLAY_BUFFER_PATH) or self-play log (SELFPLAY_DATA_PATH) to calibrate and measure drift on')
+    parser.add_argument('--calibration-num', type=int, default=2048, help='positions to calibrate on')
+    parser.add_argument('--eval-num', type=int, default=2048, help='other positions to measure the drift on')
+    parser.add_argument('--games', type=int, default=20, help='games of INT8 against FP32, 0 to skip')
+    parser.add_argument('--playouts', type=int, default=config.EVAL_MCTS_PLAYOUT_NUM, help='playouts per move of both sides')
+    args = parser.parse_args()
+    if args.data is None:
+        parser.error('--data is required when neither REPLAY_BUFFER_PATH nor SELFPLAY_DATA_PATH is set')
+    positions = load_calibration_positions(args.data, args.calibration_num + args.eval_num)
+    calibration_planes, eval_planes = positions[:args.calibration_num], positions[args.calibration_num:]
+    fp32_net = load_net(args.model_path, args.net_type)
+    export_quantized(fp32_net, args.export_path, calibration_planes)
+    print('Calibrated on {} positions, exported to {} ({:.1f} KB, FP32 state_dict {:.1f} KB)'.format(
+        len(calibration_planes), args.export_path, os.path.getsize(args.export_path) / 1024, os.path.getsize(args.model_path) / 1024))
+    int8_backend = InferenceBackend(args.export_path)
+
+    def fp32_log_policy_value_batch(state_planes):
+        with torch.no_grad():
+            logp_list, value_list = fp32_net(torch.as_tensor(state_planes, dtype=torch.float32))
+        return logp_list.numpy(), value_list.numpy().flatten()
+
+    if len(eval_planes):
+        print('Drift on {} positions: {}'.format(len(eval_planes), measure_drift(fp32_log_policy_value_batch, int8_backend.get_log_policy_value_batch, eval_planes)))
+    fp32_latency, int8_latency = benchmark_latency(fp32_log_policy_value_batch), benchmark_latency(int8_backend.get_log_policy_value_batch)
+    for batch_size in fp32_latency:
+        print('Batch {:>3}: FP32 {:.0f} positions/s, INT8 {:.0f} positions/s ({:.2f}x)'.format(
+            batch_size, batch_size * 1000 / fp32_latency[batch_size], batch_size * 1000 / int8_latency[batch_size], fp32_latency[batch_size] / int8_latency[batch_size]))
+    if args.games:
+        fp32_player = create_model_player(args.model_path, args.net_type, args.playouts)
+        int8_player = create_mcts_player(int8_backend.get_policy_value_for_mcts, playout_num=args.playouts,
+                                         batch_neural_network=int8_backend.get_policy_value_batch_for_mcts)
+        print('Score of INT8 against FP32 over {} games with {} playouts: {:.3f}'.format(
+            args.games, args.playouts, measure_score(fp32_player, int8_player, args.games)))
@@ -5,8 +5,9 @@ import torch.optim as optim
 import torch.nn.functional as F
 import numpy as np
 import config
-import random
 from game import Game
+from network.trainer import Trainer
+from symmetry import SymmetricEvaluator
 from torch.autograd import Variable
 
 
@@ -16,7 +17,7 @@ class Flatten(nn.Module):
         super(Flatten, self).__init__()
 
     def forward(self, x):
-        return x.view(x.size(0), -1)
+        return x.reshape(x.size(0), -1)  # reshape兼容量化卷积输出的channels_last布局
 
 
 class BasicBlock(nn.Module):
@@ -90,53 +91,58 @@ class NetFunction:
         # 读取训练好的模型
         if model_path:
             self.resnet.load_state_dict(torch.load(model_path))
+        # 训练循环 (优化器与学习率衰减器跨轮次保持)
+        self.trainer = Trainer(self.resnet, self.optimizer, use_gpu=self.use_gpu)
+        # 利用棋盘8种对称性的评估方式 (config.SYMMETRY_EVAL_MODE为'none'时不使用)
+        self.symmetric_evaluator = SymmetricEvaluator(self.get_log_policy_value_batch, config.SYMMETRY_EVAL_MODE) if config.SYMMETRY_EVAL_MODE != 'none' else None
 
     # 输出p向量/v值用于指导mcts扩展和模拟
     def get_policy_value_for_mcts(self, board_info: Game):
+        if self.symmetric_evaluator is not None:
+            return self.symmetric_evaluator.get_policy_value_for_mcts(board_info)
         # 输出(move序号, 先验概率) 以及 局面价值
         avail_move_lists = board_info.get_available_moves()
         state_planes = torch.from_numpy(np.ascontiguousarray(board_info.get_feature_planes())).unsqueeze(dim=0)  # NCHW 增加一个假维度
-        logp_list, value = self.resnet(state_planes.cuda().float()) if self.use_gpu else self.resnet(state_planes.float())
+        self.resnet.eval()  # BatchNorm使用running统计量, 避免同一batch内的局面相互影响
+        with torch.no_grad():
+            logp_list, value = self.resnet(state_planes.cuda().float()) if self.use_gpu else self.resnet(state_planes.float())
         p_list = np.exp(logp_list.data.cpu().numpy().flatten())
 
         p_list = zip(avail_move_lists, p_list[avail_move_lists])
         return p_list, value.item()
 
+    # 批量输出p向量/v值用于batch mcts: state_planes size-(N,4,8,8), avail_moves_batch为N个可行move列表
+    def get_policy_value_batch_for_mcts(self, state_planes, avail_moves_batch):
+        if self.symmetric_evaluator is not None:
+            return self.symmetric_evaluator.get_policy_value_batch_for_mcts(state_planes, avail_moves_batch)
+        logp_list, value_list = self.get_log_policy_value_batch(state_planes)
+        p_list = np.exp(logp_list)
+        return [(zip(avail_moves, p_list[i][avail_moves]), float(value_list[i])) for i, avail_moves in enumerate(avail_moves_batch)]
+
+    # 批量前向传播: 输入size-(N,4,8,8), 输出log概率size-(N,size*size)与价值size-(N)的numpy数组
+    def get_log_policy_value_batch(self, state_planes):
+        state_planes = torch.as_tensor(np.ascontiguousarray(state_planes)).float()
+        self.resnet.eval()
+        with torch.no_grad():
+            logp_list, value_list = self.resnet(state_planes.cuda()) if self.use_gpu else self.resnet(state_planes)
+        return logp_list.cpu().numpy(), value_list.cpu().numpy().flatten()
+
     # 训练模型
     def training(self, dataset):
-        # 从数据集抽取若干数据
-        batch_data = random.sample(dataset, config.BATCH_SIZE)
-        state_planes = [data[0] for data in batch_data]  # size->(batch_size,4,s,s)
-        mcts_pi_list = [data[1] for data in batch_data]  # size->(batch_size,s*s)
-        mcts_z_list = [data[2] for data in batch_data]  # size->(batch_size)
-        # 数据转tensor->size(batch_size,4,s,s)
-        state_planes = torch.tensor(state_planes).cuda().float() if self.use_gpu else torch.tensor(state_planes).float()
-        mcts_pi_list = torch.tensor(mcts_pi_list).cuda().float() if self.use_gpu else torch.tensor(mcts_pi_list).float()
-        mcts_z_list = torch.tensor(mcts_z_list).cuda().float() if self.use_gpu else torch.tensor(mcts_z_list).float()
-        aggregate_loss, value_loss, policy_loss = 0.0, 0.0, 0.0
-        for _ in range(config.EPOCHS):
-            # --优化器-- #
-            # 清空梯度
-            self.optimizer.zero_grad()
-            # 设定学习率
-            # for param_group in self.optimizer.param_groups:  # 优化器的param_groups（字典）
-            #         #     param_group['lr'] = lr
-            # 设定学习率衰减器
-            # mode为min，则loss不下降学习率乘以factor，max则反之
-            scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(self.optimizer, mode='min', factor=0.9, patience=20)
-            # 前向传播
-            net_logp_list, net_value_list = self.resnet(state_planes)
-            # Loss = (z - v)^2 - pi^T * log(p) + c||theta||^2
-            # 计算Loss
-            value_loss = F.mse_loss(net_value_list.view(-1), mcts_z_list)
-            policy_loss = -torch.mean(torch.sum(mcts_pi_list * net_logp_list, 1))
-            aggregate_loss = value_loss + policy_loss
-            # 反向传播
-            aggregate_loss.backward()
-            # 更新参数
-            self.optimizer.step()
-            scheduler.step(aggregate_loss)
-        return aggregate_loss.item(), value_loss.item(), policy_loss.item()
+        # 一轮训练: TRAIN_BATCHES_PER_ROUND次参数更新, 每次使用新抽取的mini-batch (见network/trainer.py)
+        aggregate_loss, value_loss, policy_loss = self.trainer.train_round(dataset)
+        if self.symmetric_evaluator is not None:
+            self.symmetric_evaluator.clear()  # 网络已更新, 缓存的评估已过期
+        return aggregate_loss, value_loss, policy_loss
+
+    # 获取/载入网络参数 (用于多进程间同步权重)
+    def get_state_dict(self):
+        return {key: value.cpu() for key, value in self.resnet.state_dict().items()}
+
+    def load_state_dict(self, state_dict):
+        self.resnet.load_state_dict(state_dict)
+        if self.symmetric_evaluator is not None:
+            self.symmetric_evaluator.clear()
 
     # 保存模型
     def save_model(self, model_path):
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import queue
+import random
+import threading
+import time
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, IterableDataset
+import config
+from replay_buffer import ReplayBuffer
+
+
+# convnet与resnet的NetFunction共用的训练循环
+class Trainer:
+    """
+    A training round (train_round) takes batches_per_round optimizer steps, each on accumulation_steps freshly drawn
+    mini-batches of batch_size whose gradients are accumulated. The optimizer and the learning rate scheduler persist
+    across rounds. The data come from a ReplayBuffer (sampled ahead by a background thread), a SelfPlayDataset
+    (through a DataLoader kept across rounds), or any sequence of (state, pi, z).
+    """
+    def __init__(self, net, optimizer, use_gpu=config.USE_GPU, batch_size=config.BATCH_SIZE,
+                 batches_per_round=config.TRAIN_BATCHES_PER_ROUND, accumulation_steps=config.GRADIENT_ACCUMULATION_STEPS,
+                 prefetch_num=config.TRAIN_PREFETCH_NUM):
+        self.net = net
+        self.optimizer = optimizer
+        self.use_gpu = use_gpu
+        self.batch_size = batch_size
+        self.batches_per_round = batches_per_round
+        self.accumulation_steps = accumulation_steps
+        self.prefetch_num = prefetch_num
+        # 学习率衰减器 (跨轮次保持状态): loss停止下降则lr乘以factor
+        self.scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.9, patience=20)
+        self.data_loader = None  # DataLoader of the IterableDataset trained on
+        self.data_iterator = None
+        self.history = []  # loss curve, format: [{'round', 'aggregate_loss', 'value_loss', 'policy_loss', 'lr', 'samples_per_second'}, ...]
+
+    def prefetch(self, sample, batch_num):
+        """
+        Yield batch_num batches made by sample(), which a background thread prepares up to prefetch_num ahead.
+        An exception raised by sample() in that thread is passed through the queue and raised again here.
+        """
+        batch_queue = queue.Queue(maxsize=max(self.prefetch_num, 1))
+
+        def produce():
+            try:
+                for _ in range(batch_num):
+                    batch = [torch.from_numpy(array) for array in sample()]
+                    batch_queue.put([tensor.pin_memory() for tensor in batch] if self.use_gpu else batch)
+            except Exception as error:
+                batch_queue.put(error)
+
+        threading.Thread(target=produce, daemon=True).start()
+        for _ in range(batch_num):
+            batch = batch_queue.get()
+            if isinstance(batch, Exception):
+                raise batch
+            yield batch
+
+    def iterate_batches(self, dataset, batch_num):
+        """Yield batch_num batches of (state, pi, z) tensors drawn from dataset"""
+        if isinstance(dataset, ReplayBuffer):
+            yield from self.prefetch(lambda: dataset.sample(self.batch_size), batch_num)
+        elif isinstance(dataset, IterableDataset):
+            if self.data_loader is None or self.data_loader.dataset is not dataset:
+                self.data_loader = DataLoader(dataset, batch_size=self.batch_size, drop_last=True, pin_memory=self.use_gpu,
+                                              num_workers=config.TRAIN_LOADER_WORKER_NUM)
+                self.data_iterator = iter(self.data_loader)
+            for _ in range(batch_num):
+                try:
+                    yield next(self.data_iterator)
+                except StopIteration:  # start another pass over the dataset
+                    self.data_iterator = iter(self.data_loader)
+                    yield next(self.data_iterator)
+        else:
+            for _ in range(batch_num):
+                batch_data = random.sample(dataset, self.batch_size)
+                yield [torch.from_numpy(np.array([data[i] for data in batch_data])) for i in range(3)]
+
+    def train_round(self, dataset):
+        """One training round, returning the mean aggregate, value (MSE) and policy (cross entropy) losses"""
+        self.net.train()
+        start_time = time.time()
+        batches = self.iterate_batches(dataset, self.batches_per_round * self.accumulation_steps)
+        round_losses = []
+        for _ in range(self.batches_per_round):
+            self.optimizer.zero_grad()
+            step_losses = np.zeros(3)
+            for _ in range(self.accumulation_steps):
+                state_planes, mcts_pi_list, mcts_z_list = [tensor.cuda(non_blocking=True).float() if self.use_gpu else tensor.float() for tensor in next(batches)]
+                # 前向传播
+                output_log_p_list, output_value_list = self.net(state_planes)
+                # Loss = (z - v)^2 - pi^T * log(p) + c||theta||^2 (L2由优化器的weight_decay实现)
+                value_loss = F.mse_loss(output_value_list.view(-1), mcts_z_list)  # 均方差损失
+                policy_loss = -torch.mean(torch.sum(mcts_pi_list * output_log_p_list, 1))  # 交叉熵损失
+                aggregate_loss = value_loss + policy_loss  # 总损失
+                # 反向传播, 梯度在accumulation_steps个mini-batch上累积
+                (aggregate_loss / self.accumulation_steps).backward()
+                step_losses += [aggregate_loss.item(), value_loss.item(), policy_loss.item()]
+            # 更新参数
+            self.optimizer.step()
+            round_losses.append(step_losses / self.accumulation_steps)
+        aggregate_loss, value_loss, policy_loss = np.mean(round_losses, axis=0).tolist()
+        self.scheduler.step(aggregate_loss)
+        elapsed_time = time.time() - start_time
+        self.history.append({'round': len(self.history) + 1, 'aggregate_loss': aggregate_loss, 'value_loss': value_loss,
+                             'policy_loss': policy_loss, 'lr': self.optimizer.param_groups[0]['lr'],
+                             'samples_per_second': self.batches_per_round * self.accumulation_steps * self.batch_size / elapsed_time})
+        return aggregate_loss, value_loss, policy_loss
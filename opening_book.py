@@ -0,0 +1,135 @@
+import argparse
+import functools
+import os
+import numpy as np
+import config
+from dataset import read_index, load_shard, replace_file
+from game import Game, get_moves_bits
+from endgame import get_own_opp_bits
+from symmetry import SYMMETRY_NUM, SYMMETRY_PERMUTATIONS, INVERSE_SYMMETRY_PERMUTATIONS, transform_pi
+
+
+def get_symmetry_byte_tables():
+    """[symmetry][row][byte] -> the bitboard of the stones of that byte of that row, once transformed by the symmetry"""
+    return [[[sum(1 << int(INVERSE_SYMMETRY_PERMUTATIONS[symmetry][row * 8 + column]) for column in range(8) if byte >> column & 1)
+              for byte in range(256)] for row in range(8)] for symmetry in range(SYMMETRY_NUM)]
+
+
+SYMMETRY_BYTE_TABLES = get_symmetry_byte_tables()
+
+
+def transform_bits(bits, symmetry):
+    """Move every stone of a bitboard to where symmetry takes it, as transform_moves does to move Ids"""
+    tables = SYMMETRY_BYTE_TABLES[symmetry]
+    transformed = 0
+    for row in range(8):
+        transformed |= tables[row][bits >> (row * 8) & 0xFF]
+    return transformed
+
+
+def get_canonical_position(own, opp):
+    """The smallest of the 8 symmetric forms of (own, opp), and the symmetry taking the position to it"""
+    return min(((transform_bits(own, symmetry), transform_bits(opp, symmetry)), symmetry) for symmetry in range(SYMMETRY_NUM))
+
+
+def plane_2_bits(plane):
+    return int.from_bytes(np.packbits(np.asarray(plane, dtype=np.uint8).flatten(), bitorder='little').tobytes(), 'little')
+
+
+class OpeningBook:
+    """
+    Move distributions of the opening positions (up to max_ply stones played), keyed by the canonical form of
+    (stones of the side to move, stones of its opponent) among the 8 symmetries, with the moves in the
+    coordinates of that form. The book is saved as one .npz of typed arrays (about 30 bytes per position).
+    """
+    def __init__(self, max_ply=config.OPENING_BOOK_MAX_PLY):
+        self.max_ply = max_ply
+        self.positions = {}  # (own, opp) in canonical form -> (moves, probabilities, the number of games it was seen in)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def lookup(self, game: Game):
+        """Return the book moves of the position of game (in its own coordinates) and their probabilities, or None"""
+        if game.board_size != 8 or len(game.get_occupied_stones()) - 4 > self.max_ply:
+            return None
+        position, symmetry = get_canonical_position(*get_own_opp_bits(game))
+        entry = self.positions.get(position)
+        if entry is None:
+            return None
+        moves, probs, _ = entry
+        return [int(SYMMETRY_PERMUTATIONS[symmetry][move]) for move in moves], list(probs)
+
+    def save(self, path):
+        positions = sorted(self.positions.items())
+        lengths = np.array([len(moves) for _, (moves, _, _) in positions], dtype=np.int8)
+        replace_file(path, lambda f: np.savez(
+            f, max_ply=self.max_ply,
+            own=np.array([own for (own, _), _ in positions], dtype=np.uint64),
+            opp=np.array([opp for (_, opp), _ in positions], dtype=np.uint64),
+            count=np.array([count for _, (_, _, count) in positions], dtype=np.int32), lengths=lengths,
+            moves=np.concatenate([moves for _, (moves, _, _) in positions] or [[]]).astype(np.int8),
+            probs=np.concatenate([probs for _, (_, probs, _) in positions] or [[]]).astype(np.float16)))
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as arrays:
+            book = OpeningBook(int(arrays['max_ply']))
+            offsets = np.concatenate([[0], np.cumsum(arrays['lengths'])])
+            for i, (own, opp, count) in enumerate(zip(arrays['own'].tolist(), arrays['opp'].tolist(), arrays['count'].tolist())):
+                book.positions[own, opp] = (arrays['moves'][offsets[i]:offsets[i + 1]].tolist(),
+                                            arrays['probs'][offsets[i]:offsets[i + 1]].astype(np.float64), count)
+        return book
+
+
+@functools.lru_cache(maxsize=None)
+def get_opening_book(path):
+    """The book saved in path, loaded once per process and shared by all the players"""
+    return OpeningBook.load(path)
+
+
+def build_opening_book(data_path, max_ply=config.OPENING_BOOK_MAX_PLY, min_count=config.OPENING_BOOK_MIN_COUNT,
+                       min_prob=config.OPENING_BOOK_MIN_PROB):
+    """
+    Mine the self-play log in data_path (see dataset.ShardWriter): the pi (MCTS visit distribution) of every position
+    with at most max_ply stones played is averaged per canonical position. The positions seen in at least
+    min_count games are kept, with the moves of probability min_prob or more (renormalized).
+    """
+    sums = {}  # canonical position -> [count, sum of pi in canonical coordinates]
+    for shard in read_index(data_path)['shards']:
+        state_planes, pi_list, _ = load_shard(data_path, shard)
+        stone_nums = state_planes[:, :2].reshape(len(state_planes), -1).sum(axis=1) - 4
+        for i in np.flatnonzero(stone_nums <= max_ply):
+            black, white = plane_2_bits(state_planes[i, 0]), plane_2_bits(state_planes[i, 1])
+            own, opp = (black, white) if state_planes[i, 3, 0, 0] else (white, black)
+            if not get_moves_bits(own, opp):  # PASS, whose pi is kept in the last cell
+                continue
+            position, symmetry = get_canonical_position(own, opp)
+            entry = sums.setdefault(position, [0, np.zeros(64)])
+            entry[0] += 1
+            entry[1] += transform_pi(pi_list[i:i + 1], symmetry)[0]
+    book = OpeningBook(max_ply)
+    for position, (count, pi_sum) in sums.items():
+        probs = pi_sum / count
+        moves = np.flatnonzero((probs > 0) & (probs >= min_prob)).tolist()
+        if count < min_count or not moves:
+            continue
+        book.positions[position] = (moves, probs[moves] / probs[moves].sum(), count)
+    return book
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build an opening book from the self-play log')
+    parser.add_argument('--data', default=config.SELFPLAY_DATA_PATH, help='the self-play log (SELFPLAY_DATA_PATH) to mine')
+    parser.add_argument('--out', default=config.OPENING_BOOK_PATH, help='the book file, e.g., OPENING_BOOK_PATH')
+    parser.add_argument('--max-ply', type=int, default=config.OPENING_BOOK_MAX_PLY, help='positions with at most ? stones played')
+    parser.add_argument('--min-count', type=int, default=config.OPENING_BOOK_MIN_COUNT, help='positions seen in at least ? games')
+    parser.add_argument('--min-prob', type=float, default=config.OPENING_BOOK_MIN_PROB, help='moves of probability ? or more')
+    args = parser.parse_args()
+    if args.data is None or args.out is None:
+        parser.error('--data and --out are required when SELFPLAY_DATA_PATH or OPENING_BOOK_PATH is not set')
+    book = build_opening_book(args.data, args.max_ply, args.min_count, args.min_prob)
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    book.save(args.out)
+    print('{} positions with at most {} stones played, saved to {} ({:.1f} KB)'.format(
+        len(book), args.max_ply, args.out, os.path.getsize(args.out) / 1024))
@@ -0,0 +1,135 @@
+import json
+import os
+import numpy as np
+import config
+from symmetry import get_random_symmetries
+
+Z_SCALE = 2  # z is stored as int8(z * Z_SCALE), which keeps the custom rewards (e.g., -1.5) exact
+
+
+class ReplayBuffer:
+    """
+    Fixed-capacity ring buffer of (state, pi, z) kept in contiguous typed arrays, in place of a deque of tuples.
+    The feature planes are binary, so they are stored bit-packed (32 bytes per state), pi is stored as float16
+    and z as int8, i.e., 161 bytes per position. Once full, the oldest positions are overwritten.
+    If path is given, the arrays are memory-mapped files in that directory, and the buffer is reopened with its
+    data intact by a later run; flush() writes the data and the write position to disk.
+    If augment is True, every position sampled gets one of the 8 symmetries at random, so that only the original
+    positions need to be stored.
+    """
+    def __init__(self, capacity=config.DATASET_SIZE, board_size=config.TRAIN_BOARD_SIZE, path=None, augment=False):
+        self.capacity = capacity
+        self.board_size = board_size
+        self.path = path
+        self.augment = augment
+        self.shapes = {'planes': ((capacity, config.FEATURE_PLANE_NUM, board_size ** 2 // 8), np.uint8),
+                       'pi': ((capacity, board_size ** 2), np.float16),
+                       'z': ((capacity,), np.int8)}
+        self.position = 0  # index the next position is written to
+        self.size = 0  # the number of positions stored
+        self.added_num = 0  # the number of positions added since the buffer was created, including those overwritten
+        if path is None:
+            self.planes, self.pi, self.z = [np.zeros(shape, dtype=dtype) for shape, dtype in self.shapes.values()]
+        else:
+            self.planes, self.pi, self.z = self.open_memmaps(path)
+
+    def open_memmaps(self, path):
+        """Open the arrays stored in path, or create them if there are none"""
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta['capacity'] != self.capacity or meta['board_size'] != self.board_size:
+                raise ValueError('The replay buffer in {} has capacity {} and board size {}, but {} and {} are required'.format(
+                    path, meta['capacity'], meta['board_size'], self.capacity, self.board_size))
+            self.position, self.size, self.added_num = meta['position'], meta['size'], meta['added_num']
+            return [np.load(os.path.join(path, name + '.npy'), mmap_mode='r+') for name in self.shapes]
+        arrays = [np.lib.format.open_memmap(os.path.join(path, name + '.npy'), mode='w+', dtype=dtype, shape=shape)
+                  for name, (shape, dtype) in self.shapes.items()]
+        self.write_meta()
+        return arrays
+
+    def write_meta(self):
+        """Replace meta.json atomically, so that a crash leaves either the old or the new write position"""
+        meta = {'capacity': self.capacity, 'board_size': self.board_size, 'position': self.position,
+                'size': self.size, 'added_num': self.added_num}
+        temp_path = os.path.join(self.path, 'meta.json.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(temp_path, os.path.join(self.path, 'meta.json'))
+
+    def flush(self):
+        """Write the memory-mapped arrays and then the write position to disk (nothing to do if kept in memory)"""
+        if self.path is None:
+            return
+        for array in (self.planes, self.pi, self.z):
+            array.flush()
+        self.write_meta()
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state_planes, pi_list, z_list):
+        """Add N positions given as arrays, i.e., states (N,4,s,s) of 0/1, pi (N,s*s) and z (N)"""
+        state_planes = np.asarray(state_planes)
+        position_num = len(state_planes)
+        if position_num == 0:
+            return
+        if position_num > self.capacity:  # only the newest positions would survive
+            state_planes, pi_list, z_list = state_planes[-self.capacity:], pi_list[-self.capacity:], z_list[-self.capacity:]
+            self.added_num += position_num - self.capacity
+            position_num = self.capacity
+        packed_planes = np.packbits(state_planes.astype(np.uint8).reshape(position_num, config.FEATURE_PLANE_NUM, -1), axis=-1)
+        indices = (self.position + np.arange(position_num)) % self.capacity
+        self.planes[indices] = packed_planes
+        self.pi[indices] = np.asarray(pi_list, dtype=np.float16).reshape(position_num, -1)
+        self.z[indices] = np.round(np.asarray(z_list, dtype=np.float64) * Z_SCALE).astype(np.int8)
+        self.position = (self.position + position_num) % self.capacity
+        self.size = min(self.size + position_num, self.capacity)
+        self.added_num += position_num
+
+    def extend(self, data):
+        """Add a list of (state, pi, z), as done to the deque used before"""
+        if len(data) == 0:
+            return
+        state_planes, pi_list, z_list = zip(*data)
+        self.add(np.stack(state_planes), np.stack(pi_list), np.array(z_list))
+
+    def sample(self, batch_size, rng=np.random):
+        """
+        Draw batch_size positions uniformly (with replacement, so that the cost does not depend on the buffer size).
+        Return float32 arrays of states (N,4,s,s), pi (N,s*s) and z (N).
+        """
+        indices = rng.randint(0, self.size, size=batch_size)
+        state_planes, pi_list, z_list = self.get_positions(indices)
+        if self.augment:
+            state_planes, pi_list = get_random_symmetries(state_planes, pi_list, rng)
+        return state_planes, pi_list, z_list
+
+    def get_positions(self, indices):
+        """Return the float32 states, pi and z of the positions at indices"""
+        state_planes = np.unpackbits(self.planes[indices], axis=-1).reshape(
+            len(indices), config.FEATURE_PLANE_NUM, self.board_size, self.board_size).astype(np.float32)
+        return state_planes, self.pi[indices].astype(np.float32), self.z[indices].astype(np.float32) / Z_SCALE
+
+    def get_state(self):
+        """
+        The state to checkpoint: the write position and a copy of the data, memory-mapped or not, since the positions
+        added after the checkpoint overwrite those of the files (161 bytes per position, e.g., 4.8 MB for 30000)
+        """
+        return {'capacity': self.capacity, 'position': self.position, 'size': self.size, 'added_num': self.added_num,
+                'planes': self.planes[:self.size].copy(), 'pi': self.pi[:self.size].copy(), 'z': self.z[:self.size].copy()}
+
+    def load_state(self, state):
+        """Restore the state of get_state, written through to the files of a memory-mapped buffer"""
+        if state['capacity'] != self.capacity:
+            raise ValueError('The replay buffer saved has capacity {}, but {} is required'.format(state['capacity'], self.capacity))
+        size = state['size']
+        self.planes[:size], self.pi[:size], self.z[:size] = state['planes'], state['pi'], state['z']
+        self.position, self.size, self.added_num = state['position'], size, state['added_num']
+        self.flush()
+
+    def get_memory_usage(self):
+        """Bytes taken by the arrays"""
+        return self.planes.nbytes + self.pi.nbytes + self.z.nbytes
@@ -0,0 +1,96 @@
+import queue
+import torch
+import torch.multiprocessing as mp
+import config
+from inference_server import InferenceServer
+
+
+def selfplay_worker(worker_id, weights_queue, data_queue, stop_event, inference_client=None):
+    """
+    Self-play process. It keeps playing games with its own copy of the latest weights, or with the InferenceServer
+    behind inference_client, and puts every game, i.e., (worker_id, weights_version, [(state, pi, z), ...], moves),
+    on data_queue. New weights (None when served by the InferenceServer) are picked up from weights_queue between games.
+    """
+    from training import TrainModel  # imported here since the training module imports this one
+    torch.set_num_threads(1)  # one core per worker (spawned processes get their own random seeds)
+    if inference_client is None:
+        trainer = TrainModel(config.TRAIN_BOARD_SIZE, net_type=config.TRAIN_WHICH_NET)
+    else:
+        trainer = TrainModel(config.TRAIN_BOARD_SIZE, net_func=inference_client)
+    weights_version, state_dict = weights_queue.get()  # wait for the first weights
+    if state_dict is not None:
+        trainer.net_func.load_state_dict(state_dict)
+    while not stop_event.is_set():
+        try:
+            weights_version, state_dict = weights_queue.get_nowait()
+            if state_dict is not None:
+                trainer.net_func.load_state_dict(state_dict)
+            elif trainer.net_func.symmetric_evaluator is not None:
+                trainer.net_func.symmetric_evaluator.clear()  # the InferenceServer got the new weights
+            if trainer.mcts_player.evaluation_cache is not None:
+                trainer.mcts_player.evaluation_cache.clear()  # evaluated by the previous weights
+        except queue.Empty:
+            pass
+        data = trainer.self_play(trainer.mcts_player)
+        data_queue.put((worker_id, weights_version, data, trainer.game.get_move_sequence()))
+
+
+class SelfPlayPool:
+    """
+    A pool of self-play processes feeding the learner through a queue.
+    If use_inference_server is True, the workers share the model of one InferenceServer process instead of
+    holding their own copies, so that their leaf evaluations are batched together.
+    """
+    def __init__(self, worker_num=config.SELFPLAY_WORKER_NUM, use_inference_server=config.SELFPLAY_USE_INFERENCE_SERVER):
+        context = mp.get_context('spawn')
+        self.data_queue = context.Queue()
+        self.weights_queues = [context.Queue(maxsize=1) for _ in range(worker_num)]  # only the newest weights are kept
+        self.stop_event = context.Event()
+        self.inference_server = InferenceServer(worker_num) if use_inference_server else None
+        self.workers = [context.Process(target=selfplay_worker, daemon=True, args=(
+            worker_id, self.weights_queues[worker_id], self.data_queue, self.stop_event,
+            self.inference_server.get_client(worker_id) if self.inference_server else None)) for worker_id in range(worker_num)]
+        self.weights_version = 0
+
+    def start(self, state_dict):
+        if self.inference_server is not None:
+            self.inference_server.start(state_dict)
+        self.push_weights(state_dict)
+        for worker in self.workers:
+            worker.start()
+
+    def push_weights(self, state_dict):
+        """Hand the weights to every worker (or to the InferenceServer), replacing those not picked up yet"""
+        self.weights_version += 1
+        if self.inference_server is not None:
+            if self.weights_version > 1:
+                self.inference_server.update_weights(state_dict)
+            state_dict = None  # the workers only learn the version, and drop their cached evaluations
+        for weights_queue in self.weights_queues:
+            try:
+                weights_queue.get_nowait()
+            except queue.Empty:
+                pass
+            weights_queue.put((self.weights_version, state_dict))
+
+    def get_games(self, block=True):
+        """Return the games finished so far, waiting for at least one if block is True"""
+        games = []
+        if block:
+            games.append(self.data_queue.get())
+        while True:
+            try:
+                games.append(self.data_queue.get_nowait())
+            except queue.Empty:
+                return games
+
+    def stop(self, timeout=10):
+        """Let the workers finish their current game, and terminate those still running after 'timeout' seconds"""
+        self.stop_event.set()
+        for worker in self.workers:
+            worker.join(timeout=timeout)
+            if worker.is_alive():
+                worker.terminate()
+        if self.inference_server is not None:
+            print("Inference server: {}".format(self.inference_server.get_stats()))
+            self.inference_server.stop()
@@ -1,24 +1,28 @@
 import config
-from mcts import MCTSPlayer
-from game import Game
+from mcts import create_mcts_player
+from game import create_game
 from gui import GUI
 from network import resnet, convnet
+from network.export import InferenceBackend
 
 if __name__ == "__main__":
     # >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>GUI界面<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
     # Init game
-    game = Game(board_size=config.GUI_BOARD_SIZE)
+    game = create_game(board_size=config.GUI_BOARD_SIZE)
     # Init gui and bring the core of the game to it
     gui = GUI(game)
     # Build neural network for MCTS for human vs AI mode
-    if config.AI_NET_TYPE == 'cnn':
+    if config.AI_EXPORTED_MODEL_PATH:
+        net = InferenceBackend(config.AI_EXPORTED_MODEL_PATH)  # Conv+BN-fused TorchScript/ONNX model
+    elif config.AI_NET_TYPE == 'cnn':
         net = convnet.NetFunction(config.TRAIN_BOARD_SIZE, model_path=config.AI_CNN_MODEL_PATH)  # Classic convolution network
     elif config.AI_NET_TYPE == 'resnet':
         net = resnet.NetFunction(config.TRAIN_BOARD_SIZE, model_path=config.AI_RESNET_MODEL_PATH)  # Residual network
     else:
         net = None
     # Create a AI player based on MCTS and nn
-    mcts_player = MCTSPlayer(net.get_policy_value_for_mcts, playout_num=config.AI_MCTS_PLAYOUT_NUM)
+    mcts_player = create_mcts_player(net.get_policy_value_for_mcts, playout_num=config.AI_MCTS_PLAYOUT_NUM, batch_neural_network=net.get_policy_value_batch_for_mcts,
+                                    time_budget=config.AI_MCTS_TIME_BUDGET)
     # Open GUI
     gui.start_game(mcts_player)
 
@@ -0,0 +1,134 @@
+import numpy as np
+import config
+from evaluation_cache import EvaluationCache
+
+SYMMETRY_NUM = 8  # the dihedral group of the square board: 4 rotations, with or without a mirror
+
+
+def transform_board(board, symmetry):
+    """
+    Apply a symmetry to the last two axes (s x s) of an array, where symmetry 0-3 rotates by 90 degrees 0-3 times,
+    and 4-7 mirror left-right first. Any number of leading axes (e.g., batch and planes) is supported.
+    """
+    if symmetry >= 4:
+        board = np.flip(board, axis=-1)
+    return np.rot90(board, k=symmetry % 4, axes=(-2, -1))
+
+
+def get_symmetry_permutations(board_size=config.TRAIN_BOARD_SIZE):
+    """
+    (8, s*s) table of move Ids, where transforming a flattened board by symmetry k equals indexing it by row k.
+    The inverse table maps a transformed board back.
+    """
+    cells = np.arange(board_size ** 2).reshape(board_size, board_size)
+    permutations = np.array([transform_board(cells, symmetry).flatten() for symmetry in range(SYMMETRY_NUM)])
+    return permutations, np.argsort(permutations, axis=1)
+
+
+SYMMETRY_PERMUTATIONS, INVERSE_SYMMETRY_PERMUTATIONS = get_symmetry_permutations()
+
+
+def transform_planes(state_planes, symmetries):
+    """Transform states (N,C,s,s), where symmetries is one symmetry Id or an array (N) of them, one per state"""
+    state_planes = np.asarray(state_planes)
+    shape = state_planes.shape
+    permutations = SYMMETRY_PERMUTATIONS[symmetries]
+    flat_planes = state_planes.reshape(shape[0], shape[1], -1)
+    if permutations.ndim == 1:
+        return flat_planes[:, :, permutations].reshape(shape)
+    return np.take_along_axis(flat_planes, permutations[:, np.newaxis, :], axis=-1).reshape(shape)
+
+
+def transform_pi(pi_list, symmetries):
+    """Transform move probabilities (N,s*s) the same way as transform_planes does to the states"""
+    pi_list = np.asarray(pi_list)
+    permutations = SYMMETRY_PERMUTATIONS[symmetries]
+    if permutations.ndim == 1:
+        return pi_list[:, permutations]
+    return np.take_along_axis(pi_list, permutations, axis=-1)
+
+
+def transform_moves(moves, symmetry):
+    """Map move Ids (PASS, i.e., -1, is kept) to where symmetry takes them"""
+    moves = np.asarray(moves)
+    return np.where(moves >= 0, INVERSE_SYMMETRY_PERMUTATIONS[symmetry][moves], moves)
+
+
+def get_random_symmetries(state_planes, pi_list, rng=np.random):
+    """Apply one random symmetry per position to a batch of states (N,C,s,s) and pi (N,s*s)"""
+    symmetries = rng.randint(0, SYMMETRY_NUM, size=len(state_planes))
+    return transform_planes(state_planes, symmetries), transform_pi(pi_list, symmetries)
+
+
+def get_canonical_symmetries(state_planes):
+    """
+    For states (N,C,s,s), return the symmetry taking each state to its canonical form, i.e., the one of its 8 forms
+    with the smallest bit-packed planes, and the bytes of those planes as the key of the canonical form.
+    """
+    flat_planes = np.asarray(state_planes).reshape(len(state_planes), state_planes.shape[1], -1).astype(np.uint8)
+    # (N,C,8,s*s) -> (N,8,C,s*s) -> bit-packed (N,8,C*s*s/8)
+    packed = np.packbits(flat_planes[:, :, SYMMETRY_PERMUTATIONS].transpose(0, 2, 1, 3).reshape(
+        len(flat_planes), SYMMETRY_NUM, -1), axis=-1)
+    symmetries = np.array([min(range(SYMMETRY_NUM), key=lambda symmetry: forms[symmetry].tobytes()) for forms in packed])
+    return symmetries, [packed[i, symmetry].tobytes() for i, symmetry in enumerate(symmetries)]
+
+
+class SymmetricEvaluator:
+    """
+    Network evaluation for MCTS making use of the 8 symmetries of the board, on top of log_policy_value_batch,
+    i.e., NetFunction.get_log_policy_value_batch. The policies are always mapped back to the moves of the state given.
+    'canonical': evaluate the canonical form of a state, and cache it by that form, so that states equal up to
+                 symmetry share one evaluation.
+    'random': evaluate one random symmetry of a state.
+    'average': evaluate the 8 symmetries as one batch and average them, cached by canonical form as well.
+    """
+    def __init__(self, log_policy_value_batch, mode=config.SYMMETRY_EVAL_MODE, cache_size=config.SYMMETRY_CACHE_SIZE):
+        self.log_policy_value_batch = log_policy_value_batch
+        self.mode = mode
+        self.cache = EvaluationCache(cache_size) if cache_size > 0 and mode in ('canonical', 'average') else None
+
+    def clear(self):
+        """Drop the cached evaluations, e.g., once the network is updated"""
+        if self.cache is not None:
+            self.cache.clear()
+
+    def get_policy_value_for_mcts(self, game):
+        return self.get_policy_value_batch_for_mcts(game.get_feature_planes()[np.newaxis], [game.get_available_moves()])[0]
+
+    def get_policy_value_batch_for_mcts(self, state_planes, avail_moves_batch):
+        state_planes = np.asarray(state_planes)
+        if self.mode == 'random':
+            p_list, value_list = self.evaluate(state_planes)
+            return [(zip(avail_moves, p_list[i][avail_moves]), float(value_list[i])) for i, avail_moves in enumerate(avail_moves_batch)]
+        symmetries, keys = get_canonical_symmetries(state_planes)
+        # The moves of a state in its canonical form, by which a cache hit is checked
+        canonical_moves_batch = [sorted(transform_moves(avail_moves, symmetry).tolist()) for avail_moves, symmetry in zip(avail_moves_batch, symmetries)]
+        results = [None] * len(state_planes)
+        missed = []
+        for i in range(len(state_planes)):
+            cached = self.cache.get(keys[i], canonical_moves_batch[i]) if self.cache is not None else None
+            if cached is None:
+                missed.append(i)
+                continue
+            moves_probs, value = cached
+            results[i] = ([(SYMMETRY_PERMUTATIONS[symmetries[i]][move] if move >= 0 else move, prob) for move, prob in moves_probs], value)
+        if missed:
+            p_list, value_list = self.evaluate(state_planes[missed], symmetries[missed])
+            for p, value, i in zip(p_list, value_list, missed):
+                original_moves = [SYMMETRY_PERMUTATIONS[symmetries[i]][move] if move >= 0 else move for move in canonical_moves_batch[i]]
+                if self.cache is not None:
+                    self.cache.put(keys[i], zip(canonical_moves_batch[i], p[original_moves]), value)
+                results[i] = (list(zip(avail_moves_batch[i], p[avail_moves_batch[i]])), float(value))
+        return [(iter(moves_probs), value) for moves_probs, value in results]
+
+    def evaluate(self, state_planes, canonical_symmetries=None):
+        """Evaluate states (N,4,s,s) in the way of the mode, returning the probabilities (N,s*s) of their own moves and values (N)"""
+        state_num = len(state_planes)
+        if self.mode == 'average':
+            symmetries = np.repeat(np.arange(SYMMETRY_NUM), state_num)
+            logp_list, value_list = self.log_policy_value_batch(transform_planes(np.tile(state_planes, (SYMMETRY_NUM, 1, 1, 1)), symmetries))
+            p_list = np.take_along_axis(np.exp(logp_list), INVERSE_SYMMETRY_PERMUTATIONS[symmetries], axis=-1)
+            return p_list.reshape(SYMMETRY_NUM, state_num, -1).mean(axis=0), value_list.reshape(SYMMETRY_NUM, state_num).mean(axis=0)
+        symmetries = np.random.randint(0, SYMMETRY_NUM, size=state_num) if canonical_symmetries is None else canonical_symmetries
+        logp_list, value_list = self.log_policy_value_batch(transform_planes(state_planes, symmetries))
+        return np.take_along_axis(np.exp(logp_list), INVERSE_SYMMETRY_PERMUTATIONS[symmetries], axis=-1), value_list
@@ -0,0 +1,210 @@
+import argparse
+import glob
+import itertools
+import json
+import math
+import os
+import time
+import torch
+import torch.multiprocessing as mp
+import config
+from dataset import replace_file
+from game import create_game
+from gating import create_model_player, play_game
+
+GENERATION_FILE = 'generation_{:08d}.pt'  # numbered by the count of self-play games
+
+
+def get_generation_paths(generation_dir=config.GENERATION_DIR):
+    """The model generations in generation_dir, from the oldest to the latest"""
+    return sorted(glob.glob(os.path.join(generation_dir, GENERATION_FILE.replace('{:08d}', '[0-9]' * 8))))
+
+
+def save_generation(net_func, game_num, generation_dir=config.GENERATION_DIR):
+    """Keep a copy of the model trained on game_num self-play games, which later tournaments may include"""
+    os.makedirs(generation_dir, exist_ok=True)
+    path = os.path.join(generation_dir, GENERATION_FILE.format(game_num))
+    net_func.save_model(path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def get_entrant_name(path, playout_num):
+    return '{}@{}'.format(os.path.splitext(os.path.basename(path))[0], playout_num)
+
+
+def get_round_robin_pairs(entrants):
+    """Every entrant meets every other one"""
+    return list(itertools.combinations(entrants, 2))
+
+
+def get_gauntlet_pairs(entrants, challengers):
+    """Every challenger meets every entrant which is not a challenger"""
+    return [(challenger, entrant) for challenger in challengers for entrant in entrants if entrant not in challengers]
+
+
+def get_bradley_terry_ratings(games, names, iteration_num=1000, tolerance=1e-9, prior_draw_num=1.0):
+    """
+    Maximum likelihood ratings of the Bradley-Terry model P(i beats j) = g_i / (g_i + g_j), fitted by the
+    minorization-maximization algorithm, with a draw counted as half a win for each side. Every entrant also draws
+    prior_draw_num virtual games against a virtual entrant of strength 1, so that an entrant which has won (or lost)
+    all its games gets a finite rating. The ratings are returned on the Elo scale, i.e., 400 * log10(g),
+    shifted so that their mean is 0.
+    """
+    index = {name: i for i, name in enumerate(names)}
+    wins = [prior_draw_num / 2] * len(names)
+    pair_game_num = {}  # (i, j) with i < j -> the number of games between i and j
+    for game in games:
+        i, j = index[game['black']], index[game['white']]
+        wins[i] += 1.0 if game['result'] == 1 else 0.5 if game['result'] == 3 else 0.0
+        wins[j] += 1.0 if game['result'] == 2 else 0.5 if game['result'] == 3 else 0.0
+        pair_game_num[min(i, j), max(i, j)] = pair_game_num.get((min(i, j), max(i, j)), 0) + 1
+    opponents = [[] for _ in names]
+    for (i, j), game_num in pair_game_num.items():
+        opponents[i].append((j, game_num))
+        opponents[j].append((i, game_num))
+    strengths = [1.0] * len(names)
+    for _ in range(iteration_num):
+        new_strengths = [wins[i] / (prior_draw_num / (strengths[i] + 1.0) + sum(
+            game_num / (strengths[i] + strengths[j]) for j, game_num in opponents[i])) for i in range(len(names))]
+        change = max(abs(math.log(new / old)) for new, old in zip(new_strengths, strengths)) if names else 0.0
+        strengths = new_strengths
+        if change < tolerance:
+            break
+    elo_list = [400.0 * math.log10(strength) for strength in strengths]
+    mean_elo = sum(elo_list) / len(elo_list) if elo_list else 0.0
+    return {name: elo - mean_elo for name, elo in zip(names, elo_list)}
+
+
+class TimedPlayer:
+    """An MCTSPlayer which also measures the time it spends choosing its moves"""
+    def __init__(self, mcts_player):
+        self.mcts_player = mcts_player
+        self.move_num = 0
+        self.seconds = 0.0
+
+    def choose_move(self, game):
+        start_time = time.perf_counter()
+        move = self.mcts_player.choose_move(game)
+        self.seconds += time.perf_counter() - start_time
+        self.move_num += 1
+        return move
+
+
+# The players of a tournament process, created on first use and kept for the later games of the process
+tournament_players = {}
+
+
+def init_tournament_process():
+    torch.set_num_threads(1)
+
+
+def get_tournament_player(path, playout_num, net_type):
+    if (path, playout_num) not in tournament_players:
+        tournament_players[path, playout_num] = TimedPlayer(create_model_player(path, net_type, playout_num))
+    return tournament_players[path, playout_num]
+
+
+def play_tournament_game(task):
+    """Play one game of a pairing, returning the game record with the search time of both sides"""
+    (path1, playout_num1), (path2, playout_num2), round_num, net_type = task
+    player1, player2 = get_tournament_player(path1, playout_num1, net_type), get_tournament_player(path2, playout_num2, net_type)
+    before = [(player.move_num, player.seconds) for player in (player1, player2)]
+    result_id = play_game(create_game(config.TRAIN_BOARD_SIZE), player1, player2, round_num)
+    (move_num1, seconds1), (move_num2, seconds2) = [(player.move_num - move_num, player.seconds - seconds)
+                                                    for player, (move_num, seconds) in zip((player1, player2), before)]
+    name1, name2 = get_entrant_name(path1, playout_num1), get_entrant_name(path2, playout_num2)
+    # play_game returns the result by player; the record keeps it by color, as get_game_status does
+    black, white = (name1, name2) if round_num % 2 == 0 else (name2, name1)
+    result = 3 if result_id == 3 else 1 if (result_id == 1) == (black == name1) else 2
+    return {'black': black, 'white': white, 'result': result,
+            'time': {name1: seconds1, name2: seconds2}, 'moves': {name1: move_num1, name2: move_num2}}
+
+
+class Tournament:
+    """
+    Matches between stored model generations, each entrant being a model with a fixed playout budget, so that the
+    same generation may enter with several budgets. The games are played by a pool of processes, and every game
+    is appended to rating_path right away, so that a later tournament only plays the pairings still short of
+    game_num games. The rating table combines all the games on record into Bradley-Terry ratings (Elo scale),
+    along with the mean search time per move of every entrant, i.e., the strength per millisecond of search.
+    """
+    def __init__(self, rating_path=config.TOURNAMENT_RATING_PATH, net_type=config.TRAIN_WHICH_NET):
+        self.rating_path = rating_path
+        self.net_type = net_type
+        self.games = []
+        if os.path.exists(rating_path):
+            with open(rating_path) as f:
+                self.games = json.load(f)['games']
+
+    def get_pair_game_num(self, name1, name2):
+        return sum({game['black'], game['white']} == {name1, name2} for game in self.games)
+
+    def play(self, pairs, game_num=config.TOURNAMENT_GAME_NUM, process_num=config.TOURNAMENT_PROCESS_NUM):
+        """
+        Play game_num games (colors alternating) per pair of entrants, given as ((path, playout_num), (path, playout_num)),
+        minus the games already on record
+        """
+        tasks = []
+        for entrant1, entrant2 in pairs:
+            played_num = self.get_pair_game_num(get_entrant_name(*entrant1), get_entrant_name(*entrant2))
+            tasks += [(entrant1, entrant2, round_num, self.net_type) for round_num in range(played_num, game_num)]
+        print(">>>Tournament: {} pairings, {} games to play".format(len(pairs), len(tasks)))
+        if not tasks:
+            return
+        with mp.get_context('spawn').Pool(process_num, initializer=init_tournament_process) as pool:
+            for finished_num, game in enumerate(pool.imap_unordered(play_tournament_game, tasks), 1):
+                self.games.append(game)
+                self.save()
+                print("Game {}/{}: {} (black) vs {} (white), result: {}".format(
+                    finished_num, len(tasks), game['black'], game['white'], game['result']))
+
+    def save(self):
+        """Replace the record on disk atomically, with the rating table computed from it"""
+        os.makedirs(os.path.dirname(self.rating_path) or '.', exist_ok=True)
+        record = json.dumps({'ratings': self.get_rating_table(), 'games': self.games}, indent=1).encode()
+        replace_file(self.rating_path, lambda f: f.write(record))
+
+    def get_rating_table(self):
+        """One row per entrant, from the strongest to the weakest"""
+        names = sorted({game[color] for game in self.games for color in ('black', 'white')})
+        ratings = get_bradley_terry_ratings(self.games, names)
+        table = []
+        for name in names:
+            games = [game for game in self.games if name in (game['black'], game['white'])]
+            score = sum(1.0 if game['result'] == (1 if game['black'] == name else 2) else 0.5 if game['result'] == 3 else 0.0
+                        for game in games) / len(games)
+            move_num = sum(game['moves'][name] for game in games)
+            table.append({'name': name, 'elo': ratings[name], 'games': len(games), 'score': score,
+                          'ms_per_move': 1000.0 * sum(game['time'][name] for game in games) / max(move_num, 1)})
+        return sorted(table, key=lambda row: -row['elo'])
+
+    def print_rating_table(self):
+        print("{:<28}{:>8}{:>7}{:>8}{:>13}".format('Entrant', 'Elo', 'Games', 'Score', 'ms/move'))
+        for row in self.get_rating_table():
+            print("{:<28}{:>8.0f}{:>7}{:>8.3f}{:>13.1f}".format(row['name'], row['elo'], row['games'], row['score'], row['ms_per_move']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rate the stored model generations by a tournament')
+    parser.add_argument('--mode', choices=['round-robin', 'gauntlet'], default='round-robin',
+                        help='round-robin: every entrant meets every other one; gauntlet: the latest generation (or --challengers) meets all the others')
+    parser.add_argument('--challengers', nargs='*', default=None, metavar='MODEL', help='models which play the gauntlet')
+    parser.add_argument('--models', nargs='*', default=None, metavar='MODEL', help='models entering, by default all those in GENERATION_DIR')
+    parser.add_argument('--playouts', nargs='+', type=int, default=[config.EVAL_MCTS_PLAYOUT_NUM], help='playout budgets every model enters with')
+    parser.add_argument('--games', type=int, default=config.TOURNAMENT_GAME_NUM, help='games per pairing')
+    parser.add_argument('--processes', type=int, default=config.TOURNAMENT_PROCESS_NUM)
+    parser.add_argument('--ratings', default=config.TOURNAMENT_RATING_PATH, help='file keeping the games and the rating table')
+    args = parser.parse_args()
+    model_paths = args.models if args.models else get_generation_paths()
+    entrants = [(path, playout_num) for path in model_paths for playout_num in args.playouts]
+    if args.mode == 'gauntlet':
+        challenger_paths = args.challengers if args.challengers else model_paths[-1:]
+        challengers = [(path, playout_num) for path in challenger_paths for playout_num in args.playouts]
+        pairs = get_gauntlet_pairs(entrants + [entrant for entrant in challengers if entrant not in entrants], challengers)
+    else:
+        pairs = get_round_robin_pairs(entrants)
+    tournament = Tournament(args.ratings)
+    tournament.play(pairs, args.games, args.processes)
+    tournament.save()
+    tournament.print_rating_table()
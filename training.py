@@ -1,13 +1,19 @@
-import copy
 import numpy as np
 import config
 import time
 import os
-import pickle
+import argparse
 from gui import GUI
-from collections import deque
-from game import Game
-from mcts import MCTSPlayer
+from game import create_game
+from endgame import get_proven_status
+from replay_buffer import ReplayBuffer
+from dataset import ShardWriter, SelfPlayDataset
+from gating import GatingMatch, create_model_player, play_game, get_elo_interval
+from checkpoint import save_checkpoint, load_checkpoint, get_latest_checkpoint_path
+from tournament import save_generation
+from symmetry import SYMMETRY_NUM, transform_planes, transform_pi
+from mcts import MCTSPlayer, create_mcts_player
+from selfplay_pool import SelfPlayPool
 from network import resnet, convnet
 from torch.utils.tensorboard import SummaryWriter
 
@@ -17,61 +23,66 @@ from torch.utils.tensorboard import SummaryWriter
 
 
 class TrainModel:
-    def __init__(self, size, model_path=None, net_type=None):
+    def __init__(self, size, model_path=None, net_type=None, net_func=None, buffer_path=None, data_path=None):
         self.board_size = size
-        self.game = Game(board_size=config.TRAIN_BOARD_SIZE)
-        self.data_cache = deque(maxlen=config.DATASET_SIZE)  # For storing self-play data. Structure: FIFO, where a state take up 8 size.
-        if net_type == 'resnet':
+        self.game = create_game(board_size=config.TRAIN_BOARD_SIZE)
+        self.data_cache = ReplayBuffer(config.DATASET_SIZE, self.board_size, path=buffer_path, augment=config.AUGMENT_AT_SAMPLE)  # For storing self-play data. Structure: FIFO ring buffer, where a state take up 8 size unless augmented when sampled. Kept on disk if buffer_path is given
+        self.shard_writer = ShardWriter(data_path) if data_path else None  # Log of the self-play games on disk
+        self.game_num = 0  # the number of self-play games collected, restored when resuming from a checkpoint
+        self.evaluation_history = []  # format: [(game_num, win_ratio, promoted), ...]
+        self.gating_match = None  # the evaluation running in the background, see gating.GatingMatch
+        if net_func is not None:  # e.g., an InferenceClient for self-play only
+            self.net_func = net_func
+        elif net_type == 'resnet':
             self.net_func = resnet.NetFunction(self.board_size, model_path=model_path)
         elif net_type == 'cnn':
             self.net_func = convnet.NetFunction(self.board_size, model_path=model_path)
         else:
             print("Please specify a network!")
             self.net_func = None
-        self.mcts_player = MCTSPlayer(self.net_func.get_policy_value_for_mcts, playout_num=config.TRAIN_MCTS_PLYAOUT_NUM, is_selfplay_mode=True)
+        self.mcts_player = create_mcts_player(self.net_func.get_policy_value_for_mcts, playout_num=config.TRAIN_MCTS_PLYAOUT_NUM, is_selfplay_mode=True, batch_neural_network=self.net_func.get_policy_value_batch_for_mcts)
 
     # Collect game data by self-play. Moreover, the game data generated would be leveraged for data augmentation.
     def collect_data(self):
         # data -> [([states1],[pi_list1],[z1]), ([states2],[pi_list2],[z2]),...]
         data = self.self_play(self.mcts_player)
-        one_game_data = copy.deepcopy(data)
-        # Data augmentation: transformation, mirror...
-        one_game_data = self.expand_data(one_game_data, self.board_size)
-        # data_cache[0/1/2/3], where the index represents a game data
-        self.data_cache.extend(one_game_data)
+        return self.add_game_data(data, self.game.get_move_sequence())
+
+    # Augment the data of a game and take them to cache, and log the game if its moves are given
+    def add_game_data(self, data, moves=None):
+        if self.shard_writer is not None and moves is not None:
+            self.shard_writer.add_game(moves, data)
+        if self.data_cache.augment:  # a random symmetry is applied when sampled
+            self.data_cache.extend(data)
+        else:  # Data augmentation: rotation, mirror...
+            self.data_cache.add(*self.expand_data(data))
         return len(data), len(self.data_cache)
 
-    # Adversarial evaluation between models
+    # Adversarial evaluation between models, where the result is 1=latest model 2=optimal model 3=draw
     def model_play(self, latest_obj1, good_obj2, round_num):
-        # Alternate side per 5 games
-        who_black, who_white = ['player1', 'player2'] if round_num % 2 == 0 else ['player2', 'player1']
-        self.game.initialize_board_info(who_black) # Init the board and game
-        # Pitting two models against each other
-        while True:
-            mcts_player = latest_obj1 if who_black == 'player1' else good_obj2  # Alternate
-            move_id = mcts_player.choose_move(self.game)  # Choose a real move based on MCTS that introduce neural network
-            self.game.move(move_id)  # Update board information
-            result_id = self.game.get_game_status()  # Check the game results (or status)
-            who_black = 'player2' if who_black == 'player1' else 'player1'
-            # We set the result like: 1=latest model 2=optimal model 3=draw
-            if result_id in (1, 2, 3):
-                return result_id
+        return play_game(self.game, latest_obj1, good_obj2, round_num)  # Alternate side per game
 
     # Self-play：to get a game data that consists of State list、Pi list and Z list.
     def self_play(self, mcts_player: MCTSPlayer):
         self.game.initialize_board_info()
+        mcts_player.rebuild_search_tree()  # the tree kept from the end of the previous game is of no use
         # S、Pi、Player_id
         states_list = []  # State list
         mcts_pi_list = []  # Pi list (the probabilities of selecting moves)
+        proven_status = None  # the result proven by the endgame solver at the first position it solved
         # Self-play
         while True:
             move_id, pi = mcts_player.choose_move(self.game)  # Choose a real move based on MCTS that introduce neural network
+            if proven_status is None and mcts_player.search_stats['stop'] == 'solved':
+                proven_status = get_proven_status(self.game, mcts_player.search_stats['score'])
             states_list.append(self.game.get_feature_planes())  # Assume the feature planes represent a state
             mcts_pi_list.append(pi)
             self.game.move(move_id)  # Update board information
             status = self.game.get_game_status()  # Check the game results (or status)
             # We set the result like: 1=player1, 2=player2 and 3=draw
             if status in (1, 2, 3):
+                # z is the result under perfect play from the first solved position, which the moves of the solver keep
+                status = proven_status if proven_status is not None else status
                 move_count = len(self.game.get_all_player_id_list())  # including pass (probably more than one)
                 z_list = np.zeros(move_count)
                 # if Draw, reward is 0
@@ -97,45 +108,24 @@ class TrainModel:
                 one_game_data = list(zip(states_list, mcts_pi_list, z_list))
                 return one_game_data
 
-    # Data augmentation
-    def expand_data(self, one_game_data, board_size):
-        # format: [(state, pi, z), ..., ...]
-        data_extension = []
-        # mcts_pi_len: size**2 vector
-        for one_state, mcts_pi, value_z in one_game_data:  # loop over (s, pi, z), where the data type are np.arr, np.arr and np.float64, respectively.
-            # （1）Flip 4 times
-            for i in range(1, 5):
-                origin_rot_state_planes = np.array([np.rot90(one_plane, k=i) for one_plane in one_state])
-                origin_rot_pi = np.rot90(np.flipud(np.reshape(mcts_pi, (board_size, board_size))), k=i)
-                origin_one_state_data = (
-                origin_rot_state_planes, np.flipud(origin_rot_pi).flatten(), value_z)
-                data_extension.append(origin_one_state_data)
-            # （2）Mirror
-            mirror_state_planes = np.array([np.fliplr(one_plane) for one_plane in one_state])
-            mirror_pi = np.fliplr(np.flipud(np.reshape(mcts_pi, (board_size, board_size))))  # inverse
-            for i in range(1, 5):
-                mirror_rot_state_planes = np.array([np.rot90(one_plane, k=i) for one_plane in mirror_state_planes])
-                mirror_rot_pi = np.rot90(mirror_pi, k=i)
-                mirror_one_state_data = (
-                mirror_rot_state_planes, np.flipud(mirror_rot_pi).flatten(), value_z)
-                data_extension.append(mirror_one_state_data)
-        return data_extension
+    # Data augmentation: the 8 symmetries of every state, computed for the whole game at once
+    @staticmethod
+    def expand_data(one_game_data):
+        # format: [(state, pi, z), ..., ...] -> states (8N,4,s,s), pi (8N,s*s) and z (8N), symmetry after symmetry
+        state_planes = np.stack([one_state for one_state, _, _ in one_game_data])
+        pi_list = np.stack([mcts_pi for _, mcts_pi, _ in one_game_data])
+        z_list = np.array([value_z for _, _, value_z in one_game_data])
+        return (np.concatenate([transform_planes(state_planes, symmetry) for symmetry in range(SYMMETRY_NUM)]),
+                np.concatenate([transform_pi(pi_list, symmetry) for symmetry in range(SYMMETRY_NUM)]),
+                np.tile(z_list, SYMMETRY_NUM))
 
     # Evaluation on model
     def model_evaluate(self, latest_path, good_path):
-        if config.TRAIN_WHICH_NET == 'resnet':
-            latest_resnet_func = resnet.NetFunction(self.board_size, model_path=latest_path)
-            good_resnet_func = resnet.NetFunction(self.board_size, model_path=good_path)
-            latest_mcts_player = MCTSPlayer(latest_resnet_func.get_policy_value_for_mcts, playout_num=config.EVAL_MCTS_PLAYOUT_NUM)
-            good_mcts_player = MCTSPlayer(good_resnet_func.get_policy_value_for_mcts, playout_num=config.EVAL_MCTS_PLAYOUT_NUM)
-        elif config.TRAIN_WHICH_NET == 'cnn':
-            latest_convnet_func = convnet.NetFunction(self.board_size, model_path=latest_path)
-            good_convnet_func = convnet.NetFunction(self.board_size, model_path=good_path)
-            latest_mcts_player = MCTSPlayer(latest_convnet_func.get_policy_value_for_mcts, playout_num=config.EVAL_MCTS_PLAYOUT_NUM)
-            good_mcts_player = MCTSPlayer(good_convnet_func.get_policy_value_for_mcts, playout_num=config.EVAL_MCTS_PLAYOUT_NUM)
-        else:
+        if config.TRAIN_WHICH_NET not in ('resnet', 'cnn'):
             print("Please specify a model for evaluation!")
             return
+        latest_mcts_player = create_model_player(latest_path)
+        good_mcts_player = create_model_player(good_path)
         # Count the winning rate...
         latest_model_win_count, latest_model_tie_count, latest_model_lose_count = 0, 0, 0
         # Set the number of game for evaluation
@@ -149,41 +139,153 @@ class TrainModel:
                 latest_model_tie_count += 1
         # Win for +1 and draw for +0.5
         latest_mcts_win_rate = 1.0 * (latest_model_win_count + 0.5 * latest_model_tie_count) / config.EVAL_NUM
-        print("Adversarial evaluation result of the latest model-->Win: {}, Lose: {}, Draw:{}, score:{}".format(latest_model_win_count, latest_model_lose_count, latest_model_tie_count, latest_mcts_win_rate))
+        elo, elo_lower, elo_upper = get_elo_interval(latest_model_win_count, latest_model_tie_count, latest_model_lose_count)
+        print("Adversarial evaluation result of the latest model-->Win: {}, Lose: {}, Draw:{}, score:{}, Elo:{:.0f} (95%: {:.0f} ~ {:.0f})".format(
+            latest_model_win_count, latest_model_lose_count, latest_model_tie_count, latest_mcts_win_rate, elo, elo_lower, elo_upper))
         return latest_mcts_win_rate
 
     # Start training
     def start_training(self):
-        for game_num in range(1, config.SELFPLAY_NUM):  # Set the number of the playout for choosing a real move (or an action)
-            # 1) With self-play, data are collected.
-            start_time = time.time()
-            episode_len, data_cache_len = self.collect_data()  # 1) Take self-play data and the data augmented to cache
-            end_time = time.time()
-            cost_time = end_time-start_time
-            print("Self-play_nums:{}, Total moves:{}, Size of data cache:{}, Took:{} seconds".format(game_num, episode_len, data_cache_len, cost_time))
-            # writer.add_scalar('steps_per_game', episode_len, game_num)  # tensorboard
-            # 2) Training
-            if len(self.data_cache) > config.DATASET_SIZE_UPPER_LIMIT:   # set a threshold of the data cache to specify when to train
-                aggregate_loss, mse_loss, cross_entropy_loss = self.net_func.training(self.data_cache)
-                print("Aggregate_loss:{}, " "mse_loss:{}, " "cross_entropy_loss:{}".format(aggregate_loss, mse_loss, cross_entropy_loss))
-                # writer.add_scalar('aggregate_loss', aggregate_loss, game_num)  # tensorboard
-                # writer.add_scalar('cross_entropy_loss', cross_entropy_loss, game_num)  # tensorboard
-            # Save the optimal model if it is None
-            if config.RUN_EVAL and os.path.exists(config.SAVE_GOOD_MODEL_PATH) is False:
-                self.net_func.save_model(config.SAVE_GOOD_MODEL_PATH)
-            # Save the latest model
-            if game_num % config.SAVE_MODEL_FRENQUENCY == 0:
+        try:
+            for game_num in range(self.game_num + 1, config.SELFPLAY_NUM):  # Set the number of the playout for choosing a real move (or an action)
+                # 1) With self-play, data are collected.
+                start_time = time.time()
+                episode_len, data_cache_len = self.collect_data()  # 1) Take self-play data and the data augmented to cache
+                self.game_num = game_num
+                end_time = time.time()
+                cost_time = end_time-start_time
+                print("Self-play_nums:{}, Total moves:{}, Size of data cache:{}, Took:{} seconds".format(game_num, episode_len, data_cache_len, cost_time))
+                if self.mcts_player.evaluation_cache is not None:
+                    print("Evaluation cache: {}".format(self.mcts_player.evaluation_cache.report()))
+                # writer.add_scalar('steps_per_game', episode_len, game_num)  # tensorboard
+                # 2) Training
+                if len(self.data_cache) > config.DATASET_SIZE_UPPER_LIMIT:   # set a threshold of the data cache to specify when to train
+                    aggregate_loss, mse_loss, cross_entropy_loss = self.net_func.training(self.data_cache)
+                    if self.mcts_player.evaluation_cache is not None:
+                        self.mcts_player.evaluation_cache.clear()  # the cached evaluations are out of date once the network is updated
+                    print("Aggregate_loss:{}, " "mse_loss:{}, " "cross_entropy_loss:{}, " "lr:{}, " "Samples/s:{:.0f}".format(
+                        aggregate_loss, mse_loss, cross_entropy_loss, self.net_func.trainer.history[-1]['lr'], self.net_func.trainer.history[-1]['samples_per_second']))
+                    # writer.add_scalar('aggregate_loss', aggregate_loss, game_num)  # tensorboard
+                    # writer.add_scalar('cross_entropy_loss', cross_entropy_loss, game_num)  # tensorboard
+                self.save_and_evaluate(game_num)
+        finally:
+            self.save_data()
+            self.stop_gating()
+
+    # Train on the self-play log in data_path only (see dataset.SelfPlayDataset), without playing, e.g., a new network
+    def train_offline(self, data_path, recent_game_num=None, round_num=config.OFFLINE_TRAIN_ROUND_NUM):
+        dataset = SelfPlayDataset(data_path, recent_game_num=recent_game_num, augment=True)
+        position_num = dataset.get_position_num()
+        if position_num < self.net_func.trainer.batch_size:
+            raise ValueError('{} holds {} positions, fewer than a batch of {}'.format(data_path, position_num, self.net_func.trainer.batch_size))
+        print(">>>Training offline on {} positions of {}".format(position_num, data_path))
+        for round_id in range(1, round_num + 1):
+            aggregate_loss, mse_loss, cross_entropy_loss = self.net_func.training(dataset)
+            print("Round:{}, Aggregate_loss:{}, " "mse_loss:{}, " "cross_entropy_loss:{}, " "lr:{}, " "Samples/s:{:.0f}".format(
+                round_id, aggregate_loss, mse_loss, cross_entropy_loss, self.net_func.trainer.history[-1]['lr'], self.net_func.trainer.history[-1]['samples_per_second']))
+            if round_id % config.SAVE_MODEL_FRENQUENCY == 0 or round_id == round_num:
                 self.net_func.save_model(config.SAVE_LATEST_MODEL_PATH)
-                print(">>>Latest model saved!")
-            # 3) Evaluate the latest model
-            if game_num % config.EVAL_MODEL_FRENQUENCY == 0 and config.RUN_EVAL and os.path.exists(config.SAVE_GOOD_MODEL_PATH):
-                print(">>>Start evaluating the latest model ...")
-                win_ratio = self.model_evaluate(latest_path=config.SAVE_LATEST_MODEL_PATH, good_path=config.SAVE_GOOD_MODEL_PATH)
-                if win_ratio >= config.EVAL_WIN_RATE_THRESHOLD:
-                    self.net_func.save_model(config.SAVE_GOOD_MODEL_PATH)  # replacing the optimal one
-                    print(">>>The latest model is better than the optimal model. Updated!")
-                else:
-                    print(">>The latest model is worse than the optimal model. Replacement is canceled.")
+        print(">>>The model trained offline is saved to {}".format(config.SAVE_LATEST_MODEL_PATH))
+
+    # Save the latest model, and evaluate it against the optimal one from time to time
+    def save_and_evaluate(self, game_num):
+        # Save the optimal model if it is None
+        if config.RUN_EVAL and os.path.exists(config.SAVE_GOOD_MODEL_PATH) is False:
+            self.net_func.save_model(config.SAVE_GOOD_MODEL_PATH)
+        # Save the latest model
+        if game_num % config.SAVE_MODEL_FRENQUENCY == 0:
+            self.net_func.save_model(config.SAVE_LATEST_MODEL_PATH)
+            self.data_cache.flush()  # the replay buffer on disk matches the latest model
+            print(">>>Latest model saved!")
+        # Keep the latest model as a numbered generation for later tournaments (see tournament.py)
+        if config.GENERATION_FREQUENCY and game_num % config.GENERATION_FREQUENCY == 0:
+            print(">>>Generation saved to {}".format(save_generation(self.net_func, game_num)))
+        # 3) Evaluate the latest model, in the background (gating match) or right now
+        if self.gating_match is not None and self.gating_match.is_over():
+            self.finish_gating(game_num)
+        if game_num % config.EVAL_MODEL_FRENQUENCY == 0 and config.RUN_EVAL and os.path.exists(config.SAVE_GOOD_MODEL_PATH) and config.GATING_IN_BACKGROUND:
+            if self.gating_match is None:
+                print(">>>Start evaluating the latest model in the background ...")
+                self.gating_match = GatingMatch(config.SAVE_LATEST_MODEL_PATH, config.SAVE_GOOD_MODEL_PATH)
+            else:
+                print(">>>The previous evaluation is still running, the latest model is not evaluated")
+        elif game_num % config.EVAL_MODEL_FRENQUENCY == 0 and config.RUN_EVAL and os.path.exists(config.SAVE_GOOD_MODEL_PATH):
+            print(">>>Start evaluating the latest model ...")
+            win_ratio = self.model_evaluate(latest_path=config.SAVE_LATEST_MODEL_PATH, good_path=config.SAVE_GOOD_MODEL_PATH)
+            self.evaluation_history.append((game_num, win_ratio, win_ratio >= config.EVAL_WIN_RATE_THRESHOLD))
+            if win_ratio >= config.EVAL_WIN_RATE_THRESHOLD:
+                self.net_func.save_model(config.SAVE_GOOD_MODEL_PATH)  # replacing the optimal one
+                print(">>>The latest model is better than the optimal model. Updated!")
+            else:
+                print(">>The latest model is worse than the optimal model. Replacement is canceled.")
+        # 4) Checkpoint the whole training state
+        if config.CHECKPOINT_FREQUENCY and game_num % config.CHECKPOINT_FREQUENCY == 0:
+            print(">>>Checkpoint saved to {}".format(save_checkpoint(self)))
+
+    # Promote the candidate of the gating match which is over if it passed
+    def finish_gating(self, game_num):
+        report = self.gating_match.report()
+        print(">>>Evaluation of the latest model: {}".format(report))
+        promoted = report['decision'] == 'accept'
+        if promoted:
+            self.gating_match.promote(config.SAVE_GOOD_MODEL_PATH)  # replacing the optimal one
+            print(">>>The latest model is better than the optimal model. Updated!")
+        else:
+            print(">>The latest model is not better than the optimal model. Replacement is canceled.")
+        self.evaluation_history.append((game_num, report['score'], promoted))
+        self.gating_match.close()
+        self.gating_match = None
+
+    # Stop the evaluation running in the background, if any
+    def stop_gating(self):
+        if self.gating_match is not None:
+            self.gating_match.close()
+            self.gating_match = None
+
+    # Start training with self-play running in worker processes
+    def start_parallel_training(self):
+        """
+        SELFPLAY_WORKER_NUM processes play games with their own copies of the latest weights and stream them back,
+        while this process (the learner) keeps training on the data cache. The learner pushes its weights to the
+        workers every WEIGHTS_PUSH_FREQUENCY training steps, and never trains more than TRAIN_STEPS_PER_GAME steps
+        per game received.
+        """
+        pool = SelfPlayPool(config.SELFPLAY_WORKER_NUM)
+        pool.start(self.net_func.get_state_dict())
+        game_num, train_step = self.game_num, len(self.net_func.trainer.history)
+        start_game_num, start_time = game_num, time.time()
+        try:
+            while game_num < config.SELFPLAY_NUM - 1:
+                can_train = len(self.data_cache) > config.DATASET_SIZE_UPPER_LIMIT and train_step < game_num * config.TRAIN_STEPS_PER_GAME
+                # 1) Take the games streamed back by the workers, waiting for one only if there is nothing to train on
+                for worker_id, weights_version, data, moves in pool.get_games(block=not can_train):
+                    game_num += 1
+                    self.game_num = game_num
+                    episode_len, data_cache_len = self.add_game_data(data, moves)
+                    games_per_hour = (game_num - start_game_num) / (time.time() - start_time) * 3600
+                    print("Self-play_nums:{}, Worker:{}, Weights version:{}, Total moves:{}, Size of data cache:{}, Games per hour:{:.1f}".format(
+                        game_num, worker_id, weights_version, episode_len, data_cache_len, games_per_hour))
+                    self.save_and_evaluate(game_num)
+                # 2) Training
+                if len(self.data_cache) > config.DATASET_SIZE_UPPER_LIMIT and train_step < game_num * config.TRAIN_STEPS_PER_GAME:
+                    aggregate_loss, mse_loss, cross_entropy_loss = self.net_func.training(self.data_cache)
+                    train_step += 1
+                    print("Training step:{}, Aggregate_loss:{}, " "mse_loss:{}, " "cross_entropy_loss:{}, " "lr:{}, " "Samples/s:{:.0f}".format(
+                        train_step, aggregate_loss, mse_loss, cross_entropy_loss, self.net_func.trainer.history[-1]['lr'], self.net_func.trainer.history[-1]['samples_per_second']))
+                    if train_step % config.WEIGHTS_PUSH_FREQUENCY == 0:
+                        pool.push_weights(self.net_func.get_state_dict())
+                        if pool.inference_server is not None:
+                            print("Inference server: {}".format(pool.inference_server.get_stats()))
+        finally:
+            pool.stop()
+            self.save_data()
+            self.stop_gating()
+
+    # Write the replay buffer and the games not logged yet to disk
+    def save_data(self):
+        self.data_cache.flush()
+        if self.shard_writer is not None:
+            self.shard_writer.flush()
 
     def models_battle(self):
         if config.RUN_EVAL and os.path.exists(
@@ -200,6 +302,29 @@ class TrainModel:
 
 # Start training
 if __name__ == '__main__':
-    training_process = TrainModel(size=config.TRAIN_BOARD_SIZE, model_path=config.EXISTING_MODEL_PATH, net_type=config.TRAIN_WHICH_NET)
-    training_process.start_training()
+    parser = argparse.ArgumentParser(description='Train the Othello agent by self-play')
+    parser.add_argument('--resume', nargs='?', const='latest', default=None, metavar='CHECKPOINT',
+                        help='resume from a checkpoint, or from the latest one in CHECKPOINT_DIR if none is given')
+    parser.add_argument('--offline', nargs='?', const=config.SELFPLAY_DATA_PATH, default=False, metavar='DATA_PATH',
+                        help='only train on a self-play log, SELFPLAY_DATA_PATH if none is given, and save the model')
+    parser.add_argument('--recent', type=int, default=None, metavar='N', help='with --offline, train on the N most recent games only')
+    parser.add_argument('--rounds', type=int, default=config.OFFLINE_TRAIN_ROUND_NUM, help='with --offline, the number of training rounds')
+    args = parser.parse_args()
+    if args.offline is None:
+        parser.error('--offline needs the path of a self-play log when SELFPLAY_DATA_PATH is not set')
+    if args.offline:
+        TrainModel(size=config.TRAIN_BOARD_SIZE, model_path=config.EXISTING_MODEL_PATH, net_type=config.TRAIN_WHICH_NET).train_offline(
+            args.offline, args.recent, args.rounds)
+    else:
+        training_process = TrainModel(size=config.TRAIN_BOARD_SIZE, model_path=config.EXISTING_MODEL_PATH, net_type=config.TRAIN_WHICH_NET, buffer_path=config.REPLAY_BUFFER_PATH, data_path=config.SELFPLAY_DATA_PATH)
+        if args.resume:
+            checkpoint_path = get_latest_checkpoint_path() if args.resume == 'latest' else args.resume
+            if checkpoint_path is None:
+                print("No checkpoint found in {}, training from the start".format(config.CHECKPOINT_DIR))
+            else:
+                load_checkpoint(training_process, checkpoint_path)
+        if config.SELFPLAY_WORKER_NUM > 0:
+            training_process.start_parallel_training()
+        else:
+            training_process.start_training()
     # training_process.models_battle()
\ No newline at end of file